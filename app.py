@@ -1,7 +1,10 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, filedialog, messagebox
 
-from .db import init_db, reset_db
+from .db import check_driver_history, init_db, rebuild_driver_history, reset_db
+from .ingest_cache import clear_cache
+from .prediction_store import PredictionStore
+from .score_index import ScoreIndex
 from .ui_batch import BatchFrame
 from .ui_realtime import RealtimeFrame
 from .ui_history import HistoryFrame
@@ -22,6 +25,18 @@ class App(tk.Tk):
         self.driver_df = None
         self.safety_df = None
         self.preds = None
+        # sorted scores of self.preds, for threshold sliders (see score_index)
+        self.score_index = None
+        # bookingID index + type-ahead over self.preds, for the Single Trip tab (see prediction_store)
+        self.pred_store = None
+        # scorers.SCORERS name of the model that produced self.preds
+        self.preds_scorer = None
+        # model_utils backend of that scorer (contributions are cached under its runtime version)
+        self.preds_backend = "model"
+
+        # instrument.Recorder of the last batch run + opt-in profiling of the next one
+        self.last_trace = None
+        self.profile_next_run = tk.BooleanVar(value=False)
 
         self._style()
         self._build()
@@ -62,6 +77,12 @@ class App(tk.Tk):
         tools.add_command(label="Refresh History", command=self.refresh_history)
         tools.add_separator()
         tools.add_command(label="Reset DB (clear history)", command=self._reset_db_prompt)
+        tools.add_command(label="Clear ingest cache", command=self._clear_cache_prompt)
+        tools.add_command(label="Check driver history", command=self._check_history)
+        tools.add_command(label="Rebuild driver history", command=self._rebuild_history_prompt)
+        tools.add_separator()
+        tools.add_command(label="Export last batch trace…", command=self._export_trace)
+        tools.add_checkbutton(label="Profile next batch run (cProfile + tracemalloc)", variable=self.profile_next_run)
         menubar.add_cascade(label="Tools", menu=tools)
         self.config(menu=menubar)
 
@@ -81,15 +102,33 @@ class App(tk.Tk):
         self.status = ttk.Label(root, text="Ready.", style="Hint.TLabel")
         self.status.pack(anchor="w", pady=(10, 0))
 
-    def set_shared_data(self, sensor_df, driver_df, safety_df, preds):
+    def set_shared_data(self, sensor_df, driver_df, safety_df, preds, scorer="xgboost", backend="model"):
         self.sensor_df = sensor_df
         self.driver_df = driver_df
         self.safety_df = safety_df
         self.preds = preds
+        self.preds_scorer = scorer
+        self.preds_backend = backend
+        self.score_index = ScoreIndex.from_predictions(preds)
+        self.pred_store = PredictionStore(preds)
 
         self.status.config(text=f"Loaded predictions for {len(preds)} trips. Single Trip tab is ready.")
         self.push_to_single()
 
+    def threshold_summary(self, threshold):
+        """
+        one-line summary of the loaded batch at threshold (None before the first batch)
+        """
+        if self.score_index is None:
+            return None
+        s = self.score_index.summary(threshold)
+        text = (f"at {threshold:.2f}: {s['dangerous']:,}/{s['trips']:,} trips dangerous ({s['dangerous_rate']:.1%}), "
+                f"{s['drivers_flagged']:,}/{s['drivers']:,} drivers flagged")
+        m = s["metrics"]
+        if m is not None:
+            text += f" | precision {m['precision']:.2f}  recall {m['recall']:.2f}  F1 {m['f1']:.2f}"
+        return text
+
     def push_to_single(self):
         self.single_tab.refresh_booking_list()
 
@@ -108,6 +147,52 @@ class App(tk.Tk):
         self.refresh_history()
         self.status.config(text="History cleared.")
 
+    def _check_history(self):
+        result = check_driver_history(limit=10)
+        if not result["mismatch_count"]:
+            messagebox.showinfo("Driver history", f"driver_history is consistent ({result['drivers_checked']:,} drivers).")
+            return
+        lines = [
+            ("" if did is None else f"driver {did} ") + f"{col}: stored={stored} expected={expected}"
+            for did, col, stored, expected in result["mismatches"]
+        ]
+        if messagebox.askyesno(
+            "Driver history",
+            f"{result['mismatch_count']:,} mismatch(es) found:\n" + "\n".join(lines) + "\n\nRebuild from stored predictions now?",
+        ):
+            self._rebuild_history()
+
+    def _rebuild_history_prompt(self):
+        ok = messagebox.askyesno("Rebuild driver history", "Recompute every driver's history from the stored predictions?")
+        if ok:
+            self._rebuild_history()
+
+    def _rebuild_history(self):
+        drivers = rebuild_driver_history()
+        self.refresh_history()
+        self.status.config(text=f"Driver history rebuilt ({drivers:,} drivers).")
+
+    def _clear_cache_prompt(self):
+        ok = messagebox.askyesno("Clear ingest cache", "Delete all cached CSV conversions? The next batch run will re-parse the files.")
+        if not ok:
+            return
+        freed = clear_cache()
+        self.status.config(text=f"Ingest cache cleared ({freed / 1e6:.1f} MB freed).")
+
+    def _export_trace(self):
+        if self.last_trace is None:
+            messagebox.showwarning("No trace", "Run Batch Prediction first.")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.trace.json"), ("JSON report", "*.json")],
+            initialfile="batch.trace.json",
+            title="Export batch trace",
+        )
+        if path:
+            self.last_trace.export(path)
+            self.status.config(text=f"Trace written to {path}.")
+
 
 def main():
     App().mainloop()
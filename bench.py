@@ -0,0 +1,332 @@
+"""
+benchmark suite: feature engineering (time + peak memory), model inference (+ the sequence scorer when a
+model is trained), history writes and history queries at several scales, on deterministic synthetic trips
+
+usage: python -m gobest.bench [--trips 1000 5000 20000] [--repeat 3] [--out bench.json]
+                              [--baseline bench_baseline.json] [--tolerance 0.2] [--save-baseline]
+
+results are written as json; with --baseline every stage is compared against the stored run
+and the exit code is 1 when a stage got slower than tolerance allows
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import db, model_utils, sequence_model
+from .feature_engineer import THRESH, SensorTable, _prepare_safety, engineer_features_from_raw_tables
+
+LENGTH_DISTS = ("lognormal", "uniform", "fixed")
+
+# differences below this many seconds are never reported as regressions (timer noise)
+MIN_REGRESSION_SEC = 0.005
+
+
+# ============================================================
+# synthetic trips
+# ============================================================
+
+def _segmented_cumsum(x: np.ndarray, starts: np.ndarray, lens: np.ndarray) -> np.ndarray:
+    c = np.cumsum(x)
+    before = np.concatenate(([0.0], c[starts[1:] - 1])) if len(starts) else c[:0]
+    return c - np.repeat(before, lens)
+
+
+def _trip_lengths(rng, n_trips, mean_len, dist):
+    if dist == "fixed":
+        return np.full(n_trips, int(mean_len), dtype=np.int64)
+    if dist == "uniform":
+        return rng.integers(1, 2 * int(mean_len), size=n_trips)
+    # long right tail like real trips
+    sigma = 0.6
+    lens = rng.lognormal(np.log(mean_len) - sigma ** 2 / 2, sigma, size=n_trips)
+    return np.clip(np.round(lens), 1, 20 * mean_len).astype(np.int64)
+
+
+def synthetic_sensor_tables(n_trips, mean_len=300, length_dist="lognormal", seed=0, shuffle=True):
+    """
+    (sensor_df, driver_df, safety_df) shaped like the raw csv files
+
+    signals follow the THRESH semantics: speed is a per-trip random walk that occasionally exceeds
+    the speeding limit, acceleration_x follows the speed changes with harsh accel / brake spikes,
+    gyro_z has sharp-turn bursts, accuracy has bad-gps stretches, seconds have occasional gaps
+    """
+    rng = np.random.default_rng(seed)
+    lens = _trip_lengths(rng, n_trips, mean_len, length_dist)
+    starts = np.concatenate(([0], np.cumsum(lens)[:-1])).astype(np.int64)
+    n = int(lens.sum())
+    first = np.zeros(n, dtype=bool)
+    first[starts] = True
+
+    booking_ids = rng.choice(np.int64(10) ** 12, size=n_trips, replace=False)
+    bid = np.repeat(booking_ids, lens)
+
+    gaps = 1.0 + (rng.random(n) < 0.01) * rng.integers(1, 30, size=n)
+    gaps[first] = 0.0
+    second = _segmented_cumsum(gaps, starts, lens)
+
+    base = np.repeat(rng.uniform(5.0, 25.0, size=n_trips), lens)
+    walk = _segmented_cumsum(np.where(first, 0.0, rng.normal(0.0, 0.8, size=n)), starts, lens)
+    speed = np.clip(base + walk, 0.0, THRESH["speeding"] + 12.0)
+
+    dv = np.diff(speed, prepend=speed[0])
+    dv[first] = 0.0
+    spikes = (rng.random(n) < 0.01) * rng.choice([-1.0, 1.0], size=n) * rng.uniform(5.0, 9.0, size=n)
+    acceleration_x = dv + rng.normal(0.0, 0.8, size=n) + spikes
+    acceleration_y = rng.normal(0.0, 1.0, size=n)
+    acceleration_z = 9.81 + rng.normal(0.0, 0.5, size=n)
+
+    turns = (rng.random(n) < 0.02) * rng.choice([-1.0, 1.0], size=n) * rng.uniform(1.5, 3.0, size=n)
+    gyro_x = rng.normal(0.0, 0.1, size=n)
+    gyro_y = rng.normal(0.0, 0.1, size=n)
+    gyro_z = rng.normal(0.0, 0.2, size=n) + turns
+    bearing = np.mod(np.degrees(_segmented_cumsum(gyro_z, starts, lens)), 360.0)
+
+    accuracy = 3.0 + rng.exponential(5.0, size=n)
+    bad_gps = rng.random(n) < 0.02
+    accuracy[bad_gps] = rng.uniform(THRESH["gps_bad"], 100.0, size=int(bad_gps.sum()))
+
+    sensor_df = pd.DataFrame({
+        "bookingID": bid,
+        "accuracy": accuracy,
+        "bearing": bearing,
+        "acceleration_x": acceleration_x,
+        "acceleration_y": acceleration_y,
+        "acceleration_z": acceleration_z,
+        "gyro_x": gyro_x,
+        "gyro_y": gyro_y,
+        "gyro_z": gyro_z,
+        "second": second,
+        "speed": speed,
+    })
+    if shuffle:
+        # the raw csv is not grouped by trip
+        sensor_df = sensor_df.iloc[rng.permutation(n)].reset_index(drop=True)
+
+    n_drivers = max(1, n_trips // 20)
+    driver_df = pd.DataFrame({"id": np.arange(n_drivers), "driver_name": [f"driver_{i}" for i in range(n_drivers)]})
+    safety_df = pd.DataFrame({
+        "bookingID": booking_ids,
+        "driver_id": rng.integers(0, n_drivers, size=n_trips),
+        "label": (rng.random(n_trips) < 0.25).astype(int),
+    })
+    return sensor_df, driver_df, safety_df
+
+
+# ============================================================
+# harness
+# ============================================================
+
+def _time(fn, repeat, setup=None):
+    """
+    seconds of every run; setup() (untimed) runs before each one and its result is passed to fn
+    """
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        t0 = time.perf_counter()
+        fn(arg) if setup is not None else fn()
+        runs.append(time.perf_counter() - t0)
+    return runs
+
+
+def _peak_alloc(fn):
+    """
+    (result, peak bytes allocated while fn ran); numpy buffers are traced too, and unlike rss
+    the number doesn't depend on what the allocator kept from earlier runs
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        out = fn()
+        return out, tracemalloc.get_traced_memory()[1] - base
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def _record(results, scale, stage, runs, rows):
+    sec = statistics.median(runs)
+    results.append({
+        "trips": scale,
+        "stage": stage,
+        "seconds": sec,
+        "min_seconds": min(runs),
+        "runs": len(runs),
+        "rows": rows,
+        "rows_per_sec": rows / sec if sec > 0 else None,
+    })
+    print(f"{scale:>8,} trips | {stage:<24} {sec:>9.4f}s  ({rows / sec if sec > 0 else 0:>12,.0f} rows/s)", flush=True)
+
+
+def _fresh_db(tmp: Path, name: str):
+    db.close_connections()
+    db.DB_PATH = tmp / name
+    db.init_db()
+
+
+def _predictions(engineered, have_model, seed):
+    if have_model:
+        return model_utils.score_features(engineered)
+
+    # no model artifacts: random scores still exercise the write / query paths
+    rng = np.random.default_rng(seed)
+    preds = engineered.copy()
+    preds["pred_proba"] = rng.random(len(preds))
+    preds["pred_label"] = (preds["pred_proba"] >= 0.5).astype(int)
+    return preds
+
+
+def run(scales, repeat=3, mean_len=300, length_dist="lognormal", seed=0):
+    results = []
+    have_model = model_utils.MODEL_PATH.exists() and model_utils.FEATURE_COLS_PATH.exists()
+    if not have_model:
+        print(f"no model artifacts in {model_utils.MODELS_DIR}: inference stages are skipped", flush=True)
+    # raw readings -> probabilities with the sequence scorer, comparable with features + inference_warm
+    have_sequence = sequence_model.SEQUENCE_MODEL_PATH.exists()
+    seq = sequence_model.SequenceModel.load() if have_sequence else None
+
+    old_path = db.DB_PATH
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            for n_trips in scales:
+                sensor_df, driver_df, safety_df = synthetic_sensor_tables(n_trips, mean_len, length_dist, seed)
+                n_rows = len(sensor_df)
+
+                runs = _time(lambda: engineer_features_from_raw_tables(sensor_df, driver_df, safety_df), repeat)
+                _record(results, n_trips, "features", runs, n_rows)
+
+                # one more (untimed) run for the peak working memory on top of the input tables
+                engineered, peak = _peak_alloc(lambda: engineer_features_from_raw_tables(sensor_df, driver_df, safety_df))
+                results[-1]["peak_alloc_mb"] = peak / 1e6
+                print(f"{n_trips:>8,} trips | {'features peak memory':<24} {peak / 1e6:>8,.0f} MB "
+                      f"(input {sensor_df.memory_usage().sum() / 1e6:,.0f} MB)", flush=True)
+                if have_sequence:
+                    safety = _prepare_safety(safety_df)
+                    _record(results, n_trips, "sequence_inference",
+                            _time(lambda: seq.predict_proba(SensorTable.from_frame(sensor_df, safety)), repeat), n_rows)
+                del sensor_df
+
+                if have_model:
+                    def cold():
+                        model_utils.reset_runtime()
+                        model_utils.score_features(engineered)
+                    _record(results, n_trips, "inference_cold", _time(cold, repeat), n_trips)
+                    _record(results, n_trips, "inference_warm",
+                            _time(lambda: model_utils.score_features(engineered), repeat), n_trips)
+                preds = _predictions(engineered, have_model, seed)
+
+                counter = iter(range(10 ** 9))
+
+                def empty_db():
+                    _fresh_db(tmp, f"bench_{n_trips}_{next(counter)}.db")
+
+                _record(results, n_trips, "save_predictions",
+                        _time(lambda _: db.save_predictions(preds, 0.5), repeat, setup=empty_db), n_trips)
+                # predictions + keyed driver_history deltas in one transaction, into an empty history
+                _record(results, n_trips, "save_batch",
+                        _time(lambda _: db.save_batch(preds, 0.5), repeat, setup=empty_db), n_trips)
+
+                # queries against a history holding this batch
+                empty_db()
+                db.save_batch(preds, 0.5)
+                # same batch again: every trip is already stored unchanged, nothing is written
+                _record(results, n_trips, "save_batch_rescore",
+                        _time(lambda: db.save_batch(preds, 0.5), repeat), n_trips)
+                drivers = preds["driver_id"].drop_duplicates().to_numpy()[:100]
+                _record(results, n_trips, "query_db_stats", _time(db.fetch_db_stats, repeat), 1)
+                _record(results, n_trips, "query_recent_predictions",
+                        _time(lambda: db.fetch_recent_predictions(200), repeat), 200)
+                _record(results, n_trips, "query_top_drivers", _time(lambda: db.fetch_top_drivers(50), repeat), 50)
+                _record(results, n_trips, "query_driver_history",
+                        _time(lambda: [db.fetch_driver_history(int(d)) for d in drivers], repeat), len(drivers))
+    finally:
+        db.close_connections()
+        db.DB_PATH = old_path
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "mean_trip_len": mean_len,
+            "length_dist": length_dist,
+            "seed": seed,
+            "model": have_model,
+            "sequence_model": have_sequence,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance=0.2) -> list:
+    """
+    stages slower than baseline * (1 + tolerance); returns [(trips, stage, baseline_sec, current_sec)]
+    """
+    base = {(r["trips"], r["stage"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'trips':>8} {'stage':<24} {'baseline':>10} {'current':>10} {'change':>8}")
+    for r in current["results"]:
+        key = (r["trips"], r["stage"])
+        if key not in base:
+            continue
+        before, now = base[key], r["seconds"]
+        change = now / before - 1.0 if before > 0 else 0.0
+        slower = change > tolerance and now - before > MIN_REGRESSION_SEC
+        flag = "  REGRESSION" if slower else ""
+        print(f"{key[0]:>8,} {key[1]:<24} {before:>9.4f}s {now:>9.4f}s {change:>+7.0%}{flag}")
+        if slower:
+            regressions.append((key[0], key[1], before, now))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="benchmark features, inference, history writes and queries")
+    ap.add_argument("--trips", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--mean-len", type=int, default=300, help="mean readings per trip")
+    ap.add_argument("--length-dist", choices=LENGTH_DISTS, default="lognormal")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="bench.json", help="json results of this run")
+    ap.add_argument("--baseline", help="json from an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage is a regression")
+    ap.add_argument("--save-baseline", action="store_true", help="also write this run to --baseline")
+    args = ap.parse_args(argv)
+
+    report = run(args.trips, repeat=args.repeat, mean_len=args.mean_len, length_dist=args.length_dist, seed=args.seed)
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nresults written to {args.out}")
+
+    if not args.baseline:
+        return 0
+    baseline_path = Path(args.baseline)
+    if args.save_baseline or not baseline_path.exists():
+        baseline_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"baseline written to {baseline_path}")
+        return 0
+
+    regressions = compare(report, json.loads(baseline_path.read_text(encoding="utf-8")), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+persistence benchmark: rows/sec of the batch write path, legacy vs current
+
+usage: python -m gobest.bench_db [--sizes 10000 100000 1000000] [--skip-legacy-above 200000]
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import db
+
+
+def synthetic_predictions(n, n_drivers=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_drivers = n_drivers or max(1, n // 20)
+    proba = rng.random(n)
+    return pd.DataFrame({
+        "bookingID": np.arange(n, dtype=np.int64),
+        "driver_id": rng.integers(0, n_drivers, size=n),
+        "pred_proba": proba,
+        "pred_label": (proba >= 0.5).astype(int),
+        "harsh_acceleration_count": rng.poisson(2.0, size=n),
+    })
+
+
+def _legacy_write(preds_df, threshold):
+    """
+    the original write path: default journaling, one execute per trip and per driver
+    """
+    now = datetime.utcnow().isoformat()
+
+    with sqlite3.connect(db.DB_PATH) as conn:
+        cur = conn.cursor()
+        for _, r in preds_df.iterrows():
+            cur.execute("""
+            INSERT INTO trip_predictions
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                int(r["bookingID"]),
+                int(r["driver_id"]),
+                float(r["pred_proba"]),
+                int(r["pred_label"]),
+                float(threshold),
+                now,
+            ))
+        conn.commit()
+
+    with sqlite3.connect(db.DB_PATH) as conn:
+        cur = conn.cursor()
+        for driver_id, g in preds_df.groupby("driver_id"):
+            total = int(len(g))
+            dangerous = int((g["pred_label"] == 1).sum())
+            rate = dangerous / total if total else 0.0
+            avg_harsh = float(g["harsh_acceleration_count"].mean())
+            cur.execute("""
+            INSERT INTO driver_history
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(driver_id) DO UPDATE SET
+                total_trips = total_trips + excluded.total_trips,
+                dangerous_trips = dangerous_trips + excluded.dangerous_trips,
+                dangerous_rate =
+                    CAST(dangerous_trips + excluded.dangerous_trips AS REAL) /
+                    CAST(total_trips + excluded.total_trips AS REAL),
+                avg_harsh_accel = excluded.avg_harsh_accel,
+                last_updated = excluded.last_updated
+            """, (int(driver_id), total, dangerous, float(rate), avg_harsh, now))
+        conn.commit()
+
+
+def _time_write(write_fn, preds_df, legacy):
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = db.DB_PATH
+        db.DB_PATH = Path(tmp) / "bench.db"
+        try:
+            if legacy:
+                # pre-WAL schema with default (rollback journal) settings
+                with sqlite3.connect(db.DB_PATH) as conn:
+                    conn.execute("CREATE TABLE driver_history (driver_id INTEGER PRIMARY KEY, total_trips INTEGER, "
+                                 "dangerous_trips INTEGER, dangerous_rate REAL, avg_harsh_accel REAL, last_updated TEXT)")
+                    conn.execute("CREATE TABLE trip_predictions (bookingID INTEGER, driver_id INTEGER, pred_proba REAL, "
+                                 "pred_label INTEGER, threshold REAL, created_at TEXT)")
+            else:
+                db.init_db()
+
+            t0 = time.perf_counter()
+            write_fn(preds_df, 0.5)
+            return time.perf_counter() - t0
+        finally:
+            db.close_connections()
+            db.DB_PATH = old_path
+
+
+def run(sizes, skip_legacy_above):
+    results = []
+    for n in sizes:
+        preds = synthetic_predictions(n)
+        row = {"rows": n}
+
+        if n <= skip_legacy_above:
+            sec = _time_write(_legacy_write, preds, legacy=True)
+            row["legacy_rows_per_sec"] = n / sec
+
+        sec = _time_write(db.save_batch, preds, legacy=False)
+        row["bulk_rows_per_sec"] = n / sec
+
+        results.append(row)
+        legacy = f"{row['legacy_rows_per_sec']:>12,.0f}" if "legacy_rows_per_sec" in row else f"{'skipped':>12}"
+        print(f"{n:>9,} rows | legacy {legacy} rows/s | bulk {row['bulk_rows_per_sec']:>12,.0f} rows/s")
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="benchmark the prediction persistence path")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--skip-legacy-above", type=int, default=10 ** 9,
+                    help="don't time the row-by-row path above this many rows")
+    args = ap.parse_args(argv)
+    run(args.sizes, args.skip_legacy_above)
+
+
+if __name__ == "__main__":
+    main()
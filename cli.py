@@ -0,0 +1,344 @@
+"""
+headless batch scoring, same pipeline as the Batch Prediction tab (no tkinter import)
+
+usage: python -m gobest score --sensor sensor_data.csv --driver driver_data.csv --safety safety_labels.csv
+                              [--threshold 0.5] [--out preds.parquet] [--format csv|parquet]
+                              [--workers N] [--chunksize ROWS] [--scorer xgboost|sequence] [--backend model|numpy]
+                              [--sequence-model MODEL.joblib]
+                              [--presorted] [--no-cache] [--no-store] [--no-history] [--explain]
+                              [--trace run.json|run.trace.json] [--profile DIR]
+       python -m gobest serve [--host 127.0.0.1] [--port 8765] [--batch-ms 200] [--idle-timeout 60]
+       python -m gobest send --sensor sensor_data.csv [--safety safety_labels.csv] [--rate 0] [--port 8765]
+       python -m gobest history check|rebuild|runs
+       python -m gobest sequences build --sensor sensor_data.csv --safety safety_labels.csv [--store DIR] [--presorted]
+       python -m gobest sequences info [--store DIR]
+       python -m gobest sequences train --safety safety_labels.csv [--store DIR] [--out MODEL.joblib] [--seed 0]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+
+from . import instrument
+from .db import check_driver_history, fetch_runs, init_db, rebuild_driver_history
+from .feature_engineer import DEFAULT_CHUNKSIZE
+from .ingest_cache import load_table
+from .model_utils import BACKENDS
+from .pipeline import STAGES, run_batch
+from .schema import SchemaError
+from .scorers import SCORERS
+from .sequence_model import SEQUENCE_MODEL_PATH, train_sequence_model
+from .sequence_store import SEQUENCE_DIR, SequenceStore, build_sequence_store
+from . import stream_server
+
+OUTPUT_FORMATS = ("csv", "parquet")
+
+
+def _output_format(out_path, fmt):
+    if fmt:
+        return fmt
+    return "parquet" if Path(out_path).suffix.lower() in (".parquet", ".pq") else "csv"
+
+
+def _write_output(preds, out_path, fmt):
+    if fmt == "parquet":
+        try:
+            preds.to_parquet(out_path, index=False)
+        except ImportError as e:
+            raise SystemExit(f"parquet output needs pyarrow or fastparquet ({e}); use --format csv") from e
+    else:
+        preds.to_csv(out_path, index=False)
+
+
+class _StderrProgress:
+    """
+    one status line per stage change / ~1s during feature engineering
+    """
+
+    def __init__(self, every=1.0):
+        self.every = every
+        self._stage = None
+        self._last = 0.0
+
+    def __call__(self, ev):
+        now = time.perf_counter()
+        if ev["stage"] == self._stage and (ev["stage"] != "features" or now - self._last < self.every):
+            return
+        self._stage = ev["stage"]
+        self._last = now
+
+        line = f"[{ev['stage']}]"
+        if ev["stage"] == "features" and ev["trips"]:
+            rate = ev["trips"] / ev["elapsed"] if ev["elapsed"] > 0 else 0.0
+            line += f" {ev['trips']:,} trips ({rate:,.0f} trips/s)"
+            if ev["fraction"] is not None:
+                line += f" {100 * ev['fraction']:.0f}%"
+        print(line, file=sys.stderr, flush=True)
+
+
+def _print_summary(result, wall, out_path):
+    preds = result["preds"]
+    trips = result["trips"]
+    pos = int((preds["pred_label"] == 1).sum()) if trips else 0
+
+    rows = [("trips scored", f"{trips:,}"), ("predicted dangerous", f"{pos:,}")]
+    seen = result["store_hits"] + result["store_misses"]
+    if seen:
+        rows.append(("features reused", f"{result['store_hits']:,}/{seen:,}"))
+    history = result.get("history")
+    if history is not None:
+        rows.append(("history", f"{history['inserted']:,} new, {history['updated']:,} updated, "
+                                f"{history['unchanged']:,} unchanged (run {history['run_id']})"))
+    if result.get("explained"):
+        rows.append(("trips explained", f"{result['explained']:,}"))
+    for stage in STAGES:
+        if stage in result["timings"]:
+            rows.append((f"  {stage}", f"{result['timings'][stage]:.2f}s"))
+    rows.append(("total", f"{wall:.2f}s ({trips / wall if wall > 0 else 0.0:,.0f} trips/s)"))
+    if out_path:
+        rows.append(("output", str(out_path)))
+
+    for label, value in rows:
+        print(f"{label + ':':<22}{value}")
+
+
+def score(args):
+    fmt = _output_format(args.out, args.format) if args.out else None
+    if args.scorer == "sequence" and args.no_cache:
+        raise SystemExit("--scorer sequence reads the trips from the ingest cache, it can't be combined with --no-cache")
+    if args.sequence_model and args.scorer != "sequence":
+        raise SystemExit("--sequence-model only applies to --scorer sequence")
+
+    if not args.no_history:
+        init_db()
+
+    with ExitStack() as stack:
+        rec = stack.enter_context(instrument.session()) if args.trace or args.profile else None
+        if args.profile:
+            stack.enter_context(instrument.capture(args.profile))
+
+        t0 = time.perf_counter()
+        try:
+            result = run_batch(
+                args.sensor, args.driver, args.safety,
+                threshold=args.threshold,
+                workers=args.workers,
+                use_cache=not args.no_cache,
+                use_store=not args.no_store,
+                presorted=args.presorted,
+                chunksize=args.chunksize,
+                backend=args.backend,
+                scorer=args.scorer,
+                sequence_model=args.sequence_model,
+                persist=not args.no_history,
+                explain=args.explain,
+                report=None if args.quiet else _StderrProgress(),
+            )
+        except (SchemaError, FileNotFoundError) as e:
+            raise SystemExit(str(e)) from e
+
+        for w in result["schema"].warnings:
+            print(f"warning: {w}", file=sys.stderr)
+
+        if args.out:
+            with instrument.span("output.write", rows=len(result["preds"])):
+                _write_output(result["preds"], args.out, fmt)
+        wall = time.perf_counter() - t0
+
+    _print_summary(result, wall, args.out)
+    if rec is not None:
+        trace_path = Path(args.trace) if args.trace else Path(args.profile) / "run.trace.json"
+        rec.export(trace_path)
+        print(f"{'trace:':<22}{trace_path}")
+        print(f"{'hot spans:':<22}{rec.status_line()}")
+    return 0
+
+
+def serve(args):
+    try:
+        asyncio.run(stream_server.serve(
+            host=args.host,
+            port=args.port,
+            threshold=args.threshold,
+            batch_ms=args.batch_ms,
+            queue_size=args.queue_size,
+            idle_timeout=args.idle_timeout,
+            backend=args.backend,
+            persist=not args.no_history,
+            log_every=args.log_every,
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def send(args):
+    async def run():
+        t0 = time.perf_counter()
+        sent, replies = await stream_server.send_csv(args.sensor, args.safety, host=args.host, port=args.port,
+                                                     rate=args.rate)
+        wall = time.perf_counter() - t0
+        metrics = await stream_server.fetch_metrics(args.host, args.port)
+        return sent, replies, wall, metrics
+
+    sent, replies, wall, metrics = asyncio.run(run())
+    print(f"{'readings sent:':<22}{sent:,} ({sent / wall if wall > 0 else 0.0:,.0f}/s)")
+    print(f"{'score lines:':<22}{replies:,}")
+    for key in ("events_per_sec", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "batches", "trips_closed"):
+        value = metrics.get(key)
+        print(f"{key + ':':<22}{'-' if value is None else f'{value:,.1f}'}")
+    return 0
+
+
+def history(args):
+    init_db()
+    if args.action == "runs":
+        for run_id, created_at, fingerprint, version, thr, trips, inserted, updated, unchanged in fetch_runs(args.limit):
+            print(f"run {run_id} | {created_at} | model={version or '-'} | thr={thr} | input={(fingerprint or '-')[:12]} | "
+                  f"trips={trips:,} new={inserted:,} updated={updated:,} unchanged={unchanged:,}")
+        return 0
+    if args.action == "rebuild":
+        t0 = time.perf_counter()
+        drivers = rebuild_driver_history()
+        print(f"{'drivers rebuilt:':<22}{drivers:,} ({time.perf_counter() - t0:.2f}s)")
+        return 0
+
+    result = check_driver_history(limit=args.limit)
+    print(f"{'drivers checked:':<22}{result['drivers_checked']:,}")
+    print(f"{'mismatches:':<22}{result['mismatch_count']:,}")
+    for driver_id, column, stored, expected in result["mismatches"]:
+        who = "" if driver_id is None else f"driver={driver_id} "
+        print(f"  {who}{column}: stored={stored} expected={expected}")
+    if result["mismatch_count"]:
+        print("run 'python -m gobest history rebuild' to recompute driver_history from trip_predictions", file=sys.stderr)
+        return 1
+    return 0
+
+
+def sequences(args):
+    if args.action == "build":
+        if not args.sensor or not args.safety:
+            raise SystemExit("sequences build needs --sensor and --safety")
+        before = len(SequenceStore.open(args.store)) if (Path(args.store) / "meta.json").exists() else 0
+        t0 = time.perf_counter()
+        store = build_sequence_store(args.sensor, load_table(args.safety), path=args.store,
+                                     chunksize=args.chunksize, presorted=args.presorted)
+        print(f"{'trips appended:':<22}{len(store) - before:,} ({time.perf_counter() - t0:.2f}s)")
+    elif args.action == "train":
+        if not args.safety:
+            raise SystemExit("sequences train needs --safety (for the labels)")
+        try:
+            store = SequenceStore.open(args.store)
+        except FileNotFoundError as e:
+            raise SystemExit(f"{e}; run 'python -m gobest sequences build' first") from e
+        t0 = time.perf_counter()
+        model = train_sequence_model(store, load_table(args.safety), path=args.out, seed=args.seed)
+        print(f"{'model:':<22}{args.out} ({model.version}, {model.n_features:,} features)")
+        print(f"{'trained in:':<22}{time.perf_counter() - t0:.2f}s")
+    else:
+        try:
+            store = SequenceStore.open(args.store)
+        except FileNotFoundError as e:
+            raise SystemExit(str(e)) from e
+
+    lengths = store.lengths
+    print(f"{'store:':<22}{store.path}")
+    print(f"{'trips:':<22}{len(store):,}")
+    print(f"{'readings:':<22}{store.n_rows:,} "
+          f"({(store.values.nbytes + store.seconds.nbytes) / 1024 ** 2:,.1f} MB float32 signals + float64 second)")
+    print(f"{'channels:':<22}{', '.join(store.channels)}")
+    if len(store):
+        print(f"{'readings per trip:':<22}min {lengths.min():,}  median {int(np.median(lengths)):,}  max {lengths.max():,}")
+    return 0
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="gobest", description="GoBest dangerous trip detector")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    sc = sub.add_parser("score", help="score the 3 raw csv files and store the batch in the history db")
+    sc.add_argument("--sensor", required=True, help="sensor_data.csv (must include bookingID)")
+    sc.add_argument("--driver", required=True, help="driver_data.csv (must include id)")
+    sc.add_argument("--safety", required=True, help="safety_labels.csv (bookingID + driver_id)")
+    sc.add_argument("--threshold", type=float, default=0.5, help="probability >= threshold -> dangerous")
+    sc.add_argument("--out", help="prediction output file (csv or parquet)")
+    sc.add_argument("--format", choices=OUTPUT_FORMATS, help="output format (default: from the --out extension)")
+    sc.add_argument("--workers", type=int, default=1,
+                    help="worker processes for feature engineering (default: 1, like the GUI; "
+                         "more only pay off on large batches)")
+    sc.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="sensor rows per read/featurize slice")
+    sc.add_argument("--scorer", choices=SCORERS, default="xgboost",
+                    help="xgboost: trip features, sequence: MiniROCKET-style model on the raw readings "
+                         "(train it with 'sequences train'; needs the ingest cache)")
+    sc.add_argument("--sequence-model", metavar="MODEL.joblib",
+                    help="sequence model file of --scorer sequence, i.e. the 'sequences train --out' "
+                         f"(default: {SEQUENCE_MODEL_PATH})")
+    sc.add_argument("--backend", choices=BACKENDS, default="model",
+                    help="model: the saved estimator's predict_proba, numpy: flattened-tree evaluator")
+    sc.add_argument("--presorted", action="store_true",
+                    help="sensor csv is sorted by bookingID, second (skips the on-disk sort, --no-cache only)")
+    sc.add_argument("--no-cache", action="store_true", help="stream the sensor csv instead of the binary ingest cache")
+    sc.add_argument("--no-store", action="store_true", help="recompute every trip instead of reusing stored features")
+    sc.add_argument("--no-history", action="store_true", help="don't write the batch to the sqlite history")
+    sc.add_argument("--explain", action="store_true",
+                    help="cache per-trip feature contributions (TreeSHAP) with the stored predictions")
+    sc.add_argument("--quiet", action="store_true", help="no progress lines on stderr")
+    sc.add_argument("--trace", help="write stage spans (time, rows/trips/bytes, peak rss) to this file; "
+                                    "*.trace.json is the chrome://tracing format, anything else plain json")
+    sc.add_argument("--profile", metavar="DIR",
+                    help="also capture cProfile + tracemalloc for this run into DIR (slow)")
+    sc.set_defaults(func=score)
+
+    sv = sub.add_parser("serve", help="score live sensor readings sent over localhost TCP (newline-delimited json)")
+    sv.add_argument("--host", default=stream_server.DEFAULT_HOST)
+    sv.add_argument("--port", type=int, default=stream_server.DEFAULT_PORT)
+    sv.add_argument("--threshold", type=float, default=0.5, help="probability >= threshold -> dangerous")
+    sv.add_argument("--batch-ms", type=int, default=stream_server.DEFAULT_BATCH_MS, help="micro-batch scoring interval")
+    sv.add_argument("--queue-size", type=int, default=stream_server.DEFAULT_QUEUE_SIZE, help="queued readings before producers are throttled")
+    sv.add_argument("--idle-timeout", type=float, default=stream_server.DEFAULT_IDLE_TIMEOUT, help="seconds without readings before a trip is closed")
+    sv.add_argument("--backend", choices=BACKENDS, default="model")
+    sv.add_argument("--no-history", action="store_true", help="don't write finished trips to the sqlite history")
+    sv.add_argument("--log-every", type=float, default=10.0, help="seconds between metrics lines (0 = off)")
+    sv.set_defaults(func=serve)
+
+    sd = sub.add_parser("send", help="stub producer: replay a sensor csv to a running 'serve'")
+    sd.add_argument("--sensor", required=True)
+    sd.add_argument("--safety", help="safety_labels.csv, for driver_id")
+    sd.add_argument("--host", default=stream_server.DEFAULT_HOST)
+    sd.add_argument("--port", type=int, default=stream_server.DEFAULT_PORT)
+    sd.add_argument("--rate", type=float, default=0.0, help="readings/sec (0 = as fast as the server accepts)")
+    sd.set_defaults(func=send)
+
+    hi = sub.add_parser("history", help="check driver_history against trip_predictions, rebuild it from them, "
+                                        "or list the stored runs")
+    hi.add_argument("action", choices=("check", "rebuild", "runs"))
+    hi.add_argument("--limit", type=int, default=20, help="mismatches listed by check / runs listed")
+    hi.set_defaults(func=history)
+
+    sq = sub.add_parser("sequences", help="build / append the memory-mapped raw sequence store of the sequence models, "
+                                          "summarize it, or train the sequence scorer on it")
+    sq.add_argument("action", choices=("build", "info", "train"))
+    sq.add_argument("--sensor", help="sensor_data.csv (build)")
+    sq.add_argument("--safety", help="safety_labels.csv, for the bookingID column (build) / labels (train)")
+    sq.add_argument("--store", default=str(SEQUENCE_DIR), help="store directory (trips already stored are skipped)")
+    sq.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="sensor rows per read slice")
+    sq.add_argument("--presorted", action="store_true", help="sensor csv is sorted by bookingID, second (no bucket spill)")
+    sq.add_argument("--out", default=str(SEQUENCE_MODEL_PATH), help="trained sequence model file (train)")
+    sq.add_argument("--seed", type=int, default=0, help="kernel channel subsets / bias sample seed (train)")
+    sq.set_defaults(func=sequences)
+    return ap
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not (0.0 <= getattr(args, "threshold", 0.5) <= 1.0):
+        raise SystemExit("--threshold must be between 0 and 1")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,300 @@
+import functools
+import json
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
+from itertools import repeat
 from pathlib import Path
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+
+from . import instrument
+
 DB_PATH = Path(__file__).parent / "gobest_history.db"
 
+# per-connection tuning; journal_mode=WAL is persistent and set once in init_db
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",   # safe with WAL, avoids an fsync per commit
+    "PRAGMA cache_size = -65536",   # 64 MB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",   # other processes (cli, notebooks) may hold the write lock briefly
+]
+
+# compiled statements kept per connection; connections are reused, so repeated queries skip parsing
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    for p in PRAGMAS:
+        conn.execute(p)
+    return conn
+
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    """
+    this thread's connection to DB_PATH, opened on first use and reused afterwards
+    (sqlite connections must stay on the thread that created them)
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = conns[DB_PATH] = _connect(DB_PATH)
+    return conn
+
+
+def close_thread_connections():
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
 
 
+class _Writer:
+    """
+    single background thread that runs every write, one at a time, on its own connection
+
+    callers block until their write is committed, so they still see errors as exceptions;
+    concurrent writers queue up here instead of failing with "database is locked"
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            fn, args, kwargs, fut = self._queue.get()
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+
+    def call(self, fn, *args, **kwargs):
+        # nested writes (a write calling another write) run inline
+        if threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gobest-db-writer", daemon=True)
+                self._thread.start()
+
+        fut = Future()
+        self._queue.put((fn, args, kwargs, fut))
+        return fut.result()
+
+
+_writer = _Writer()
+
+
+def _writes(fn):
+    """
+    routes the decorated function through the single writer thread
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _writer.call(fn, *args, **kwargs)
+    return wrapper
+
+
+def close_connections():
+    """
+    closes the pooled connections of this thread and of the writer thread
+    """
+    _writer.call(close_thread_connections)
+    close_thread_connections()
+
+
+# schema migrations, applied in order by init_db; PRAGMA user_version = number applied so far
+MIGRATIONS = [
+    # 1: indexes for History tab reads (recent list, per-driver lookups, high-risk count + top drivers)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_trip_predictions_created_at ON trip_predictions(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_trip_predictions_driver_created ON trip_predictions(driver_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_trip_predictions_booking ON trip_predictions(bookingID)",
+        "CREATE INDEX IF NOT EXISTS idx_driver_history_rate ON driver_history(dangerous_rate, total_trips)",
+    ],
+
+    # 2: maintained counters so summary stats are O(1) reads
+    # driver counters follow driver_history through triggers (one row per driver, cheap);
+    # total_preds is bumped once per batch by _insert_predictions, a per-row trigger would slow bulk inserts
+    [
+        """
+        CREATE TABLE IF NOT EXISTS db_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR REPLACE INTO db_counters SELECT 'total_preds', COUNT(*) FROM trip_predictions",
+        "INSERT OR REPLACE INTO db_counters SELECT 'total_drivers', COUNT(*) FROM driver_history",
+        "INSERT OR REPLACE INTO db_counters SELECT 'high_risk_drivers', COUNT(*) FROM driver_history WHERE dangerous_rate >= 0.5",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_driver_history_insert AFTER INSERT ON driver_history
+        BEGIN
+            UPDATE db_counters SET value = value + 1 WHERE name = 'total_drivers';
+            UPDATE db_counters SET value = value + (NEW.dangerous_rate >= 0.5) WHERE name = 'high_risk_drivers';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_driver_history_update AFTER UPDATE OF dangerous_rate ON driver_history
+        BEGIN
+            UPDATE db_counters
+            SET value = value + (NEW.dangerous_rate >= 0.5) - (OLD.dangerous_rate >= 0.5)
+            WHERE name = 'high_risk_drivers';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_driver_history_delete AFTER DELETE ON driver_history
+        BEGIN
+            UPDATE db_counters SET value = value - 1 WHERE name = 'total_drivers';
+            UPDATE db_counters SET value = value - (OLD.dangerous_rate >= 0.5) WHERE name = 'high_risk_drivers';
+        END
+        """,
+    ],
+
+    # 3: driver_history becomes an incremental view of trip_predictions (see _DRIVER_SUMS)
+    # the per-trip harsh count is kept from now on; the old avg_harsh_accel was the mean of the last batch only
+    # and can't be recovered for trips already stored, so it starts over as unknown (NULL)
+    [
+        "ALTER TABLE trip_predictions ADD COLUMN harsh_accel_count REAL",
+        "ALTER TABLE driver_history ADD COLUMN harsh_accel_sum REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE driver_history ADD COLUMN harsh_accel_trips INTEGER NOT NULL DEFAULT 0",
+        "UPDATE driver_history SET avg_harsh_accel = NULL",
+    ],
+
+    # 4: one row per (bookingID, model_version), written by upsert; runs records every batch run
+    # is_current marks the latest prediction of a trip (whatever model made it), the one driver_history counts.
+    # re-running a file used to append the same trips again, so duplicates are dropped (latest row kept)
+    # and driver_history / total_preds, which counted them, are recomputed (frozen copy of the rebuild)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            input_fingerprint TEXT,
+            model_version TEXT NOT NULL,
+            threshold REAL,
+            trips INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            unchanged INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "ALTER TABLE trip_predictions ADD COLUMN model_version TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE trip_predictions ADD COLUMN run_id INTEGER",
+        "ALTER TABLE trip_predictions ADD COLUMN is_current INTEGER NOT NULL DEFAULT 1",
+        "DELETE FROM trip_predictions WHERE rowid NOT IN (SELECT MAX(rowid) FROM trip_predictions GROUP BY bookingID, model_version)",
+        "DROP INDEX IF EXISTS idx_trip_predictions_booking",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_trip_predictions_key ON trip_predictions(bookingID, model_version)",
+        "UPDATE db_counters SET value = (SELECT COUNT(*) FROM trip_predictions) WHERE name = 'total_preds'",
+        "DELETE FROM driver_history",
+        """
+        INSERT INTO driver_history (driver_id, total_trips, dangerous_trips, harsh_accel_trips, harsh_accel_sum,
+                                    dangerous_rate, avg_harsh_accel, last_updated)
+        SELECT driver_id, COUNT(*), SUM(pred_label = 1), COUNT(harsh_accel_count), COALESCE(SUM(harsh_accel_count), 0),
+               CAST(SUM(pred_label = 1) AS REAL) / COUNT(*), SUM(harsh_accel_count) / COUNT(harsh_accel_count),
+               MAX(created_at)
+        FROM trip_predictions
+        GROUP BY driver_id
+        """,
+    ],
+
+    # 5: History tab pages are keyset queries over the current rows ordered by (created_at, rowid),
+    # one index per filter that can lead (none, driver, label); each ends in created_at + the implicit rowid,
+    # so a cursor and an offset jump / count stay inside the index
+    [
+        "DROP INDEX IF EXISTS idx_trip_predictions_created_at",
+        "DROP INDEX IF EXISTS idx_trip_predictions_driver_created",
+        "CREATE INDEX IF NOT EXISTS idx_trip_predictions_current_created ON trip_predictions(is_current, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_trip_predictions_current_driver ON trip_predictions(is_current, driver_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_trip_predictions_current_label ON trip_predictions(is_current, pred_label, created_at)",
+    ],
+
+    # 6: per-trip feature contributions (explain.py) cached on the keyed prediction row, as float32 bytes in
+    # the feature order recorded for the model version (+ the bias last)
+    [
+        "ALTER TABLE trip_predictions ADD COLUMN contributions BLOB",
+        """
+        CREATE TABLE IF NOT EXISTS model_features (
+            model_version TEXT PRIMARY KEY,
+            feature_cols TEXT NOT NULL
+        )
+        """,
+    ],
+]
+
+# driver_history is maintained from the current trip_predictions rows (is_current = 1):
+# running sums as (column, per-trip SQL expression, same value from the batch frame's columns)
+# and columns derived from the sums ({name} = a sum column).
+# a new per-driver aggregate = an entry here + a migration adding its column; the batch upsert,
+# rebuild_driver_history and check_driver_history all follow from these two lists
+_DRIVER_SUMS = [
+    ("total_trips", "1", lambda t: np.ones(len(t), dtype=np.int64)),
+    ("dangerous_trips", "pred_label = 1", lambda t: (t["pred_label"] == 1).astype(np.int64)),
+    ("harsh_accel_trips", "harsh_accel_count IS NOT NULL", lambda t: t["harsh_accel_count"].notna().astype(np.int64)),
+    ("harsh_accel_sum", "COALESCE(harsh_accel_count, 0)", lambda t: t["harsh_accel_count"].fillna(0.0)),
+]
+_DRIVER_DERIVED = [
+    # 0 rather than NULL for a driver left without trips (deleted right after), the counter triggers compare it
+    ("dangerous_rate", "COALESCE(CAST({dangerous_trips} AS REAL) / NULLIF({total_trips}, 0), 0)"),
+    ("avg_harsh_accel", "{harsh_accel_sum} / NULLIF({harsh_accel_trips}, 0)"),
+]
+_SUM_COLUMNS = [s[0] for s in _DRIVER_SUMS]
+_DRIVER_COLUMNS = _SUM_COLUMNS + [name for name, _ in _DRIVER_DERIVED]
+
+# value columns of a stored prediction; a row whose values all match the new batch is left untouched
+_TRIP_VALUE_COLUMNS = ["driver_id", "pred_proba", "pred_label", "threshold", "harsh_accel_count"]
+_PREDICTION_COLUMNS = ["bookingID", "model_version", *_TRIP_VALUE_COLUMNS, "created_at", "run_id"]
+
+_CURRENT_TRIPS = "(SELECT * FROM trip_predictions WHERE is_current = 1)"
+
+# relative tolerance of check_driver_history for the REAL columns
+CHECK_REL_TOL = 1e-9
+
+# scores of one model_version closer than this are the same prediction: the model_utils backends
+# share a version (it hashes the artifacts) but sum float32 leaves in different orders (~1e-7 apart)
+SCORE_TOLERANCE = 1e-6
+
+# booking ids per IN (...) lookup, under SQLite's default bound-variable limit
+KEY_CHUNK = 500
+
+
+def _migrate(conn):
+    """
+    upgrades an existing database in place, one transaction per migration
+    """
+    cur = conn.cursor()
+    version = int(cur.execute("PRAGMA user_version").fetchone()[0])
+
+    for target, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        cur.execute("BEGIN")
+        try:
+            for sql in statements:
+                cur.execute(sql)
+            cur.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+@_writes
 def init_db():
     with get_conn() as conn:
         cur = conn.cursor()
 
+        # readers no longer block the batch writer (and vice versa)
+        cur.execute("PRAGMA journal_mode = WAL")
+
         cur.execute("""
         CREATE TABLE IF NOT EXISTS driver_history (
             driver_id INTEGER PRIMARY KEY,
@@ -37,30 +319,27 @@ def init_db():
 
         conn.commit()
 
+        _migrate(conn)
 
+
+@instrument.timed("db.fetch_db_stats")
 def fetch_db_stats():
     """
-    returns: dict with counts for display
+    returns: dict with counts for display (read from db_counters, no table scans)
     """
     with get_conn() as conn:
         cur = conn.cursor()
-
-        cur.execute("SELECT COUNT(*) FROM trip_predictions")
-        total_preds = int(cur.fetchone()[0])
-
-        cur.execute("SELECT COUNT(DISTINCT driver_id) FROM driver_history")
-        total_drivers = int(cur.fetchone()[0])
-
-        cur.execute("SELECT COUNT(*) FROM driver_history WHERE dangerous_rate >= 0.5")
-        high_risk_drivers = int(cur.fetchone()[0])
+        cur.execute("SELECT name, value FROM db_counters")
+        counters = dict(cur.fetchall())
 
         return {
-            "total_preds": total_preds,
-            "total_drivers": total_drivers,
-            "high_risk_drivers": high_risk_drivers,
+            "total_preds": int(counters.get("total_preds", 0)),
+            "total_drivers": int(counters.get("total_drivers", 0)),
+            "high_risk_drivers": int(counters.get("high_risk_drivers", 0)),
         }
 
 
+@instrument.timed("db.fetch_recent_predictions")
 def fetch_recent_predictions(limit=12):
     """
     returns list of tuples:
@@ -71,12 +350,100 @@ def fetch_recent_predictions(limit=12):
         cur.execute("""
         SELECT created_at, bookingID, driver_id, pred_proba, pred_label, threshold
         FROM trip_predictions
+        WHERE is_current = 1
         ORDER BY created_at DESC
         LIMIT ?
         """, (int(limit),))
         return cur.fetchall()
 
 
+def _prediction_filter(driver_id=None, created_from=None, created_before=None, label=None):
+    # WHERE clause + params over the current predictions; created_* are ISO timestamps / dates
+    where, params = ["is_current = 1"], []
+    if driver_id is not None:
+        where.append("driver_id = ?")
+        params.append(int(driver_id))
+    if created_from is not None:
+        where.append("created_at >= ?")
+        params.append(str(created_from))
+    if created_before is not None:
+        where.append("created_at < ?")
+        params.append(str(created_before))
+    if label is not None:
+        # with a driver, its index is far more selective; the unary + keeps the label index from being picked
+        where.append("pred_label = ?" if driver_id is None else "+pred_label = ?")
+        params.append(int(label))
+    return " AND ".join(where), params
+
+
+@instrument.timed("db.fetch_prediction_page")
+def fetch_prediction_page(after=None, offset=0, limit=100, **filters):
+    """
+    one page of current predictions, newest first, ordered by (created_at, rowid)
+
+    after: (created_at, rowid) of the last row of the previous page (keyset cursor, cost independent of depth);
+    offset: rows to skip when there is no cursor, for jumps to a page whose predecessor isn't known
+    (cost grows with offset)
+    filters: driver_id, created_from (inclusive), created_before (exclusive), label
+    returns list of tuples:
+    (created_at, rowid, bookingID, driver_id, pred_proba, pred_label, threshold, model_version)
+    """
+    def page(page_filters, extra, extra_params, n, skip=0):
+        where, params = _prediction_filter(**page_filters)
+        cur.execute(f"""
+        SELECT created_at, rowid, bookingID, driver_id, pred_proba, pred_label, threshold, model_version
+        FROM trip_predictions
+        WHERE {where}{extra}
+        ORDER BY created_at DESC, rowid DESC
+        LIMIT ? OFFSET ?
+        """, (*params, *extra_params, int(n), int(skip)))
+        return cur.fetchall()
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if after is None:
+            return page(filters, "", (), limit, offset)
+        # (created_at, rowid) < cursor as two exact index ranges: the rest of the cursor's timestamp, then
+        # older ones. a row-value comparison only ranges on created_at (scanning a whole batch sharing one
+        # timestamp), and the date bounds are dropped where the cursor implies them so they don't win the range
+        same = {**filters, "created_from": None, "created_before": None}
+        rows = page(same, " AND created_at = ? AND rowid < ?", (after[0], int(after[1])), limit)
+        if len(rows) < limit:
+            older = {**filters, "created_before": None}
+            rows += page(older, " AND created_at < ?", (after[0],), limit - len(rows))
+        return rows
+
+
+@instrument.timed("db.count_predictions")
+def count_predictions(**filters):
+    """
+    number of current predictions matching filters (see fetch_prediction_page); O(1) without filters
+    """
+    if not any(v is not None for v in filters.values()):
+        return fetch_db_stats()["total_preds"]
+    where, params = _prediction_filter(**filters)
+    with get_conn() as conn:
+        return int(conn.execute(f"SELECT COUNT(*) FROM trip_predictions WHERE {where}", params).fetchone()[0])
+
+
+@instrument.timed("db.fetch_runs")
+def fetch_runs(limit=20):
+    """
+    returns list of tuples, newest first:
+    (run_id, created_at, input_fingerprint, model_version, threshold, trips, inserted, updated, unchanged)
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        SELECT run_id, created_at, input_fingerprint, model_version, threshold, trips, inserted, updated, unchanged
+        FROM runs
+        ORDER BY run_id DESC
+        LIMIT ?
+        """, (int(limit),))
+        return cur.fetchall()
+
+
+@instrument.timed("db.fetch_top_drivers")
 def fetch_top_drivers(limit=10):
     """
     returns list of tuples:
@@ -94,6 +461,7 @@ def fetch_top_drivers(limit=10):
         return cur.fetchall()
 
 
+@instrument.timed("db.fetch_driver_history")
 def fetch_driver_history(driver_id):
     with get_conn() as conn:
         cur = conn.cursor()
@@ -105,70 +473,311 @@ def fetch_driver_history(driver_id):
         return cur.fetchone()
 
 
-def save_predictions(preds_df, threshold):
+def _harsh_counts(preds_df):
+    # per-trip harsh acceleration count when the engineered features came along, else unknown (NaN -> NULL)
+    if "harsh_acceleration_count" not in preds_df.columns:
+        return np.full(len(preds_df), np.nan)
+    return pd.to_numeric(preds_df["harsh_acceleration_count"], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _batch_trips(preds_df, threshold):
+    """
+    the batch as trip_predictions value columns, one row per bookingID (the last one wins)
+    """
+    trips = pd.DataFrame({
+        "bookingID": preds_df["bookingID"].to_numpy(dtype=np.int64),
+        "driver_id": preds_df["driver_id"].to_numpy(dtype=np.int64),
+        "pred_proba": preds_df["pred_proba"].to_numpy(dtype=np.float64),
+        "pred_label": preds_df["pred_label"].to_numpy(dtype=np.int64),
+        "threshold": np.full(len(preds_df), np.nan if threshold is None else float(threshold)),
+        "harsh_accel_count": _harsh_counts(preds_df),
+    })
+    if not trips["bookingID"].is_unique:
+        trips = trips.drop_duplicates("bookingID", keep="last").reset_index(drop=True)
+    return trips
+
+
+def _current_rows(cur, booking_ids):
+    """
+    the current stored prediction of every booking id, aligned with booking_ids (NaN rowid = none stored)
+    """
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS batch_keys (bookingID INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM batch_keys")
+    cur.executemany("INSERT INTO batch_keys VALUES (?)", zip(booking_ids.tolist()))
+    # CROSS JOIN pins the join order and the unary + keeps is_current out of index selection:
+    # one (bookingID, model_version) key probe per batch trip. left to itself the planner may scan the
+    # whole table, or an is_current index once per trip
+    cur.execute(f"""
+    SELECT t.bookingID, t.rowid, t.model_version, {", ".join(f"t.{c}" for c in _TRIP_VALUE_COLUMNS)}
+    FROM batch_keys k
+    CROSS JOIN trip_predictions t ON t.bookingID = k.bookingID
+    WHERE +t.is_current = 1
+    """)
+    old = pd.DataFrame(cur.fetchall(), columns=["bookingID", "rowid", "model_version", *_TRIP_VALUE_COLUMNS])
+    old["harsh_accel_count"] = old["harsh_accel_count"].astype(np.float64)
+    old["threshold"] = old["threshold"].astype(np.float64)
+    return old.set_index("bookingID").reindex(booking_ids).reset_index(drop=True)
+
+
+def _unchanged(trips, old, model_version):
+    # stored row of the same model with identical values (NULL == NULL here), the score within SCORE_TOLERANCE
+    same = old["rowid"].notna().to_numpy() & (old["model_version"] == model_version).to_numpy()
+    for c in _TRIP_VALUE_COLUMNS:
+        a = trips[c].to_numpy(dtype=np.float64)
+        b = old[c].to_numpy(dtype=np.float64)
+        equal = np.abs(a - b) <= SCORE_TOLERANCE if c == "pred_proba" else a == b
+        same &= equal | (np.isnan(a) & np.isnan(b))
+    return same
+
+
+def _upsert_predictions(cur, trips, model_version, run_id, now):
+    # new (bookingID, model_version) rows are inserted, existing ones overwritten and made current again;
+    # cached contributions survive only when the score did not move beyond SCORE_TOLERANCE
+    # (SET sees the old row's values)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in _PREDICTION_COLUMNS[2:])
+    cur.executemany(f"""
+    INSERT INTO trip_predictions ({", ".join(_PREDICTION_COLUMNS)}, is_current)
+    VALUES ({", ".join("?" * len(_PREDICTION_COLUMNS))}, 1)
+    ON CONFLICT(bookingID, model_version) DO UPDATE SET {updates}, is_current = 1,
+        contributions = CASE WHEN ABS(pred_proba - excluded.pred_proba) <= {SCORE_TOLERANCE!r} THEN contributions END
+    """, zip(
+        trips["bookingID"].tolist(),
+        repeat(model_version),
+        trips["driver_id"].tolist(),
+        trips["pred_proba"].tolist(),
+        trips["pred_label"].tolist(),
+        [None if t != t else t for t in trips["threshold"].tolist()],
+        [None if c != c else c for c in trips["harsh_accel_count"].tolist()],
+        repeat(now),
+        repeat(run_id),
+    ))
+
+
+def _write_batch(cur, preds_df, threshold, model_version, run_id, now, history):
+    """
+    keyed write of one batch: unchanged trips cost a lookup, new / changed ones one upsert each;
+    with history, driver_history moves by (new rows - the current rows they replace)
+    returns (trips, inserted, updated, unchanged)
+    """
+    trips = _batch_trips(preds_df, threshold)
+    with instrument.span("db.lookup_current", rows=len(trips)):
+        old = _current_rows(cur, trips["bookingID"].to_numpy())
+    write = ~_unchanged(trips, old, model_version)
+    replaced = write & old["rowid"].notna().to_numpy()
+    inserted = int(np.count_nonzero(write & ~replaced))
+
+    with instrument.span("db.insert_predictions", rows=int(np.count_nonzero(write))):
+        # a trip scored before by another model: that row stays stored but is no longer the current one
+        stale = replaced & (old["model_version"] != model_version).to_numpy()
+        if stale.any():
+            cur.executemany("UPDATE trip_predictions SET is_current = 0 WHERE rowid = ?",
+                            zip(old["rowid"][stale].astype(np.int64).tolist()))
+        _upsert_predictions(cur, trips[write], model_version, run_id, now)
+        cur.execute("UPDATE db_counters SET value = value + ? WHERE name = 'total_preds'", (inserted,))
+
+    if history and write.any():
+        with instrument.span("db.upsert_driver_history", rows=int(np.count_nonzero(write))):
+            delta = _driver_sums(trips[write])
+            if replaced.any():
+                previous = old[replaced].astype({"driver_id": np.int64, "pred_label": np.int64})
+                delta = delta.sub(_driver_sums(previous), fill_value=0)
+            _upsert_driver_history(cur, delta, now)
+
+    updated = int(np.count_nonzero(replaced))
+    return len(trips), inserted, updated, len(trips) - inserted - updated
+
+
+def _derived(template, column):
+    # fills a _DRIVER_DERIVED template, column(name) -> SQL for that sum
+    return template.format(**{name: column(name) for name in _SUM_COLUMNS})
+
+
+def _driver_rows_sql(agg):
+    """
+    SELECT of driver_id, every _DRIVER_COLUMNS value and last_updated from per-driver sums in agg
+    (a table or subquery with driver_id, the sum columns and last_updated)
+    """
+    derived = ", ".join(f"{_derived(t, lambda n: f'agg.{n}')} AS {name}" for name, t in _DRIVER_DERIVED)
+    return f"""
+    SELECT agg.driver_id, {", ".join(f"agg.{name}" for name in _SUM_COLUMNS)}, {derived}, agg.last_updated
+    FROM {agg} agg
+    """
+
+
+def _trip_sums_sql(source):
+    # per-driver sums over trip rows (trip_predictions columns), the SQL side of _DRIVER_SUMS
+    sums = ", ".join(f"SUM({expr}) AS {name}" for name, expr, _ in _DRIVER_SUMS)
+    return f"(SELECT driver_id, {sums}, MAX(created_at) AS last_updated FROM {source} GROUP BY driver_id)"
+
+
+def _driver_sums(trips):
+    # per-driver sums of trip rows (trip_predictions columns), the pandas side of _DRIVER_SUMS (one groupby)
+    per_trip = pd.DataFrame({name: np.asarray(fn(trips)) for name, _, fn in _DRIVER_SUMS})
+    return per_trip.groupby(trips["driver_id"].to_numpy()).sum()
+
+
+def _upsert_driver_history(cur, delta, now):
+    """
+    delta: per-driver changes of the sum columns (index = driver_id), e.g. from _driver_sums
+    goes to a temp table, then one set-based upsert for every driver: sums move by the delta,
+    derived columns are recomputed from the new sums; drivers left without trips are dropped
+    """
+    cur.execute(f"""
+    CREATE TEMP TABLE IF NOT EXISTS batch_driver_delta (
+        driver_id INTEGER PRIMARY KEY, {", ".join(_SUM_COLUMNS)}, last_updated TEXT
+    )
+    """)
+    cur.execute("DELETE FROM batch_driver_delta")
+    cur.executemany(
+        f"INSERT INTO batch_driver_delta VALUES (?, {', '.join('?' * len(_SUM_COLUMNS))}, ?)",
+        zip(delta.index.tolist(), *(delta[name].tolist() for name in _SUM_COLUMNS), repeat(now)),
+    )
+
+    updates = [f"{name} = {name} + excluded.{name}" for name in _SUM_COLUMNS]
+    updates += [f"{name} = {_derived(t, lambda n: f'({n} + excluded.{n})')}" for name, t in _DRIVER_DERIVED]
+
+    # "WHERE true" is required by sqlite to parse ON CONFLICT after a SELECT
+    cur.execute(f"""
+    INSERT INTO driver_history (driver_id, {", ".join(_DRIVER_COLUMNS)}, last_updated)
+    {_driver_rows_sql("batch_driver_delta")}
+    WHERE true
+    ON CONFLICT(driver_id) DO UPDATE SET
+        {", ".join(updates)},
+        last_updated = excluded.last_updated
+    """)
+    cur.execute("""
+    DELETE FROM driver_history
+    WHERE total_trips <= 0 AND driver_id IN (SELECT driver_id FROM batch_driver_delta)
+    """)
+
+
+def _start_run(cur, now, model_version, threshold, input_fingerprint):
+    cur.execute("""
+    INSERT INTO runs (created_at, input_fingerprint, model_version, threshold)
+    VALUES (?, ?, ?, ?)
+    """, (now, input_fingerprint, model_version, None if threshold is None else float(threshold)))
+    return cur.lastrowid
+
+
+def _count_run(cur, run_id, trips, inserted, updated, unchanged):
+    cur.execute("""
+    UPDATE runs SET trips = trips + ?, inserted = inserted + ?, updated = updated + ?, unchanged = unchanged + ?
+    WHERE run_id = ?
+    """, (trips, inserted, updated, unchanged, run_id))
+    return {"run_id": run_id, "trips": trips, "inserted": inserted, "updated": updated, "unchanged": unchanged}
+
+
+@_writes
+def save_predictions(preds_df, threshold, model_version="", input_fingerprint=None, run_id=None):
     """
-    saves every row in preds_df into trip_predictions
+    stores preds_df into trip_predictions, keyed by (bookingID, model_version); driver_history is not touched
+    (save_batch keeps both in step)
     expects columns: bookingID, driver_id, pred_proba, pred_label
+    returns dict: run_id, trips, inserted, updated, unchanged
     """
     now = datetime.utcnow().isoformat()
 
     with get_conn() as conn:
         cur = conn.cursor()
-        for _, r in preds_df.iterrows():
-            cur.execute("""
-            INSERT INTO trip_predictions
-            VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                int(r["bookingID"]),
-                int(r["driver_id"]),
-                float(r["pred_proba"]),
-                int(r["pred_label"]),
-                float(threshold),
-                now,
-            ))
+        if run_id is None:
+            run_id = _start_run(cur, now, model_version, threshold, input_fingerprint)
+        counts = _write_batch(cur, preds_df, threshold, model_version, run_id, now, history=False)
+        stats = _count_run(cur, run_id, *counts)
         conn.commit()
+    return stats
 
 
-def update_driver_history(preds_df):
+@_writes
+def save_batch(preds_df, threshold, model_version="", input_fingerprint=None, run_id=None):
     """
-    aggregates the current batch prediction output into driver_history
+    stores the batch and updates driver_history in a single transaction, idempotently:
+    trips are keyed by (bookingID, model_version), re-saving unchanged trips writes nothing,
+    changed ones replace their previous prediction in the driver aggregates
+
+    model_version: identifies the model that scored the batch (model_utils.ModelRuntime.version)
+    input_fingerprint: content hash of the scored file, recorded in runs
+    run_id: adds to an existing run (e.g. a stream's micro-batches) instead of starting one
+    returns dict: run_id, trips, inserted, updated, unchanged
     """
     now = datetime.utcnow().isoformat()
 
     with get_conn() as conn:
         cur = conn.cursor()
+        if run_id is None:
+            run_id = _start_run(cur, now, model_version, threshold, input_fingerprint)
+        counts = _write_batch(cur, preds_df, threshold, model_version, run_id, now, history=True)
+        stats = _count_run(cur, run_id, *counts)
+        with instrument.span("db.commit"):
+            conn.commit()
+    return stats
 
-        for driver_id, g in preds_df.groupby("driver_id"):
-            total = int(len(g))
-            dangerous = int((g["pred_label"] == 1).sum())
-            rate = dangerous / total if total else 0.0
-
-            # we assume harsh_acceleration_count exists in engineered features
-            avg_harsh = float(g["harsh_acceleration_count"].mean()) if "harsh_acceleration_count" in g.columns else 0.0
-
-            cur.execute("""
-            INSERT INTO driver_history
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(driver_id) DO UPDATE SET
-                total_trips = total_trips + excluded.total_trips,
-                dangerous_trips = dangerous_trips + excluded.dangerous_trips,
-                dangerous_rate =
-                    CAST(dangerous_trips + excluded.dangerous_trips AS REAL) /
-                    CAST(total_trips + excluded.total_trips AS REAL),
-                avg_harsh_accel = excluded.avg_harsh_accel,
-                last_updated = excluded.last_updated
-            """, (
-                int(driver_id),
-                total,
-                dangerous,
-                float(rate),
-                float(avg_harsh),
-                now,
-            ))
 
+@_writes
+def save_contributions(booking_ids, model_version, feature_cols, contributions):
+    """
+    caches per-trip feature contributions (explain.py) on the stored (bookingID, model_version) rows;
+    contributions: (trips, len(feature_cols) + 1), the bias last. trips without a stored prediction are skipped
+    returns the number of rows updated
+    """
+    values = np.ascontiguousarray(contributions, dtype="<f4")
+    if values.ndim != 2 or values.shape[1] != len(feature_cols) + 1:
+        raise ValueError(f"expected contributions of {len(feature_cols) + 1} values per trip, got {values.shape}")
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT OR IGNORE INTO model_features (model_version, feature_cols) VALUES (?, ?)",
+                    (model_version, json.dumps(list(feature_cols))))
+        before = conn.total_changes
+        with instrument.span("db.save_contributions", rows=len(values)):
+            cur.executemany(
+                "UPDATE trip_predictions SET contributions = ? WHERE bookingID = ? AND model_version = ?",
+                zip([row.tobytes() for row in values], np.asarray(booking_ids, dtype=np.int64).tolist(),
+                    repeat(model_version)),
+            )
+        updated = conn.total_changes - before
         conn.commit()
+    return updated
 
 
+@instrument.timed("db.missing_contributions")
+def missing_contributions(booking_ids, model_version):
+    """
+    the booking ids stored under model_version whose contributions are not cached yet (ascending)
+    """
+    ids = np.unique(np.asarray(booking_ids, dtype=np.int64)).tolist()
+    missing = []
+    with get_conn() as conn:
+        cur = conn.cursor()
+        for lo in range(0, len(ids), KEY_CHUNK):
+            chunk = ids[lo:lo + KEY_CHUNK]
+            cur.execute(f"""
+            SELECT bookingID FROM trip_predictions
+            WHERE bookingID IN ({", ".join("?" * len(chunk))}) AND model_version = ? AND contributions IS NULL
+            """, (*chunk, model_version))
+            missing.extend(r[0] for r in cur.fetchall())
+    return np.sort(np.asarray(missing, dtype=np.int64))
+
+
+@instrument.timed("db.fetch_contributions")
+def fetch_contributions(booking_id, model_version):
+    """
+    (feature_cols, float32 contributions with the bias last) cached for one trip, or None
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        SELECT t.contributions, m.feature_cols
+        FROM trip_predictions t
+        JOIN model_features m ON m.model_version = t.model_version
+        WHERE t.bookingID = ? AND t.model_version = ? AND t.contributions IS NOT NULL
+        """, (int(booking_id), model_version))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return json.loads(row[1]), np.frombuffer(row[0], dtype="<f4")
+
+
+@_writes
 def reset_db():
     """
     convenience for demos/testing
@@ -177,4 +786,92 @@ def reset_db():
         cur = conn.cursor()
         cur.execute("DELETE FROM trip_predictions")
         cur.execute("DELETE FROM driver_history")
+        cur.execute("DELETE FROM runs")
+        cur.execute("DELETE FROM model_features")
+        cur.execute("UPDATE db_counters SET value = 0")
         conn.commit()
+
+
+@_writes
+def rebuild_driver_history():
+    """
+    recovery: recomputes driver_history (and the db_counters) from scratch out of the current trip_predictions
+    returns the number of drivers written
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        with instrument.span("db.rebuild_driver_history"):
+            # the triggers keep total_drivers / high_risk_drivers in step with the delete + insert
+            cur.execute("DELETE FROM driver_history")
+            cur.execute(f"""
+            INSERT INTO driver_history (driver_id, {", ".join(_DRIVER_COLUMNS)}, last_updated)
+            {_driver_rows_sql(_trip_sums_sql(_CURRENT_TRIPS))}
+            """)
+            cur.execute(f"UPDATE db_counters SET value = (SELECT COUNT(*) FROM {_CURRENT_TRIPS}) WHERE name = 'total_preds'")
+            conn.commit()
+        return int(cur.execute("SELECT COUNT(*) FROM driver_history").fetchone()[0])
+
+
+def _differs(stored, expected):
+    if stored is None or expected is None:
+        return (stored is None) != (expected is None)
+    return abs(stored - expected) > CHECK_REL_TOL * max(abs(stored), abs(expected), 1.0)
+
+
+@instrument.timed("db.check_driver_history")
+def check_driver_history(limit=100):
+    """
+    compares driver_history and db_counters with a from-scratch aggregation of the current trip_predictions (read-only)
+
+    returns: dict with drivers_checked, mismatch_count and up to limit mismatches as
+    (driver_id, column, stored, expected); a driver missing on either side is reported with column "row"
+    """
+    cols = ", ".join(f"h.{c}" for c in _DRIVER_COLUMNS)
+    exp_cols = ", ".join(f"e.{c}" for c in _DRIVER_COLUMNS)
+    mismatches = []
+    count = 0
+
+    def report(*m):
+        nonlocal count
+        count += 1
+        if len(mismatches) < limit:
+            mismatches.append(m)
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        # expected rows, joined with what is stored
+        cur.execute(f"""
+        SELECT e.driver_id, h.driver_id IS NOT NULL, {exp_cols}, {cols}
+        FROM ({_driver_rows_sql(_trip_sums_sql(_CURRENT_TRIPS))}) e
+        LEFT JOIN driver_history h ON h.driver_id = e.driver_id
+        """)
+        n = len(_DRIVER_COLUMNS)
+        checked = 0
+        for row in cur:
+            checked += 1
+            driver_id, present = row[0], row[1]
+            if not present:
+                report(driver_id, "row", None, "present")
+                continue
+            for name, expected, stored in zip(_DRIVER_COLUMNS, row[2:2 + n], row[2 + n:]):
+                if _differs(stored, expected):
+                    report(driver_id, name, stored, expected)
+
+        # stored drivers without any trip
+        for (driver_id,) in cur.execute("""
+        SELECT driver_id FROM driver_history h
+        WHERE NOT EXISTS (SELECT 1 FROM trip_predictions t WHERE t.driver_id = h.driver_id AND t.is_current = 1)
+        """):
+            report(driver_id, "row", "present", None)
+
+        counters = dict(cur.execute("SELECT name, value FROM db_counters").fetchall())
+        expected = dict(zip(("total_preds", "total_drivers", "high_risk_drivers"), cur.execute("""
+        SELECT (SELECT COUNT(*) FROM trip_predictions WHERE is_current = 1),
+               (SELECT COUNT(*) FROM driver_history),
+               (SELECT COUNT(*) FROM driver_history WHERE dangerous_rate >= 0.5)
+        """).fetchone()))
+        for name, value in expected.items():
+            if counters.get(name) != value:
+                report(None, f"db_counters.{name}", counters.get(name), value)
+
+    return {"drivers_checked": checked, "mismatch_count": count, "mismatches": mismatches}
@@ -0,0 +1,61 @@
+"""
+per-trip explanations: how much each engineered feature pushed a trip's score up or down
+
+contributions are exact TreeSHAP values from the booster (ModelRuntime.contributions), in log-odds;
+a trip's contributions + the bias sum to its margin, so positive values are what made it look dangerous.
+they are computed in batches right after a batch is stored and cached on the (bookingID, model_version)
+prediction row, so the Single Trip tab reads them back instead of running the model per click
+"""
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .db import fetch_contributions, missing_contributions, save_contributions
+from .model_utils import get_runtime
+
+# features listed per trip by top_features
+TOP_FEATURES = 5
+
+
+def explain_batch(preds: pd.DataFrame, backend="model") -> int:
+    """
+    computes and caches the contributions of every stored trip of preds that has none yet under the
+    current model (trips re-scored to the same probability keep theirs); returns the number computed
+    """
+    runtime = get_runtime(backend).load()
+    todo = missing_contributions(preds["bookingID"].to_numpy(), runtime.version)
+    if len(todo) == 0:
+        return 0
+
+    with instrument.span("explain.batch", rows=len(todo)):
+        rows = preds[preds["bookingID"].isin(todo)].drop_duplicates("bookingID", keep="last")
+        contributions = runtime.contributions(rows)
+        save_contributions(rows["bookingID"].to_numpy(), runtime.version, runtime.feature_cols, contributions)
+    return len(rows)
+
+
+def explain_trip(booking_id, features: pd.DataFrame = None, backend="model"):
+    """
+    (feature_cols, contributions with the bias last) of one trip: the cached values when the trip was
+    explained with its batch, else computed from features (a one-row frame of the trip's engineered
+    features) and cached; None when neither is available
+    """
+    runtime = get_runtime(backend).load()
+    cached = fetch_contributions(booking_id, runtime.version)
+    if cached is not None:
+        return cached
+    if features is None:
+        return None
+
+    contributions = runtime.contributions(features)
+    save_contributions([booking_id], runtime.version, runtime.feature_cols, contributions)
+    return list(runtime.feature_cols), contributions[0]
+
+
+def top_features(feature_cols, contributions, k=TOP_FEATURES) -> list:
+    """
+    the k (feature, contribution) pairs that moved the score most, strongest first
+    """
+    values = np.asarray(contributions[:len(feature_cols)], dtype=np.float64)
+    order = np.argsort(-np.abs(values), kind="stable")[:k]
+    return [(feature_cols[i], float(values[i])) for i in order]
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .db import DB_PATH
+from .feature_engineer import (
+    FEATURE_COLUMNS,
+    FEATURE_REVISION,
+    SENSOR_COLUMNS,
+    SIGNAL_DTYPE,
+    THRESH,
+    _drop_missing_bookings,
+    _segment_starts,
+)
+
+FEATURE_DB_PATH = DB_PATH.parent / "gobest_features.db"
+
+# stored as one float64 blob per trip, in this order
+_VALUE_COLUMNS = FEATURE_COLUMNS[1:]
+_INT_COLUMNS = [c for c in _VALUE_COLUMNS if c.endswith("_count")]
+
+
+def feature_schema_version() -> str:
+    """
+    changes whenever THRESH, the feature list or FEATURE_REVISION changes
+    """
+    payload = json.dumps({"thresh": THRESH, "columns": FEATURE_COLUMNS, "revision": FEATURE_REVISION}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def trip_fingerprints(sensor_df: pd.DataFrame, starts: np.ndarray) -> np.ndarray:
+    """
+    one int64 per trip, derived from every sensor value of the trip in row order
+    (sensor_df sorted by (bookingID, second), starts = first row of each trip)
+    """
+    n_rows = len(sensor_df)
+    if n_rows == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # hashed in fixed dtypes, so the same readings give the same fingerprint whatever the table layout
+    h = np.zeros(n_rows, dtype=np.uint64)
+    for c in SENSOR_COLUMNS:
+        v = sensor_df[c].to_numpy(dtype=np.float64 if c == "second" else SIGNAL_DTYPE)
+        h = h * np.uint64(1099511628211) + pd.util.hash_array(v)
+
+    # mix in the row position within the trip so reordered rows change the fingerprint
+    lens = np.diff(np.append(starts, n_rows))
+    pos = np.arange(n_rows, dtype=np.uint64) - np.repeat(starts, lens).astype(np.uint64)
+    h = pd.util.hash_array(h ^ (pos * np.uint64(0x9E3779B97F4A7C15)))
+
+    fp = np.add.reduceat(h, starts) ^ lens.astype(np.uint64)
+    return fp.view(np.int64)
+
+
+class FeatureStore:
+    """
+    persistent trip-level features keyed by bookingID + sensor fingerprint
+
+    featurize() is plugged in front of the feature engine (see feature_engineer._featurizer):
+    trips whose sensor rows are unchanged since an earlier run are read back instead of recomputed
+    """
+
+    def __init__(self, path=FEATURE_DB_PATH):
+        self.path = path
+        self.version = feature_schema_version()
+        self.hits = 0
+        self.misses = 0
+        self._init()
+
+    def _conn(self):
+        return sqlite3.connect(self.path)
+
+    def _init(self):
+        with self._conn() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS trip_features (
+                bookingID INTEGER PRIMARY KEY,
+                fingerprint INTEGER NOT NULL,
+                schema_version TEXT NOT NULL,
+                features BLOB NOT NULL,
+                updated_at TEXT
+            )
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+            """)
+
+            # feature definitions changed: every stored vector is stale
+            cur.execute("SELECT value FROM store_meta WHERE key = 'schema_version'")
+            row = cur.fetchone()
+            if row is None or row[0] != self.version:
+                cur.execute("DELETE FROM trip_features")
+                cur.execute("INSERT OR REPLACE INTO store_meta VALUES ('schema_version', ?)", (self.version,))
+            conn.commit()
+
+    def _lookup(self, bids: np.ndarray, fps: np.ndarray) -> dict:
+        with self._conn() as conn:
+            cur = conn.cursor()
+            cur.execute("CREATE TEMP TABLE wanted (bookingID INTEGER PRIMARY KEY, fingerprint INTEGER)")
+            cur.executemany("INSERT INTO wanted VALUES (?, ?)", zip(bids.tolist(), fps.tolist()))
+            cur.execute("""
+            SELECT t.bookingID, t.features
+            FROM trip_features t
+            JOIN wanted w ON w.bookingID = t.bookingID AND w.fingerprint = t.fingerprint
+            WHERE t.schema_version = ?
+            """, (self.version,))
+            return dict(cur.fetchall())
+
+    def _save(self, bids: np.ndarray, fps: np.ndarray, values: np.ndarray):
+        now = datetime.utcnow().isoformat()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO trip_features VALUES (?, ?, ?, ?, ?)",
+                (
+                    (b, f, self.version, v.tobytes(), now)
+                    for b, f, v in zip(bids.tolist(), fps.tolist(), values)
+                ),
+            )
+            conn.commit()
+
+    def featurize(self, sensor_df: pd.DataFrame, compute) -> pd.DataFrame:
+        """
+        same output as compute(sensor_df), only new/changed trips are passed to compute
+        """
+        sensor_df = _drop_missing_bookings(sensor_df)
+        keys = sensor_df["bookingID"].to_numpy()
+
+        # the store is keyed by integer bookingIDs only
+        if len(keys) == 0 or not pd.api.types.is_integer_dtype(keys.dtype):
+            return compute(sensor_df)
+
+        starts = _segment_starts(keys)
+        bids = keys[starts]
+        with instrument.span("store.fingerprint", rows=len(keys), trips=len(bids)):
+            fps = trip_fingerprints(sensor_df, starts)
+
+        with instrument.span("store.lookup", trips=len(bids)) as sp:
+            stored = self._lookup(bids, fps)
+            hit = np.fromiter((b in stored for b in bids.tolist()), dtype=bool, count=len(bids))
+            sp.add(hits=int(hit.sum()))
+        self.hits += int(hit.sum())
+        self.misses += int((~hit).sum())
+
+        values = np.empty((len(bids), len(_VALUE_COLUMNS)), dtype=np.float64)
+        for i in np.flatnonzero(hit):
+            values[i] = np.frombuffer(stored[int(bids[i])], dtype=np.float64)
+
+        if not hit.all():
+            lens = np.diff(np.append(starts, len(keys)))
+            fresh = compute(sensor_df[np.repeat(~hit, lens)])
+            fresh_values = fresh[_VALUE_COLUMNS].to_numpy(dtype=np.float64)
+            values[~hit] = fresh_values
+            with instrument.span("store.save", trips=len(fresh_values)):
+                self._save(bids[~hit], fps[~hit], fresh_values)
+
+        engineered = pd.DataFrame(values, columns=_VALUE_COLUMNS)
+        engineered[_INT_COLUMNS] = engineered[_INT_COLUMNS].astype(np.int64)
+        engineered.insert(0, "bookingID", bids)
+        return engineered
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM trip_features")
+            conn.commit()
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .feature_engineer import (
+    DEFAULT_CHUNKSIZE,
+    SENSOR_COLUMNS,
+    SIGNAL_DTYPE,
+    _compact_second,
+    _prepare_safety,
+    _trip_order,
+    iter_sensor_chunks,
+    safety_booking_ids,
+)
+
+CACHE_DIR = Path(__file__).parent / ".ingest_cache"
+
+# total on-disk budget; least recently used entries are evicted past this
+CACHE_MAX_BYTES = 8 * 1024 ** 3
+
+# bump when the on-disk layout changes, old entries are then simply never hit again
+CACHE_FORMAT = 2
+
+# columns are stored in the SensorTable dtypes: float32 signals, int32 second (float64 if fractional)
+_SENSOR_DTYPES = {c: (np.float64 if c == "second" else SIGNAL_DTYPE) for c in SENSOR_COLUMNS}
+
+
+# ============================================================
+# fingerprints
+# ============================================================
+
+def _index_path() -> Path:
+    return CACHE_DIR / "index.json"
+
+
+def _load_index() -> dict:
+    try:
+        return json.loads(_index_path().read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _save_index(index: dict):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _index_path().with_suffix(".tmp")
+    tmp.write_text(json.dumps(index), encoding="utf-8")
+    os.replace(tmp, _index_path())
+
+
+def file_fingerprint(path) -> str:
+    """
+    content hash of a file; the (size, mtime) of the last hash is remembered,
+    so unchanged files are not re-read on later runs
+    """
+    path = Path(path).resolve()
+    st = path.stat()
+
+    index = _load_index()
+    known = index.get(str(path))
+    if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+        return known["hash"]
+
+    h = hashlib.blake2b(digest_size=20)
+    with instrument.span("cache.hash_file", bytes=st.st_size), open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+
+    index[str(path)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+    _save_index(index)
+    return digest
+
+
+# ============================================================
+# entries
+# ============================================================
+
+def _entry_dir(kind: str, digest: str) -> Path:
+    return CACHE_DIR / f"{kind}-v{CACHE_FORMAT}-{digest}"
+
+
+def _touch(entry: Path):
+    # marks the entry as recently used for LRU eviction
+    os.utime(entry / "meta.json")
+
+
+def _write_entry(entry: Path, write_fn, meta: dict):
+    """
+    builds the entry in a temp dir and renames it into place, so a crash never leaves half an entry
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = entry.with_name(entry.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    try:
+        write_fn(tmp)
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        if entry.exists():
+            shutil.rmtree(entry)
+        os.replace(tmp, entry)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _build_sensor_entry(sensor_path, safety_df: pd.DataFrame, chunksize: int, booking_col: str = None):
+    """
+    one parse of the csv into compact arrays, then a single lexsort by (bookingID, second)
+    """
+    parts = {c: [] for c in ["bookingID"] + SENSOR_COLUMNS}
+    for chunk in iter_sensor_chunks(sensor_path, safety_df, chunksize, booking_col=booking_col):
+        parts["bookingID"].append(chunk["bookingID"].to_numpy(dtype=np.int64))
+        for c in SENSOR_COLUMNS:
+            parts[c].append(chunk[c].to_numpy())
+
+    cols = {}
+    for c, arrs in parts.items():
+        dtype = np.int64 if c == "bookingID" else _SENSOR_DTYPES[c]
+        cols[c] = np.concatenate(arrs).astype(dtype, copy=False) if arrs else np.zeros(0, dtype=dtype)
+        arrs.clear()
+    # whole-file decision: int32 only if no chunk had a fractional second
+    cols["second"] = _compact_second(cols["second"])
+
+    order = _trip_order(cols["bookingID"], cols["second"])
+
+    def write(tmp: Path):
+        for c in list(cols):
+            np.save(tmp / f"{c}.npy", cols.pop(c)[order])
+
+    return write, len(order)
+
+
+def _sensor_key(sensor_path, safety_df: pd.DataFrame, booking_col: str = None) -> str:
+    """
+    entry key of a sensor table: the csv content + what decides its bookingID column, i.e. booking_col
+    and the safety_labels bookingIDs the column is guessed from
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(file_fingerprint(sensor_path).encode())
+    h.update(json.dumps(booking_col).encode())
+    h.update(safety_booking_ids(safety_df).astype("<i8").tobytes())
+    return h.hexdigest()
+
+
+def load_sensor_table(sensor_path, safety_df: pd.DataFrame, chunksize: int = DEFAULT_CHUNKSIZE,
+                      booking_col: str = None) -> pd.DataFrame:
+    """
+    sensor_data as int64 bookingID + typed SENSOR_COLUMNS, sorted by (bookingID, second)
+
+    first call converts the csv; later calls memory-map the cached columns (no parsing, no sort).
+    another booking_col or safety file gets its own entry (see _sensor_key)
+    """
+    safety_df = _prepare_safety(safety_df)
+    entry = _entry_dir("sensor", _sensor_key(sensor_path, safety_df, booking_col))
+    if not (entry / "meta.json").exists():
+        with instrument.span("cache.build_sensor") as sp:
+            write, n_rows = _build_sensor_entry(sensor_path, safety_df, chunksize, booking_col)
+            _write_entry(entry, write, {"source": str(sensor_path), "rows": n_rows})
+            sp.add(rows=n_rows)
+        evict()
+    _touch(entry)
+
+    with instrument.span("cache.map_sensor") as sp:
+        cols = {c: np.load(entry / f"{c}.npy", mmap_mode="r") for c in ["bookingID"] + SENSOR_COLUMNS}
+        sp.add(rows=len(cols["bookingID"]), bytes=sum(a.nbytes for a in cols.values()))
+        return pd.DataFrame(cols, copy=False)
+
+
+def _table_columns(df: pd.DataFrame) -> list:
+    """
+    [{name, dtype, text}] of a parsed table; text columns are stored as fixed-width unicode + a missing mask
+    """
+    return [{"name": str(c), "dtype": str(df[c].dtype), "text": not isinstance(df[c].dtype, np.dtype)
+             or df[c].dtype == object} for c in df.columns]
+
+
+def _write_table(tmp: Path, df: pd.DataFrame, columns: list):
+    # plain npy per column, nothing that needs pickle to read back
+    for i, col in enumerate(columns):
+        values = df.iloc[:, i]
+        if col["text"]:
+            missing = values.isna().to_numpy()
+            np.save(tmp / f"{i}.missing.npy", missing)
+            np.save(tmp / f"{i}.npy", values.astype(object).where(~missing, "").to_numpy().astype(str))
+        else:
+            np.save(tmp / f"{i}.npy", values.to_numpy())
+
+
+def _read_table(entry: Path, columns: list) -> pd.DataFrame:
+    data = {}
+    for i, col in enumerate(columns):
+        values = np.load(entry / f"{i}.npy")
+        if col["text"]:
+            values = values.astype(object)
+            values[np.load(entry / f"{i}.missing.npy")] = None
+            data[col["name"]] = pd.Series(values, dtype=object).astype(col["dtype"])
+        else:
+            data[col["name"]] = values
+    return pd.DataFrame(data)
+
+
+def load_table(path) -> pd.DataFrame:
+    """
+    small tables (driver_data, safety_labels): parsed once, then read back from one npy per column
+    """
+    entry = _entry_dir("table", file_fingerprint(path))
+    if not (entry / "meta.json").exists():
+        with instrument.span("csv.parse_table", bytes=os.path.getsize(path)):
+            df = pd.read_csv(path)
+        columns = _table_columns(df)
+        _write_entry(entry, lambda tmp: _write_table(tmp, df, columns),
+                     {"source": str(path), "rows": len(df), "columns": columns})
+        evict()
+    _touch(entry)
+    meta = json.loads((entry / "meta.json").read_text(encoding="utf-8"))
+    return _read_table(entry, meta["columns"])
+
+
+def load_raw_tables(sensor_path, driver_path, safety_path, chunksize: int = DEFAULT_CHUNKSIZE, booking_col: str = None):
+    """
+    cached equivalent of reading the 3 raw csv files;
+    the sensor table comes back clean + sorted, ready for engineer_features_from_sorted
+    """
+    driver_df = load_table(driver_path)
+    safety_df = load_table(safety_path)
+    sensor_df = load_sensor_table(sensor_path, safety_df, chunksize=chunksize, booking_col=booking_col)
+    return sensor_df, driver_df, safety_df
+
+
+# ============================================================
+# maintenance
+# ============================================================
+
+def _entries():
+    if not CACHE_DIR.exists():
+        return []
+    return [p for p in CACHE_DIR.iterdir() if p.is_dir() and (p / "meta.json").exists()]
+
+
+def _dir_size(p: Path) -> int:
+    return sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+
+
+def cache_size() -> int:
+    return sum(_dir_size(p) for p in _entries())
+
+
+def evict(max_bytes: int = CACHE_MAX_BYTES) -> int:
+    """
+    drops least recently used entries until the cache fits in max_bytes; returns bytes freed
+    """
+    entries = sorted(_entries(), key=lambda p: (p / "meta.json").stat().st_mtime)
+    sizes = {p: _dir_size(p) for p in entries}
+    total = sum(sizes.values())
+
+    freed = 0
+    # the newest entry is always kept, even if it alone exceeds the budget
+    for p in entries[:-1]:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(p, ignore_errors=True)
+        total -= sizes[p]
+        freed += sizes[p]
+    return freed
+
+
+def clear_cache() -> int:
+    """
+    removes every cached table and the fingerprint index; returns bytes freed
+    """
+    freed = cache_size()
+    if CACHE_DIR.exists():
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    return freed
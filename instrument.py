@@ -0,0 +1,321 @@
+"""
+lightweight stage instrumentation: timers, row / trip / byte counters and peak memory
+
+    with instrument.span("features.trip_features", rows=len(df)) as sp:
+        ...
+        sp.add(trips=n)
+
+spans are only recorded inside a session(); outside one span() hands back a shared no-op object,
+so the hot paths pay one global lookup + call. a session can export its spans as json or in the
+chrome trace format (chrome://tracing, perfetto), and capture() adds cProfile / tracemalloc for one run
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+# rss sampling interval while a session is active
+SAMPLE_SEC = 0.05
+
+_recorder = None
+
+
+def _rss_reader():
+    """
+    picks the cheapest way to read the current rss on this platform, None if there is none
+    """
+    try:
+        import psutil
+        proc = psutil.Process()
+        return lambda: proc.memory_info().rss
+    except ImportError:
+        pass
+    try:
+        page = os.sysconf("SC_PAGE_SIZE")
+        with open("/proc/self/statm", "rb"):
+            pass
+    except (AttributeError, ValueError, OSError):
+        return None
+
+    def statm():
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * page
+    return statm
+
+
+_read_rss = _rss_reader()
+
+
+def _rss_bytes():
+    """
+    current resident set size, None where it can't be read
+    """
+    return _read_rss() if _read_rss is not None else None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counters):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("rec", "name", "counters", "t0")
+
+    def __init__(self, rec, name, counters):
+        self.rec = rec
+        self.name = name
+        self.counters = counters
+
+    def __enter__(self):
+        self.rec._open(self)
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter_ns()
+        self.rec._close(self, t1)
+        return False
+
+    def add(self, **counters):
+        for k, v in counters.items():
+            self.counters[k] = self.counters.get(k, 0) + int(v)
+
+
+class Recorder:
+    """
+    spans + counters of one session (thread-safe); a sampler thread tracks the rss peak
+    """
+
+    def __init__(self, sample_memory=True):
+        self.t0 = time.perf_counter_ns()
+        self.spans = []
+        self.counters = {}
+        self.peak_rss = _rss_bytes()
+        self._lock = threading.Lock()
+        self._span_peaks = {}
+        self._stop = threading.Event()
+        self._sampler = None
+        if sample_memory and self.peak_rss is not None:
+            self._sampler = threading.Thread(target=self._sample, name="gobest-rss-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_SEC):
+            self._observe(_rss_bytes())
+
+    def _observe(self, rss):
+        if rss is None:
+            return
+        with self._lock:
+            if self.peak_rss is None or rss > self.peak_rss:
+                self.peak_rss = rss
+            for k in self._span_peaks:
+                if rss > self._span_peaks[k]:
+                    self._span_peaks[k] = rss
+
+    def _open(self, span):
+        rss = _rss_bytes()
+        self._observe(rss)
+        with self._lock:
+            self._span_peaks[id(span)] = rss or 0
+
+    def _close(self, span, t1):
+        rss = _rss_bytes()
+        self._observe(rss)
+        with self._lock:
+            peak = self._span_peaks.pop(id(span), rss)
+            self.spans.append({
+                "name": span.name,
+                "start_us": (span.t0 - self.t0) / 1e3,
+                "dur_us": (t1 - span.t0) / 1e3,
+                "tid": threading.get_ident(),
+                "thread": threading.current_thread().name,
+                "counters": dict(span.counters),
+                "peak_rss": peak,
+            })
+
+    def span(self, name, counters):
+        return _Span(self, name, counters)
+
+    def count(self, name, n):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def close(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    # ---------------- reports ----------------
+
+    def summary(self) -> dict:
+        """
+        per span name: calls, total seconds, summed counters, peak rss
+        """
+        out = {}
+        for s in self.spans:
+            agg = out.setdefault(s["name"], {"calls": 0, "seconds": 0.0, "peak_rss": 0})
+            agg["calls"] += 1
+            agg["seconds"] += s["dur_us"] / 1e6
+            agg["peak_rss"] = max(agg["peak_rss"], s["peak_rss"] or 0)
+            for k, v in s["counters"].items():
+                agg[k] = agg.get(k, 0) + v
+        return out
+
+    def to_dict(self) -> dict:
+        return {
+            "peak_rss": self.peak_rss,
+            "counters": dict(self.counters),
+            "summary": self.summary(),
+            "spans": list(self.spans),
+        }
+
+    def to_chrome_trace(self) -> dict:
+        pid = os.getpid()
+        events = [
+            {
+                "name": s["name"],
+                "cat": s["name"].split(".", 1)[0],
+                "ph": "X",
+                "ts": s["start_us"],
+                "dur": s["dur_us"],
+                "pid": pid,
+                "tid": s["tid"],
+                "args": {**s["counters"], "peak_rss_mb": round((s["peak_rss"] or 0) / 1e6, 1)},
+            }
+            for s in self.spans
+        ]
+        threads = {s["tid"]: s["thread"] for s in self.spans}
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path, fmt=None):
+        """
+        fmt: "json" (spans + summary) or "chrome"; default from the file name (*.trace.json -> chrome)
+        """
+        path = Path(path)
+        if fmt is None:
+            fmt = "chrome" if path.name.endswith(".trace.json") else "json"
+        payload = self.to_chrome_trace() if fmt == "chrome" else self.to_dict()
+        path.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+        return path
+
+    def status_line(self, top=4) -> str:
+        """
+        short text for a status bar: slowest span names + peak memory
+        """
+        summary = self.summary()
+        slow = sorted(summary.items(), key=lambda kv: kv[1]["seconds"], reverse=True)[:top]
+        parts = [f"{name} {agg['seconds']:.2f}s" for name, agg in slow]
+        if self.peak_rss:
+            parts.append(f"peak {self.peak_rss / 1e6:,.0f} MB")
+        return " | ".join(parts)
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def span(name, **counters):
+    """
+    times the block under name while a session is active (no-op otherwise)
+    """
+    rec = _recorder
+    if rec is None:
+        return _NULL
+    return rec.span(name, counters)
+
+
+def count(name, n=1):
+    rec = _recorder
+    if rec is not None:
+        rec.count(name, n)
+
+
+def timed(name):
+    """
+    decorator form of span() for whole functions
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+@contextmanager
+def session(sample_memory=True):
+    """
+    records every span / counter until the block exits; yields the Recorder
+    (one session at a time, sessions don't nest)
+    """
+    global _recorder
+    if _recorder is not None:
+        raise RuntimeError("an instrumentation session is already active")
+    rec = Recorder(sample_memory=sample_memory)
+    _recorder = rec
+    try:
+        yield rec
+    finally:
+        _recorder = None
+        rec.close()
+
+
+@contextmanager
+def capture(out_dir, profile=True, trace_malloc=True, top=30):
+    """
+    opt-in deep capture for a single run (slow: cProfile hooks every python call):
+    writes profile.prof + profile.txt (cumulative time) and tracemalloc.txt (top allocation sites)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    prof = cProfile.Profile() if profile else None
+    started_tracemalloc = trace_malloc and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(25)
+    if prof is not None:
+        prof.enable()
+    try:
+        yield out_dir
+    finally:
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(out_dir / "profile.prof")
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+            (out_dir / "profile.txt").write_text(buf.getvalue(), encoding="utf-8")
+
+        if trace_malloc and tracemalloc.is_tracing():
+            snap = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f"traced current {current / 1e6:,.1f} MB, peak {peak / 1e6:,.1f} MB", ""]
+            lines += [str(stat) for stat in snap.statistics("lineno")[:top]]
+            (out_dir / "tracemalloc.txt").write_text("\n".join(lines), encoding="utf-8")
+            if started_tracemalloc:
+                tracemalloc.stop()
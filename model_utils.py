@@ -0,0 +1,230 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .db import save_batch
+from .feature_engineer import FEATURE_COLUMNS, engineer_features_from_raw_tables
+
+MODELS_DIR = Path(__file__).parent / "models"
+MODEL_PATH = MODELS_DIR / "xgboost_best_model.joblib"
+SCALER_PATH = MODELS_DIR / "xgboost_scaler.joblib"
+FEATURE_COLS_PATH = MODELS_DIR / "xgboost_feature_cols.json"
+
+# "model": the estimator's own predict_proba, "numpy": flattened trees (tree_eval.FlatTreeEnsemble)
+BACKENDS = ("model", "numpy")
+
+# rows per predict call; bounds the float32 scratch matrix
+PREDICT_BATCH_ROWS = 65_536
+
+# every column engineer_features_from_raw_tables can hand to the model
+_ENGINEERED_COLUMNS = set(FEATURE_COLUMNS[1:]) | {"driver_id"}
+
+
+def load_artifacts():
+    """
+    returns (model, scaler, feature_cols) saved by xgboost_training_ablation.ipynb
+    """
+    model = joblib.load(MODEL_PATH)
+    scaler = joblib.load(SCALER_PATH) if SCALER_PATH.exists() else None
+    feature_cols = json.loads(FEATURE_COLS_PATH.read_text(encoding="utf-8"))
+    return model, scaler, feature_cols
+
+
+def artifacts_version() -> str:
+    """
+    content hash of the saved model, scaler and feature order; stored predictions are keyed by it
+
+    the same for every backend: "model" and "numpy" score the same artifacts and agree to ~1e-7, so
+    wherever stored scores of one version are compared it is within db.SCORE_TOLERANCE, never exactly
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for path in (MODEL_PATH, SCALER_PATH, FEATURE_COLS_PATH):
+        h.update(path.name.encode("utf-8"))
+        if path.exists():
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+class ModelRuntime:
+    """
+    model + scaler + feature order, loaded once on first use and kept resident
+
+    predict_proba() builds one contiguous float32 matrix in the saved feature order
+    and scores it in fixed-size batches
+    """
+
+    def __init__(self, backend="model", batch_rows=PREDICT_BATCH_ROWS):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown model backend {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.batch_rows = int(batch_rows)
+
+        self.model = None
+        self.scaler = None
+        self.feature_cols = None
+        self.version = None
+        self._predict = None
+        self._lock = threading.Lock()
+
+    def load(self) -> "ModelRuntime":
+        with self._lock:
+            if self._predict is None:
+                with instrument.span("model.load"):
+                    model, scaler, feature_cols = load_artifacts()
+                    _check_feature_order(model, scaler, feature_cols)
+                    version = artifacts_version()
+
+                    if self.backend == "numpy":
+                        from .tree_eval import FlatTreeEnsemble
+                        predict = FlatTreeEnsemble.from_xgboost(model).predict_proba
+                    else:
+                        predict = model.predict_proba
+
+                self.model, self.scaler, self.feature_cols, self.version = model, scaler, feature_cols, version
+                self._predict = predict
+        return self
+
+    def _batches(self, engineered: pd.DataFrame):
+        """
+        (offset, scaled float32 batch) over engineered in the saved feature order
+        """
+        missing = [c for c in self.feature_cols if c not in engineered.columns]
+        if missing:
+            raise ValueError(f"engineered features are missing model columns: {missing[:10]}")
+
+        X = np.ascontiguousarray(engineered[self.feature_cols].to_numpy(dtype=np.float64))
+        for lo in range(0, len(X), self.batch_rows):
+            batch = X[lo:lo + self.batch_rows]
+            if self.scaler is not None:
+                batch = self.scaler.transform(batch)
+            # xgboost scores float32 internally; converting once here skips its own copy
+            yield lo, np.ascontiguousarray(batch, dtype=np.float32)
+
+    def predict_proba(self, engineered: pd.DataFrame) -> np.ndarray:
+        """
+        probability of the dangerous class for every row of engineered
+        """
+        self.load()
+
+        with instrument.span("model.predict", rows=len(engineered)):
+            out = np.empty(len(engineered), dtype=np.float64)
+            for lo, batch in self._batches(engineered):
+                out[lo:lo + len(batch)] = self._predict(batch)[:, 1]
+            return out
+
+    def contributions(self, engineered: pd.DataFrame) -> np.ndarray:
+        """
+        per-feature contributions to every row's log-odds (exact TreeSHAP, the booster's pred_contribs),
+        float32 (rows, len(feature_cols) + 1): feature_cols order, then the bias; a row sums to the margin
+
+        always computed by the xgboost booster, whichever backend scores the batch
+        """
+        self.load()
+
+        booster = self.model.get_booster() if hasattr(self.model, "get_booster") else None
+        if booster is None:
+            raise ValueError("feature contributions need an xgboost model")
+        import xgboost as xgb
+
+        # same rounds as predict_proba when the model was trained with early stopping
+        best = getattr(self.model, "best_iteration", None)
+        rounds = (0, best + 1) if best is not None else (0, 0)
+
+        with instrument.span("model.contributions", rows=len(engineered)):
+            out = np.empty((len(engineered), len(self.feature_cols) + 1), dtype=np.float32)
+            for lo, batch in self._batches(engineered):
+                matrix = xgb.DMatrix(batch, feature_names=booster.feature_names)
+                out[lo:lo + len(batch)] = booster.predict(matrix, pred_contribs=True, iteration_range=rounds)
+            return out
+
+
+def _check_feature_order(model, scaler, feature_cols):
+    """
+    the saved column order must be producible by the feature engine and agree with the
+    names the scaler / booster were fitted with (when they recorded any)
+    """
+    unknown = [c for c in feature_cols if c not in _ENGINEERED_COLUMNS]
+    if unknown:
+        raise ValueError(f"model expects columns the feature engine does not produce: {unknown[:10]}")
+
+    scaler_cols = getattr(scaler, "feature_names_in_", None)
+    if scaler_cols is not None and list(scaler_cols) != list(feature_cols):
+        raise ValueError("scaler was fitted with a different feature order than xgboost_feature_cols.json")
+    n_in = getattr(scaler, "n_features_in_", None)
+    if n_in is not None and n_in != len(feature_cols):
+        raise ValueError(f"scaler expects {n_in} features, xgboost_feature_cols.json lists {len(feature_cols)}")
+
+    booster = model.get_booster() if hasattr(model, "get_booster") else None
+    names = getattr(booster, "feature_names", None)
+    if names is not None and list(names) != list(feature_cols):
+        raise ValueError("model was fitted with a different feature order than xgboost_feature_cols.json")
+
+
+_runtimes = {}
+_runtimes_lock = threading.Lock()
+
+
+def get_runtime(backend="model") -> ModelRuntime:
+    """
+    the process-wide runtime for a backend (artifacts are loaded on first predict)
+    """
+    with _runtimes_lock:
+        if backend not in _runtimes:
+            _runtimes[backend] = ModelRuntime(backend=backend)
+        return _runtimes[backend]
+
+
+def reset_runtime():
+    """
+    drops the resident models, e.g. after new artifacts were saved into MODELS_DIR
+    """
+    with _runtimes_lock:
+        _runtimes.clear()
+
+
+def score_features(engineered: pd.DataFrame, threshold=0.5, backend="model") -> pd.DataFrame:
+    """
+    adds pred_proba / pred_label to trip-level features, nothing is written to the history
+    """
+    preds = engineered.copy()
+    preds["pred_proba"] = get_runtime(backend).predict_proba(engineered)
+    preds["pred_label"] = (preds["pred_proba"] >= float(threshold)).astype(int)
+    return preds
+
+
+def predict_from_features(engineered: pd.DataFrame, threshold=0.5, backend="model", explain=False) -> pd.DataFrame:
+    """
+    scores trip-level features (output of engineer_features_from_raw_tables)
+    and stores the batch into the sqlite history; explain also caches per-trip feature contributions
+    """
+    preds = score_features(engineered, threshold=threshold, backend=backend)
+    save_batch(preds, threshold, model_version=get_runtime(backend).version)
+    if explain:
+        from .explain import explain_batch
+        explain_batch(preds, backend=backend)
+    return preds
+
+
+def predict_from_raw(sensor_df, driver_df, safety_df, threshold=0.5, backend="model", explain=False,
+                     scorer="xgboost") -> pd.DataFrame:
+    """
+    scores raw tables and stores the batch; scorer picks the model (scorers.SCORERS), "sequence" scores the
+    readings themselves (explain only applies to "xgboost")
+    """
+    engineered = engineer_features_from_raw_tables(sensor_df, driver_df, safety_df)
+    if scorer == "xgboost":
+        return predict_from_features(engineered, threshold=threshold, backend=backend, explain=explain)
+
+    from .feature_engineer import SensorTable, _prepare_safety
+    from .scorers import get_scorer
+    model = get_scorer(scorer, backend)
+    table = SensorTable.from_frame(sensor_df, _prepare_safety(safety_df))
+    preds = model.score(engineered, table, threshold=threshold)
+    save_batch(preds, threshold, model_version=model.version)
+    return preds
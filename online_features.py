@@ -0,0 +1,248 @@
+"""
+online (per-sample) version of the trip-level features
+
+TripAccumulator.update() folds one sensor reading into O(1) state: running sums / counts / extrema,
+Welford mean + variance for the std features, and fixed-size ring buffers for the 5s / 10s rolling
+windows. features() can be read at any point; once every reading of a trip has been fed in
+(ordered by second, as in the batch engine) it equals the trip's row from trip_features_from_arrays
+up to summation-order rounding (~1e-12 relative)
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .feature_engineer import FEATURE_COLUMNS, SENSOR_COLUMNS, THRESH
+
+# columns of the batch feature frame: trip features + what _attach_safety_meta adds
+FRAME_COLUMNS = FEATURE_COLUMNS + ["driver_id", "label"]
+
+# TripAccumulator.update() positional order of a reading's fields
+UPDATE_FIELDS = ["second", "speed", "accuracy", "acceleration_x", "acceleration_y", "acceleration_z",
+                 "gyro_x", "gyro_y", "gyro_z", "bearing"]
+
+
+class _Ring:
+    """
+    last `size` values, newest first when iterated
+    """
+
+    def __init__(self, size):
+        self.buf = [0.0] * size
+        self.size = size
+        self.n = 0
+        self.head = -1
+
+    def push(self, x):
+        self.head = (self.head + 1) % self.size
+        self.buf[self.head] = x
+        self.n = min(self.n + 1, self.size)
+
+    def __iter__(self):
+        for k in range(self.n):
+            yield self.buf[(self.head - k) % self.size]
+
+
+class _Welford:
+    """
+    running mean + population variance
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    @property
+    def var(self):
+        return self.m2 / self.n if self.n else 0.0
+
+
+class TripAccumulator:
+    """
+    feature state of one trip, updated reading by reading
+    """
+
+    def __init__(self, booking_id=None, driver_id=-1):
+        self.booking_id = booking_id
+        # -1 like a trip without a safety_labels row in the batch path
+        self.driver_id = int(driver_id)
+        self.n = 0
+
+        self._w5 = int(THRESH["w5"])
+        self._w10 = int(THRESH["w10"])
+        self._speed5 = _Ring(self._w5)
+        self._ax10 = _Ring(self._w10)
+        self._gz5 = _Ring(self._w5)
+
+        self._sec_min = math.inf
+        self._sec_max = -math.inf
+        self._prev = None  # (speed, ax, ay, az) of the previous reading
+
+        self._sum = dict.fromkeys(
+            ["speed", "accuracy", "accel_mag", "gyro_abs", "speed_accel", "abs_speed_diff", "jerk_x",
+             "speed_std_5s", "ax_max_10s", "gz_range_5s"], 0.0)
+        self._count = dict.fromkeys(
+            ["harsh_accel", "harsh_brake", "sharp_turn", "speeding", "phone", "gz_peak", "stable",
+             "harsh_decel_high_speed", "speed_std_5s"], 0)
+        self._max = {"accel_mag": -math.inf, "gyro_mag": -math.inf, "jerk_y": -math.inf}
+
+        self._accel_mag = _Welford()
+        self._jerk_z = _Welford()
+        self._jerk_mag = _Welford()
+
+    def update(self, second, speed, accuracy, acceleration_x, acceleration_y, acceleration_z,
+               gyro_x, gyro_y, gyro_z, bearing=0.0):
+        """
+        folds in one reading (missing values should already be 0.0, as in the batch coercion)
+        """
+        ax, ay, az = float(acceleration_x), float(acceleration_y), float(acceleration_z)
+        gx, gy, gz = float(gyro_x), float(gyro_y), float(gyro_z)
+        speed, accuracy, second = float(speed), float(accuracy), float(second)
+        s, c, m = self._sum, self._count, self._max
+
+        self.n += 1
+        self._sec_min = min(self._sec_min, second)
+        self._sec_max = max(self._sec_max, second)
+
+        accel_mag = math.sqrt(ax*ax + ay*ay + az*az)
+        gyro_mag = math.sqrt(gx*gx + gy*gy + gz*gz)
+        agx, agy, agz = abs(gx), abs(gy), abs(gz)
+
+        s["speed"] += speed
+        s["accuracy"] += accuracy
+        s["accel_mag"] += accel_mag
+        s["gyro_abs"] += agx + agy + agz
+        s["speed_accel"] += speed * accel_mag
+        m["accel_mag"] = max(m["accel_mag"], accel_mag)
+        m["gyro_mag"] = max(m["gyro_mag"], gyro_mag)
+        self._accel_mag.push(accel_mag)
+
+        harsh_brake = ax < THRESH["harsh_brake"]
+        c["harsh_accel"] += ax > THRESH["harsh_accel"]
+        c["harsh_brake"] += harsh_brake
+        c["sharp_turn"] += agz > THRESH["sharp_turn_gyro_z"]
+        c["speeding"] += speed > THRESH["speeding"]
+        c["phone"] += accuracy > THRESH["gps_bad"]
+        c["gz_peak"] += agz > 1.5
+        c["stable"] += (agx < 0.5) and (agy < 0.5) and (agz < 0.5)
+        c["harsh_decel_high_speed"] += harsh_brake and speed > THRESH["high_speed"]
+
+        # jerk / speed change against the previous reading (0 for the first one)
+        if self._prev is None:
+            jx = jy = jz = 0.0
+        else:
+            p_speed, p_ax, p_ay, p_az = self._prev
+            s["abs_speed_diff"] += abs(speed - p_speed)
+            jx, jy, jz = ax - p_ax, ay - p_ay, az - p_az
+        self._prev = (speed, ax, ay, az)
+
+        s["jerk_x"] += jx
+        m["jerk_y"] = max(m["jerk_y"], jy)
+        self._jerk_z.push(jz)
+        self._jerk_mag.push(math.sqrt(jx*jx + jy*jy + jz*jz))
+
+        # rolling windows: the current reading plus up to w-1 previous ones
+        self._speed5.push(speed)
+        self._ax10.push(ax)
+        self._gz5.push(gz)
+
+        std = self._window_std(self._speed5)
+        if std is not None:
+            s["speed_std_5s"] += std
+            c["speed_std_5s"] += 1
+        s["ax_max_10s"] += max(self._ax10)
+        s["gz_range_5s"] += max(self._gz5) - min(self._gz5)
+
+    @staticmethod
+    def _window_std(ring):
+        # sample std (ddof=1) summed in the same order as feature_engineer._rolling_std
+        if ring.n < 2:
+            return None
+        total = 0.0
+        for x in ring:
+            total += x
+        mean = total / ring.n
+        ssq = 0.0
+        for x in ring:
+            d = x - mean
+            ssq += d * d
+        return math.sqrt(ssq / (ring.n - 1.0))
+
+    def update_row(self, row):
+        """
+        row: mapping with SENSOR_COLUMNS keys (e.g. a dict or a pandas row)
+        """
+        self.update(**{k: row[k] for k in SENSOR_COLUMNS})
+
+    def features(self) -> dict:
+        """
+        current trip-level features, keyed like FEATURE_COLUMNS
+        """
+        n = self.n
+        if n == 0:
+            return {c: (self.booking_id if c == "bookingID" else np.nan) for c in FEATURE_COLUMNS}
+        s, c, m = self._sum, self._count, self._max
+
+        return {
+            "bookingID": self.booking_id,
+            "trip_duration_sec": max(0.0, self._sec_max - self._sec_min),
+            "total_distance_km": s["speed"] / 1000.0,
+            "avg_gps_accuracy": s["accuracy"] / n,
+            "harsh_acceleration_count": c["harsh_accel"],
+            "harsh_braking_count": c["harsh_brake"],
+            "sharp_turn_count": c["sharp_turn"],
+            "speeding_event_count": c["speeding"],
+            "phone_distraction_count": c["phone"],
+            "avg_acceleration_magnitude": s["accel_mag"] / n,
+            "max_acceleration_magnitude": m["accel_mag"],
+            "speed_rolling_std_5s": s["speed_std_5s"] / c["speed_std_5s"] if c["speed_std_5s"] else np.nan,
+            "accel_x_rolling_max_10s": s["ax_max_10s"] / n,
+            "gyro_z_rolling_range_5s": s["gz_range_5s"] / n,
+            "speed_change_rate": s["abs_speed_diff"] / (n - 1) if n > 1 else 0.0,
+            "gyro_total_rotation": s["gyro_abs"],
+            "gyro_magnitude_max": m["gyro_mag"],
+            "gyro_z_peak_count": c["gz_peak"],
+            "gyro_stability_ratio": c["stable"] / n,
+            "speed_accel_product": s["speed_accel"] / n,
+            "harsh_decel_at_high_speed_count": c["harsh_decel_high_speed"],
+            "accel_variance_normalized_by_speed": self._accel_mag.var / (s["speed"] / n + 1e-6),
+            "jerk_x_mean": s["jerk_x"] / n,
+            "jerk_y_max": m["jerk_y"],
+            "jerk_z_std": math.sqrt(self._jerk_z.var),
+            "jerk_magnitude_std": math.sqrt(self._jerk_mag.var),
+        }
+
+    def feature_frame(self) -> pd.DataFrame:
+        """
+        features() as a one-row frame shaped like the batch feature frame (see feature_frame)
+        """
+        return feature_frame([self])
+
+    def risk(self, runtime=None) -> float:
+        """
+        current probability of the dangerous class (process-wide model runtime by default)
+        """
+        if self.n == 0:
+            return float("nan")
+        if runtime is None:
+            from .model_utils import get_runtime
+            runtime = get_runtime()
+        return float(runtime.predict_proba(self.feature_frame())[0])
+
+
+def feature_frame(accumulators) -> pd.DataFrame:
+    """
+    one row per accumulator with the columns / dtypes of the batch feature frame (FRAME_COLUMNS, label
+    unknown), ready for model_utils.score_features / ModelRuntime / db.save_batch
+    """
+    frame = pd.DataFrame([acc.features() for acc in accumulators], columns=FEATURE_COLUMNS)
+    frame["driver_id"] = np.array([acc.driver_id for acc in accumulators], dtype=int)
+    frame["label"] = np.nan
+    return frame
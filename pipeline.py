@@ -0,0 +1,181 @@
+"""
+batch pipeline shared by the GUI and headless runs: raw csv files -> features -> predictions -> history
+
+no tkinter here; progress goes out through a plain report(event) callback
+"""
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from . import instrument
+from .db import save_batch
+from .explain import explain_batch
+from .feature_engineer import (
+    DEFAULT_CHUNKSIZE,
+    SensorTable,
+    engineer_features_from_csv,
+    engineer_features_from_sorted,
+)
+from .feature_store import FeatureStore
+from .ingest_cache import file_fingerprint, load_sensor_table, load_table
+from .schema import validate_inputs
+from .scorers import get_scorer
+
+STAGES = ("validate", "parse", "features", "predict", "persist", "explain")
+
+
+class BatchCancelled(Exception):
+    pass
+
+
+class _Progress:
+    """
+    stage timings + trip counter; every update is forwarded to report(event) as a dict:
+    stage, fraction (of the current stage, None if unknown), trips, elapsed (of the current stage),
+    timings (seconds of every finished stage)
+    """
+
+    def __init__(self, report=None, cancel_event=None):
+        self.report = report
+        self.cancel_event = cancel_event
+        self.timings = {}
+        self.trips = 0
+        self.current = None
+        self._t0 = None
+
+    def check(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise BatchCancelled("batch cancelled")
+
+    @contextmanager
+    def stage(self, stage):
+        """
+        with progress.stage(name): one stage, timed when it completes; also a "stage.<name>" span while an
+        instrument session is recording, closed even when the stage raises (schema error, cancel, I/O)
+        """
+        self.check()
+        self.current = stage
+        with instrument.span(f"stage.{stage}"):
+            self._t0 = time.perf_counter()
+            self._emit(0.0)
+            yield
+            self.timings[stage] = time.perf_counter() - self._t0
+        self._emit(1.0)
+
+    def trips_done(self, n, fraction):
+        # also the cancellation point inside feature engineering
+        self.trips += int(n)
+        self._emit(fraction)
+        self.check()
+
+    def _emit(self, fraction):
+        if self.report is not None:
+            self.report({
+                "stage": self.current,
+                "fraction": fraction,
+                "trips": self.trips,
+                "elapsed": time.perf_counter() - self._t0,
+                "timings": dict(self.timings),
+            })
+
+
+def run_batch(sensor_path, driver_path, safety_path, threshold=0.5, workers=1, use_cache=True, use_store=True,
+              presorted=False, chunksize=DEFAULT_CHUNKSIZE, backend="model", scorer="xgboost", sequence_model=None,
+              persist=True, explain=False, report=None, cancel_event=None) -> dict:
+    """
+    full batch run over the 3 raw csv files
+
+    report(event) is called from the calling thread (see _Progress for the event keys);
+    scorer picks the model (scorers.SCORERS): "xgboost" on the engineered features, with backend picking its
+    model_utils runtime ("model" or the "numpy" tree evaluator), or "sequence" on the raw readings (needs use_cache),
+    loaded from sequence_model (default sequence_model.SEQUENCE_MODEL_PATH);
+    explain caches per-trip feature contributions of the stored trips (explain.explain_batch, needs persist,
+    xgboost only);
+    setting cancel_event (threading.Event) stops the run with BatchCancelled at the next trip slice,
+    nothing is written to the history once cancelled
+
+    schema problems in any of the 3 files raise schema.SchemaError (a ValueError listing all of them)
+    before sensor_data is parsed
+
+    returns dict: preds, sensor_df (clean + sorted, None when the csv was streamed), driver_df, safety_df,
+    timings, trips, store_hits, store_misses, schema (SchemaReport, warnings included),
+    history (db.save_batch counts: run_id, inserted, updated, unchanged; None without persist),
+    explained (trips whose contributions were computed, 0 when they were all cached or explain is off),
+    scorer (name of the scorer used), backend (its model_utils runtime, for explain.explain_trip)
+    """
+    progress = _Progress(report, cancel_event)
+    store = FeatureStore() if use_store else None
+    # loaded up front: a missing model fails before the inputs are parsed
+    model = get_scorer(scorer, backend, sequence_model).load()
+    if model.needs_readings and not use_cache:
+        # only the ingest cache keeps the readings; streamed csv slices are dropped once featurized
+        raise ValueError(f"the {scorer} scorer needs the ingest cache (use_cache=True)")
+
+    # the two small tables + a sample of sensor_data, so bad inputs fail in seconds
+    with progress.stage("validate"):
+        if use_cache:
+            driver_df = load_table(driver_path)
+            safety_df = load_table(safety_path)
+        else:
+            driver_df = pd.read_csv(driver_path)
+            safety_df = pd.read_csv(safety_path)
+        schema = validate_inputs(sensor_path, driver_df, safety_df, use_cache=use_cache)
+        schema.raise_for_errors()
+
+    with progress.stage("parse"):
+        if use_cache:
+            # first run converts the csv, later runs memory-map the cached columns
+            sensor_df = load_sensor_table(sensor_path, safety_df, chunksize=chunksize,
+                                          booking_col=schema.booking_column)
+        else:
+            # sensor_data is streamed during the features stage, it is never held in memory as a whole
+            sensor_df = None
+
+    with progress.stage("features"):
+        if sensor_df is not None:
+            engineered = engineer_features_from_sorted(
+                sensor_df, driver_df, safety_df,
+                workers=workers, store=store, progress=progress.trips_done, chunksize=chunksize,
+            )
+        else:
+            engineered = engineer_features_from_csv(
+                sensor_path, driver_df, safety_df,
+                chunksize=chunksize, presorted=presorted, workers=workers, store=store, progress=progress.trips_done,
+                booking_col=schema.booking_column,
+            )
+
+    with progress.stage("predict"):
+        table = SensorTable.from_sorted(sensor_df) if model.needs_readings else None
+        preds = model.score(engineered, table, threshold=threshold)
+
+    history = None
+    if persist:
+        with progress.stage("persist"):
+            # the fingerprint is already known with the ingest cache on; without it, hashing would re-read the file
+            history = save_batch(
+                preds, threshold,
+                model_version=model.version,
+                input_fingerprint=file_fingerprint(sensor_path) if use_cache else None,
+            )
+
+    explained = 0
+    if persist and explain and scorer == "xgboost":
+        with progress.stage("explain"):
+            explained = explain_batch(preds, backend=backend)
+
+    return {
+        "preds": preds,
+        "sensor_df": sensor_df,
+        "driver_df": driver_df,
+        "safety_df": safety_df,
+        "timings": progress.timings,
+        "trips": len(preds),
+        "store_hits": store.hits if store is not None else 0,
+        "store_misses": store.misses if store is not None else 0,
+        "schema": schema,
+        "history": history,
+        "explained": explained,
+        "scorer": scorer,
+        "backend": backend,
+    }
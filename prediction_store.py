@@ -0,0 +1,76 @@
+"""
+predictions of the loaded batch, indexed by bookingID for the Single Trip tab
+
+PredictionStore keeps views of the prediction frame's columns (no copy of the frame), a
+bookingID -> row hash index for O(1) lookups, and the distinct bookingIDs as a sorted string array,
+so the type-ahead search is a binary search for the typed prefix and a slice of the first N matches
+"""
+import numpy as np
+import pandas as pd
+
+
+class PredictionStore:
+    """
+    built once per batch from the prediction frame (bookingID, driver_id, pred_proba, pred_label optional)
+
+    duplicate bookingIDs resolve to their first row, like the old filter-then-iloc[0] lookup
+    """
+
+    def __init__(self, preds: pd.DataFrame):
+        self.preds = preds
+        self.booking_ids = np.asarray(preds["bookingID"].to_numpy(), dtype=np.int64)
+        self.driver_ids = np.asarray(preds["driver_id"].to_numpy(), dtype=np.int64)
+        self.scores = np.asarray(preds["pred_proba"].to_numpy(), dtype=np.float64)
+        self.n = len(self.booking_ids)
+
+        ids, first = np.unique(self.booking_ids, return_index=True)
+        self._rows = dict(zip(ids.tolist(), first.tolist()))
+
+        # the Combobox lists bookingIDs as text, so prefixes are searched in string order
+        self.sorted_keys = np.sort(ids.astype(str))
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, booking_id):
+        return self.row_of(booking_id) is not None
+
+    def row_of(self, booking_id):
+        """
+        row position of booking_id in the prediction frame; None when it is not in the batch
+        (booking_id may be the text typed into the Combobox)
+        """
+        try:
+            key = int(str(booking_id).strip())
+        except ValueError:
+            return None
+        return self._rows.get(key)
+
+    def get(self, booking_id):
+        """
+        (bookingID, driver_id, pred_proba) of one trip, or None
+        """
+        i = self.row_of(booking_id)
+        if i is None:
+            return None
+        return int(self.booking_ids[i]), int(self.driver_ids[i]), float(self.scores[i])
+
+    def _prefix_range(self, prefix: str):
+        if not prefix:
+            return 0, len(self.sorted_keys)
+        lo = int(np.searchsorted(self.sorted_keys, prefix, side="left"))
+        # every key starting with prefix sorts before prefix with its last character bumped
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        hi = int(np.searchsorted(self.sorted_keys, upper, side="left"))
+        return lo, hi
+
+    def search(self, prefix: str = "", limit: int = 200) -> list:
+        """
+        first `limit` bookingIDs (as text, ascending) starting with prefix
+        """
+        lo, hi = self._prefix_range(prefix.strip())
+        return self.sorted_keys[lo:min(hi, lo + limit)].tolist()
+
+    def count_matches(self, prefix: str = "") -> int:
+        lo, hi = self._prefix_range(prefix.strip())
+        return hi - lo
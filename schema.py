@@ -0,0 +1,261 @@
+"""
+up-front schema checks for the 3 raw tables, run before any heavy work
+
+validate_inputs() looks at the (small) driver / safety frames plus the header and a sample of sensor_data,
+and reports every problem at once instead of failing halfway through a batch. the sensor part of the report
+(including which column holds bookingID) is cached per file fingerprint + safety bookingIDs
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from . import ingest_cache
+from .feature_engineer import (
+    BOOKING_MIN_OVERLAP,
+    BOOKING_SAMPLE_ROWS,
+    SENSOR_COLUMNS,
+    _coerce_label,
+    _find_booking_column,
+    booking_id_overlap,
+    safety_booking_ids,
+)
+
+# share of sampled values that may fail numeric parsing before a column is reported
+BAD_VALUE_SHARE = 0.05
+
+# decisions kept in the cache file (oldest dropped first)
+CACHE_MAX_ENTRIES = 256
+
+
+class SchemaError(ValueError):
+    """
+    raised with every blocking problem of a SchemaReport
+    """
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        super().__init__("input files failed schema checks:\n" + "\n".join(f"- {p}" for p in self.problems))
+
+
+class SchemaReport:
+    """
+    errors block the run, warnings are reported alongside the results
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.booking_column = None
+        self.missing_sensor_columns = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def raise_for_errors(self):
+        if self.errors:
+            raise SchemaError(self.errors)
+
+    def to_dict(self) -> dict:
+        return {
+            "errors": list(self.errors),
+            "warnings": list(self.warnings),
+            "booking_column": self.booking_column,
+            "missing_sensor_columns": list(self.missing_sensor_columns),
+        }
+
+
+def _stripped(df: pd.DataFrame) -> pd.DataFrame:
+    if any(c != c.strip() for c in df.columns):
+        return df.rename(columns=str.strip)
+    return df
+
+
+def _bad_share(col: pd.Series) -> float:
+    # values present in the file that don't parse as numbers
+    present = col.notna()
+    if not present.any():
+        return 0.0
+    return float((pd.to_numeric(col[present], errors="coerce").isna()).mean())
+
+
+# ============================================================
+# per-table checks
+# ============================================================
+
+def check_safety(safety_df: pd.DataFrame, report: SchemaReport):
+    safety_df = _stripped(safety_df)
+    missing = [c for c in ("bookingID", "driver_id") if c not in safety_df.columns]
+    if missing:
+        report.errors.append(f"safety_labels is missing column(s): {', '.join(missing)}")
+        return
+    if len(safety_df) == 0:
+        report.errors.append("safety_labels has no rows")
+        return
+
+    bad = _bad_share(safety_df["bookingID"])
+    if bad:
+        report.warnings.append(f"safety_labels: {bad:.1%} of bookingIDs are not numeric (ignored)")
+    dup = int(safety_df["bookingID"].duplicated().sum())
+    if dup:
+        report.warnings.append(f"safety_labels: {dup:,} duplicate bookingID rows (the first one is used)")
+    bad = _bad_share(safety_df["driver_id"])
+    if bad:
+        report.warnings.append(f"safety_labels: {bad:.1%} of driver_ids are not numeric (stored as -1)")
+    if "label" in safety_df.columns:
+        labels = safety_df["label"].dropna()
+        unreadable = int(labels.map(_coerce_label).isna().sum())
+        if unreadable:
+            report.warnings.append(f"safety_labels: {unreadable:,} label values could not be read")
+
+
+def check_driver(driver_df: pd.DataFrame, report: SchemaReport):
+    # driver_data is metadata only, nothing here blocks scoring
+    driver_df = _stripped(driver_df)
+    if "id" not in driver_df.columns:
+        report.warnings.append("driver_data has no id column")
+    elif len(driver_df) == 0:
+        report.warnings.append("driver_data has no rows")
+
+
+def check_sensor_sample(sample: pd.DataFrame, safety_ids: np.ndarray, report: SchemaReport, n_rows=None):
+    """
+    sample: the first rows of sensor_data (or a sample of an in-memory table)
+    """
+    sample = _stripped(sample)
+    if len(sample.columns) == 0:
+        report.errors.append("sensor_data has no header")
+        return
+    if len(sample) == 0 or n_rows == 0:
+        report.errors.append("sensor_data has no rows")
+        return
+
+    try:
+        booking_col = _find_booking_column(sample, None, safety_ids=safety_ids)
+    except ValueError:
+        report.errors.append(
+            "sensor_data has no bookingID column (no 'bookingID' / 'Unnamed: 0' column, and no other column "
+            f"with at least {BOOKING_MIN_OVERLAP:.0%} of sampled values in safety_labels)"
+        )
+        return
+    report.booking_column = booking_col
+
+    bad = _bad_share(sample[booking_col])
+    if bad > BAD_VALUE_SHARE:
+        report.warnings.append(f"sensor_data: {bad:.1%} of sampled {booking_col} values are not numeric (rows dropped)")
+    if booking_col == "bookingID" and len(safety_ids):
+        overlap = booking_id_overlap(sample[booking_col], safety_ids)
+        if overlap < BOOKING_MIN_OVERLAP:
+            report.warnings.append(
+                f"sensor_data: only {overlap:.0%} of sampled bookingIDs are in safety_labels "
+                "(the other trips are scored with driver_id -1)"
+            )
+
+    report.missing_sensor_columns = [c for c in SENSOR_COLUMNS if c not in sample.columns]
+    if report.missing_sensor_columns:
+        report.warnings.append(
+            f"sensor_data is missing column(s) {', '.join(report.missing_sensor_columns)} (filled with 0)"
+        )
+    for c in SENSOR_COLUMNS:
+        if c in sample.columns:
+            bad = _bad_share(sample[c])
+            if bad > BAD_VALUE_SHARE:
+                report.warnings.append(f"sensor_data: {bad:.1%} of sampled {c} values are not numeric (read as 0)")
+
+
+# ============================================================
+# decision cache
+# ============================================================
+
+def _cache_path():
+    return ingest_cache.CACHE_DIR / "schema.json"
+
+
+def _load_cache() -> dict:
+    try:
+        return json.loads(_cache_path().read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _save_cache(cache: dict):
+    while len(cache) > CACHE_MAX_ENTRIES:
+        cache.pop(next(iter(cache)))
+    path = _cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _decision_key(sensor_path, safety_ids: np.ndarray, sample_rows: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(ingest_cache.file_fingerprint(sensor_path).encode("ascii"))
+    h.update(np.ascontiguousarray(safety_ids, dtype=np.int64).tobytes())
+    h.update(str(sample_rows).encode("ascii"))
+    return h.hexdigest()
+
+
+# ============================================================
+# entry points
+# ============================================================
+
+def validate_inputs(sensor_path, driver_df: pd.DataFrame, safety_df: pd.DataFrame,
+                    sample_rows: int = BOOKING_SAMPLE_ROWS, use_cache: bool = True) -> SchemaReport:
+    """
+    checks all 3 tables; sensor_data is only read up to sample_rows rows
+
+    use_cache: reuse / store the sensor checks under the file's fingerprint (ingest_cache.file_fingerprint;
+    hashing a new file reads it once, which the ingest cache does anyway)
+    """
+    report = SchemaReport()
+    check_safety(safety_df, report)
+    check_driver(driver_df, report)
+    if report.errors:
+        return report
+
+    safety_ids = safety_booking_ids(_stripped(safety_df))
+    key = _decision_key(sensor_path, safety_ids, sample_rows) if use_cache else None
+    cache = _load_cache() if use_cache else {}
+    if key in cache:
+        sensor = cache[key]
+        instrument.count("schema.cache_hits")
+    else:
+        part = SchemaReport()
+        if os.path.getsize(sensor_path) == 0:
+            part.errors.append("sensor_data is an empty file")
+        else:
+            with instrument.span("schema.sample", rows=sample_rows):
+                sample = pd.read_csv(sensor_path, nrows=sample_rows)
+            check_sensor_sample(sample, safety_ids, part)
+        sensor = part.to_dict()
+        if key is not None:
+            cache[key] = sensor
+            _save_cache(cache)
+
+    report.errors += sensor["errors"]
+    report.warnings += sensor["warnings"]
+    report.booking_column = sensor["booking_column"]
+    report.missing_sensor_columns = sensor["missing_sensor_columns"]
+    return report
+
+
+def validate_frames(sensor_df: pd.DataFrame, driver_df: pd.DataFrame, safety_df: pd.DataFrame,
+                    sample_rows: int = BOOKING_SAMPLE_ROWS) -> SchemaReport:
+    """
+    same checks for tables already in memory (sensor_df is sampled, not scanned)
+    """
+    report = SchemaReport()
+    check_safety(safety_df, report)
+    check_driver(driver_df, report)
+    if report.errors:
+        return report
+
+    n = len(sensor_df)
+    idx = np.linspace(0, n - 1, min(n, sample_rows)).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+    check_sensor_sample(sensor_df.iloc[idx], safety_booking_ids(_stripped(safety_df)), report, n_rows=n)
+    return report
@@ -0,0 +1,152 @@
+"""
+scores of one batch kept sorted, so everything that depends on the threshold is a binary search away
+
+ScoreIndex answers "how many trips / which drivers / what precision-recall at threshold t" in O(log n)
+(per-driver counts in one vectorized binary search over all driver blocks); moving a slider never touches
+the model or the feature engine
+"""
+import numpy as np
+import pandas as pd
+
+
+class ScoreIndex:
+    """
+    built once per batch from the prediction frame (bookingID, driver_id, pred_proba, label optional)
+
+    a trip is dangerous at threshold t when pred_proba >= t, the same rule as model_utils.score_features
+    """
+
+    def __init__(self, booking_ids: np.ndarray, driver_ids: np.ndarray, scores: np.ndarray, labels: np.ndarray = None):
+        self.booking_ids = np.asarray(booking_ids, dtype=np.int64)
+        self.driver_ids = np.asarray(driver_ids, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.n = len(self.scores)
+
+        # all trips, ascending: positives at t are sorted[searchsorted(t):]
+        self.sorted_scores = np.sort(self.scores, kind="stable")
+
+        # labelled trips only: scores ascending + cumulative count of label 1 below each position
+        self.has_labels = False
+        if labels is not None:
+            labels = pd.to_numeric(pd.Series(labels), errors="coerce").to_numpy(dtype=np.float64)
+            known = ~np.isnan(labels)
+            if known.any():
+                order = np.argsort(self.scores[known], kind="stable")
+                self._lab_scores = self.scores[known][order]
+                self._lab_cum = np.concatenate(([0], np.cumsum(labels[known][order] == 1)))
+                self.has_labels = True
+
+        # per driver: trips grouped by driver rank, scores ascending inside each block;
+        # block i is _driver_scores[_driver_start[i]:_driver_end[i]]
+        self.drivers, rank, self.driver_totals = np.unique(self.driver_ids, return_inverse=True, return_counts=True)
+        self._driver_scores = self.scores[np.lexsort((self.scores, rank))]
+        self._driver_end = np.cumsum(self.driver_totals)
+        self._driver_start = self._driver_end - self.driver_totals
+
+    @classmethod
+    def from_predictions(cls, preds: pd.DataFrame) -> "ScoreIndex":
+        return cls(
+            preds["bookingID"].to_numpy(),
+            preds["driver_id"].to_numpy(),
+            preds["pred_proba"].to_numpy(),
+            preds["label"].to_numpy() if "label" in preds.columns else None,
+        )
+
+    def _first_at(self, lo: np.ndarray, hi: np.ndarray, threshold: float) -> np.ndarray:
+        """
+        searchsorted(threshold, side="left") inside each block [lo, hi) of _driver_scores, all blocks at once
+        """
+        lo, hi = lo.copy(), hi.copy()
+        while True:
+            active = lo < hi
+            if not active.any():
+                return lo
+            mid = (lo + hi) // 2
+            below = active & (self._driver_scores[np.minimum(mid, self.n - 1)] < threshold)
+            lo = np.where(below, mid + 1, lo)
+            hi = np.where(active & ~below, mid, hi)
+
+    def count_at(self, threshold: float) -> int:
+        """
+        trips with pred_proba >= threshold
+        """
+        return self.n - int(np.searchsorted(self.sorted_scores, threshold, side="left"))
+
+    def driver_counts(self, threshold: float) -> np.ndarray:
+        """
+        dangerous trips per driver at threshold, aligned with self.drivers / self.driver_totals
+        """
+        return self._driver_end - self._first_at(self._driver_start, self._driver_end, threshold)
+
+    def driver_count(self, driver_id: int, threshold: float):
+        """
+        (dangerous trips, trips) of one driver in this batch; (0, 0) for unknown drivers
+        """
+        i = int(np.searchsorted(self.drivers, driver_id))
+        if i == len(self.drivers) or self.drivers[i] != driver_id:
+            return 0, 0
+        start, end = int(self._driver_start[i]), int(self._driver_end[i])
+        first = start + int(np.searchsorted(self._driver_scores[start:end], threshold, side="left"))
+        return end - first, int(self.driver_totals[i])
+
+    def top_drivers(self, threshold: float, k: int = 10) -> pd.DataFrame:
+        """
+        drivers with the most dangerous trips at threshold (ties: higher dangerous rate first)
+        """
+        counts = self.driver_counts(threshold)
+        rate = counts / self.driver_totals
+        order = np.lexsort((-rate, -counts))[:k]
+        return pd.DataFrame({
+            "driver_id": self.drivers[order],
+            "dangerous_trips": counts[order],
+            "total_trips": self.driver_totals[order],
+            "dangerous_rate": rate[order],
+        })
+
+    def metrics(self, threshold: float) -> dict:
+        """
+        confusion counts + precision / recall / f1 over the labelled trips (None without labels)
+        """
+        if not self.has_labels:
+            return None
+        n = len(self._lab_scores)
+        k = int(np.searchsorted(self._lab_scores, threshold, side="left"))
+        positives = int(self._lab_cum[-1])
+        tp = positives - int(self._lab_cum[k])
+        flagged = n - k
+        fp = flagged - tp
+        fn = positives - tp
+        precision = tp / flagged if flagged else float("nan")
+        recall = tp / positives if positives else float("nan")
+        f1 = 2 * tp / (flagged + positives) if flagged + positives else float("nan")
+        return {"tp": tp, "fp": fp, "fn": fn, "tn": n - tp - fp - fn,
+                "precision": precision, "recall": recall, "f1": f1}
+
+    def summary(self, threshold: float) -> dict:
+        dangerous = self.count_at(threshold)
+        return {
+            "threshold": float(threshold),
+            "trips": self.n,
+            "dangerous": dangerous,
+            "dangerous_rate": dangerous / self.n if self.n else 0.0,
+            "drivers_flagged": int(np.count_nonzero(self.driver_counts(threshold))),
+            "drivers": len(self.drivers),
+            "metrics": self.metrics(threshold),
+        }
+
+    def sweep(self, thresholds) -> pd.DataFrame:
+        """
+        one summary row per threshold (e.g. np.linspace(0.1, 0.9, 81)) for tables / plots
+        """
+        rows = []
+        for t in np.asarray(thresholds, dtype=np.float64):
+            s = self.summary(t)
+            m = s.pop("metrics") or {}
+            rows.append({**s, **m})
+        return pd.DataFrame(rows)
+
+    def labels_at(self, threshold: float) -> np.ndarray:
+        """
+        pred_label per trip (original row order) at threshold
+        """
+        return (self.scores >= threshold).astype(int)
@@ -0,0 +1,150 @@
+"""
+pluggable scorers behind the batch pipeline / predict_from_raw: all turn a batch into one probability per trip
+
+- "xgboost": the trip-level model on engineered features (model_utils.ModelRuntime, either backend)
+- "sequence": the MiniROCKET-style model on the raw readings of each trip (sequence_model.SequenceModel)
+
+every scorer is handed the engineered frame (one row per trip, bookingID order) and, when it
+needs_readings, the batch's readings as a feature_engineer.SensorTable; probabilities come back
+aligned with the engineered rows. version keys the stored predictions (db.save_batch model_version).
+a Scorer subclass that misses version / predict_proba fails when it is created, not mid-batch
+"""
+import abc
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .model_utils import get_runtime, score_features
+
+SCORERS = ("xgboost", "sequence")
+
+
+class Scorer(abc.ABC):
+    name = None
+    # whether predict_proba needs the raw readings (table) besides the engineered features
+    needs_readings = False
+
+    def load(self) -> "Scorer":
+        return self
+
+    @property
+    @abc.abstractmethod
+    def version(self) -> str:
+        ...
+
+    @abc.abstractmethod
+    def predict_proba(self, engineered: pd.DataFrame, table=None) -> np.ndarray:
+        ...
+
+    def score(self, engineered: pd.DataFrame, table=None, threshold=0.5) -> pd.DataFrame:
+        """
+        adds pred_proba / pred_label (same rule as model_utils.score_features), nothing is written to the history
+        """
+        preds = engineered.copy()
+        preds["pred_proba"] = self.predict_proba(engineered, table)
+        preds["pred_label"] = (preds["pred_proba"] >= float(threshold)).astype(int)
+        return preds
+
+
+class TreeScorer(Scorer):
+    name = "xgboost"
+
+    def __init__(self, backend="model"):
+        self.backend = backend
+
+    @property
+    def runtime(self):
+        # looked up on every use: model_utils.reset_runtime() swaps in a new one, and the version
+        # must always be the one of the runtime that scores the batch
+        return get_runtime(self.backend)
+
+    def load(self) -> "TreeScorer":
+        self.runtime.load()
+        return self
+
+    @property
+    def version(self) -> str:
+        return self.load().runtime.version
+
+    def predict_proba(self, engineered, table=None):
+        return self.runtime.predict_proba(engineered)
+
+    def score(self, engineered, table=None, threshold=0.5):
+        return score_features(engineered, threshold=threshold, backend=self.backend)
+
+
+class SequenceScorer(Scorer):
+    name = "sequence"
+    needs_readings = True
+
+    def __init__(self, path=None, workers=None):
+        self.path = path
+        self.workers = workers
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self) -> "SequenceScorer":
+        with self._lock:
+            if self.model is None:
+                from .sequence_model import SEQUENCE_MODEL_PATH, SequenceModel
+                self.model = SequenceModel.load(self.path or SEQUENCE_MODEL_PATH)
+        return self
+
+    @property
+    def version(self) -> str:
+        return self.load().model.version
+
+    def predict_proba(self, engineered, table=None):
+        if table is None:
+            raise ValueError("the sequence scorer needs the raw sensor readings of the batch")
+        proba = self.load().model.predict_proba(table, workers=self.workers)
+
+        # table order -> engineered row order
+        order = np.argsort(table.booking_ids, kind="stable")
+        sorted_ids = table.booking_ids[order]
+        ids = engineered["bookingID"].to_numpy(dtype=np.int64)
+        pos = np.searchsorted(sorted_ids, ids)
+        found = pos < len(sorted_ids)
+        found[found] = sorted_ids[pos[found]] == ids[found]
+        if not found.all():
+            raise ValueError(f"trips without sensor readings: {ids[~found][:10].tolist()}")
+        return proba[order[pos]]
+
+
+_scorers = {}
+_scorers_lock = threading.Lock()
+
+
+def get_scorer(name="xgboost", backend="model", sequence_model=None) -> Scorer:
+    """
+    the process-wide scorer by name; backend only applies to "xgboost", sequence_model (model file,
+    default sequence_model.SEQUENCE_MODEL_PATH) only to "sequence". models load on first use
+    """
+    if name not in SCORERS:
+        raise ValueError(f"unknown scorer {name!r}, expected one of {SCORERS}")
+    if name == "xgboost":
+        key = (name, backend)
+    else:
+        key = (name, str(Path(sequence_model).resolve()) if sequence_model is not None else None)
+    with _scorers_lock:
+        if key not in _scorers:
+            _scorers[key] = TreeScorer(backend) if name == "xgboost" else SequenceScorer(sequence_model)
+        return _scorers[key]
+
+
+def reset_scorers():
+    """
+    drops the resident scorers, e.g. after a new sequence model was trained
+    """
+    with _scorers_lock:
+        _scorers.clear()
+
+
+def score_batch(engineered: pd.DataFrame, table=None, threshold=0.5, scorer="xgboost", backend="model",
+                sequence_model=None) -> pd.DataFrame:
+    """
+    model_utils.score_features for any scorer: adds pred_proba / pred_label, nothing is written to the history
+    """
+    return get_scorer(scorer, backend, sequence_model).score(engineered, table, threshold=threshold)
@@ -0,0 +1,327 @@
+"""
+MiniROCKET-style sequence model: scores trips from their raw sensor readings instead of trip features
+
+the transform is MiniROCKET's (ts_minirocket.ipynb used sktime's MiniRocketMultivariate): the 84
+length-9 kernels with weights -1 / 2 at a few dilations, and as features the proportion of positive
+values (PPV) of each convolution above biases fitted on training trips; a logistic regression on the
+PPV features gives the probability. differences from the notebook, for batch scoring speed:
+
+- trips are not all interpolated to one length (256 in the notebook): up to MAX_READINGS readings are used
+  as recorded (longer trips are resampled down by reading index), trips are grouped into length buckets
+  and padded only to their bucket's length, so short trips never pay for long ones
+- a (kernel, dilation) reads one of N_GROUPS fixed channel subsets instead of its own random subset, so
+  the 9 shifted copies of a subset's signal are shared by every kernel that reads it; a convolution is
+  then 3 adds: (sum of the 3 copies under weight 2) - (sum of all 9) / 3, which is the kernel output / 3
+- blocks of trips are transformed on a thread pool; numpy releases the GIL inside every array op
+
+numpy only at scoring time; fit() also needs scikit-learn for the logistic regression
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .feature_engineer import _prepare_safety
+from .model_utils import MODELS_DIR
+
+SEQUENCE_MODEL_PATH = MODELS_DIR / "sequence_minirocket.joblib"
+
+# bump when the saved parameter layout changes
+MODEL_FORMAT = 1
+
+# readings used per trip; longer trips are resampled down to this many (nearest reading by index)
+MAX_READINGS = 128
+
+# the 84 kernels as the 3 positions (of 9) weighted 2, the other 6 are weighted -1
+KERNELS = np.array(list(combinations(range(9), 3)), dtype=np.int64)
+
+DILATIONS = (1, 2, 4, 8)
+
+# PPV features per (dilation, kernel)
+BIASES_PER_KERNEL = 2
+
+# channel subsets the kernels are spread over
+N_GROUPS = 8
+
+# every sensor signal, as in the MiniROCKET / HMM experiments
+DEFAULT_CHANNELS = ["speed", "acceleration_x", "acceleration_y", "acceleration_z", "gyro_x", "gyro_y", "gyro_z",
+                    "bearing", "accuracy"]
+
+# trips per transform task; small enough for a block's signals to stay in cache
+BLOCK_TRIPS = 256
+
+# trips whose convolution outputs the biases are fitted on
+BIAS_FIT_TRIPS = 256
+
+_GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+def _bucket_edges(max_len: int) -> np.ndarray:
+    """
+    padded lengths trips are bucketed into: 8, 12, 16, 24, 32, 48, ... capped at max_len
+    """
+    edges = {max_len}
+    e = 8
+    while e < max_len:
+        edges.update((e, e * 3 // 2))
+        e *= 2
+    return np.array(sorted(x for x in edges if x <= max_len), dtype=np.int64)
+
+
+class SequenceModel:
+    """
+    fitted parameters of the transform + logistic head; built by fit() or load()
+    """
+
+    def __init__(self, channels, mean, std, groups, kernel_groups, biases, weights=None, intercept=0.0,
+                 dilations=DILATIONS, max_len=MAX_READINGS, version=None):
+        self.channels = list(channels)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        # (N_GROUPS, channels) 0/1: the channels summed into each group signal
+        self.groups = np.asarray(groups, dtype=np.float32)
+        # (dilations, 84): group read by each kernel
+        self.kernel_groups = np.asarray(kernel_groups, dtype=np.int64)
+        # (dilations, 84, BIASES_PER_KERNEL), in kernel output / 3 units
+        self.biases = None if biases is None else np.asarray(biases, dtype=np.float32)
+        # logistic head on the raw PPV features (the fitted standardization is folded in)
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.dilations = tuple(int(d) for d in dilations)
+        self.max_len = int(max_len)
+        self.version = version
+
+        if self.max_len < 9:
+            raise ValueError("max_len must be at least the kernel length (9)")
+        self._pad = 4 * max(self.dilations)
+        self._edges = _bucket_edges(self.max_len)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.dilations) * len(KERNELS) * self.biases.shape[2]
+
+    # ------------------------------------------------------------------ transform
+
+    def _blocks(self, lengths: np.ndarray):
+        """
+        (trip indices, padded length) per task: trips bucketed by used length, BLOCK_TRIPS per block
+        """
+        used = np.minimum(lengths, self.max_len)
+        bucket = np.searchsorted(self._edges, used, side="left")
+        order = np.argsort(bucket, kind="stable")
+        bounds = np.searchsorted(bucket[order], np.arange(len(self._edges) + 1))
+        for b in range(len(self._edges)):
+            idx = order[bounds[b]:bounds[b + 1]]
+            for lo in range(0, len(idx), BLOCK_TRIPS):
+                yield idx[lo:lo + BLOCK_TRIPS], int(self._edges[b])
+
+    def _signals(self, table, idx: np.ndarray, width: int):
+        """
+        zero-padded group signals (N_GROUPS, pad + width + pad, trips) of the trips idx + valid mask (width, trips);
+        time-major, so the per-trip reductions are adds of contiguous rows
+        """
+        n = table.offsets[idx + 1] - table.offsets[idx]
+        start = table.offsets[idx]
+        used = np.minimum(n, self.max_len)
+
+        j = np.arange(width, dtype=np.float64)
+        valid = j[:, None] < used[None, :]
+        # reading index per position: j itself, or spread over the whole trip when it is resampled
+        step = np.where(n > self.max_len, (n - 1) / (self.max_len - 1), 1.0)
+        rows = np.where(valid, np.rint(j[:, None] * step[None, :]), 0.0).astype(np.int64)
+        rows += start[None, :]
+
+        x = np.empty((len(self.channels), width, len(idx)), dtype=np.float32)
+        for c, name in enumerate(self.channels):
+            np.take(table.columns[name], rows, out=x[c])
+            x[c] -= self.mean[c]
+            x[c] /= self.std[c]
+        x *= valid
+
+        padded = np.zeros((len(self.groups), self._pad + width + self._pad, len(idx)), dtype=np.float32)
+        padded[:, self._pad:self._pad + width] = np.tensordot(self.groups, x, axes=1)
+        return padded, valid
+
+    def _kernel_outputs(self, padded: np.ndarray, valid: np.ndarray, di: int):
+        """
+        yields (kernel, output / 3) for every kernel at dilation index di; output is -inf past each trip's end
+        (the buffer is reused between kernels)
+        """
+        d = self.dilations[di]
+        width = valid.shape[0]
+        shifts = [padded[:, self._pad + (s - 4) * d:self._pad + (s - 4) * d + width] for s in range(9)]
+
+        third = shifts[0].copy()
+        for s in shifts[1:]:
+            third += s
+        third /= 3.0
+        third[:, ~valid] = np.inf
+
+        buf = np.empty(valid.shape, dtype=np.float32)
+        for k, (a, b, c) in enumerate(KERNELS):
+            g = self.kernel_groups[di, k]
+            np.add(shifts[a][g], shifts[b][g], out=buf)
+            buf += shifts[c][g]
+            buf -= third[g]
+            yield k, buf
+
+    def _transform_block(self, table, idx: np.ndarray, width: int, out: np.ndarray):
+        padded, valid = self._signals(table, idx, width)
+        counts = valid.sum(axis=0).astype(np.float32)
+        above = np.empty(valid.shape, dtype=bool)
+        # counting = summing the bools as bytes down the time axis; uint8 holds any count up to 255 readings
+        above_u8 = above.view(np.uint8)
+        count_dtype = np.uint8 if width < 256 else np.int32
+        counts_t = np.empty((self.n_features, len(idx)), dtype=np.float32)
+
+        col = 0
+        for di in range(len(self.dilations)):
+            for k, conv in self._kernel_outputs(padded, valid, di):
+                for bias in self.biases[di, k]:
+                    np.greater(conv, bias, out=above)
+                    counts_t[col] = np.add.reduce(above_u8, axis=0, dtype=count_dtype)
+                    col += 1
+        out[idx] = (counts_t / counts).T
+
+    def transform(self, table, workers: int = None) -> np.ndarray:
+        """
+        PPV features (trips, n_features) float32 of every trip of a feature_engineer.SensorTable, in table order
+        """
+        lengths = np.diff(table.offsets)
+        out = np.empty((len(lengths), self.n_features), dtype=np.float32)
+        if len(lengths) == 0:
+            return out
+
+        workers = max(1, int(workers or os.cpu_count() or 1))
+        with instrument.span("sequence.transform", rows=int(np.minimum(lengths, self.max_len).sum()),
+                             trips=len(lengths)):
+            blocks = list(self._blocks(lengths))
+            if workers == 1 or len(blocks) == 1:
+                for idx, width in blocks:
+                    self._transform_block(table, idx, width, out)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(lambda b: self._transform_block(table, b[0], b[1], out), blocks))
+        return out
+
+    def predict_proba(self, table, workers: int = None) -> np.ndarray:
+        """
+        probability of the dangerous class per trip of table (table order)
+        """
+        if self.weights is None:
+            raise ValueError("sequence model is not fitted")
+        features = self.transform(table, workers=workers)
+        with instrument.span("sequence.predict", trips=len(features)):
+            z = features @ self.weights + self.intercept
+            return 1.0 / (1.0 + np.exp(-np.clip(z, -50.0, 50.0)))
+
+    # ------------------------------------------------------------------ fit / persist
+
+    @classmethod
+    def fit(cls, table, labels, channels=None, C=0.1, seed=0, workers: int = None) -> "SequenceModel":
+        """
+        fits biases + logistic head on the trips of table; labels aligned with table.booking_ids
+        (NaN = unlabelled, left out)
+        """
+        from sklearn.linear_model import LogisticRegression
+
+        channels = list(channels or DEFAULT_CHANNELS)
+        labels = np.asarray(labels, dtype=np.float64)
+        rng = np.random.default_rng(seed)
+
+        mean = np.array([np.mean(table.columns[c], dtype=np.float64) for c in channels])
+        std = np.array([np.std(table.columns[c], dtype=np.float64) for c in channels])
+        std[~(std > 0)] = 1.0
+
+        # MiniROCKET-multivariate subset sizes: 1 .. min(channels, 9), log-uniform
+        groups = np.zeros((N_GROUPS, len(channels)), dtype=np.float32)
+        for g in range(N_GROUPS):
+            size = int(2 ** rng.uniform(0, np.log2(min(len(channels), 9) + 1)))
+            groups[g, rng.choice(len(channels), size=max(1, size), replace=False)] = 1.0
+        kernel_groups = rng.integers(0, N_GROUPS, size=(len(DILATIONS), len(KERNELS)))
+
+        model = cls(channels, mean, std, groups, kernel_groups, biases=None)
+
+        # biases: quantiles of each kernel's outputs over a sample of trips, at low-discrepancy levels
+        lengths = np.diff(table.offsets)
+        sample = rng.choice(len(lengths), size=min(BIAS_FIT_TRIPS, len(lengths)), replace=False)
+        padded, valid = model._signals(table, sample, int(np.minimum(lengths[sample], model.max_len).max()))
+        biases = np.empty((len(DILATIONS), len(KERNELS), BIASES_PER_KERNEL), dtype=np.float32)
+        feature = 0
+        for di in range(len(DILATIONS)):
+            for k, conv in model._kernel_outputs(padded, valid, di):
+                levels = ((np.arange(BIASES_PER_KERNEL) + feature + 1) * _GOLDEN) % 1.0
+                biases[di, k] = np.quantile(conv[valid], levels)
+                feature += BIASES_PER_KERNEL
+        model.biases = biases
+
+        features = model.transform(table, workers=workers).astype(np.float64)
+        known = ~np.isnan(labels)
+        x, y = features[known], labels[known].astype(int)
+        if len(np.unique(y)) < 2:
+            raise ValueError("fitting the sequence model needs labelled trips of both classes")
+
+        mu, sd = x.mean(axis=0), x.std(axis=0)
+        sd[sd == 0] = 1.0
+        clf = LogisticRegression(C=C, class_weight="balanced", max_iter=2000)
+        clf.fit((x - mu) / sd, y)
+
+        model.weights = clf.coef_[0] / sd
+        model.intercept = float(clf.intercept_[0] - np.dot(mu, model.weights))
+        return model
+
+    def save(self, path=SEQUENCE_MODEL_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump({
+            "format": MODEL_FORMAT,
+            "channels": self.channels,
+            "mean": self.mean,
+            "std": self.std,
+            "groups": self.groups,
+            "kernel_groups": self.kernel_groups,
+            "biases": self.biases,
+            "weights": self.weights,
+            "intercept": self.intercept,
+            "dilations": self.dilations,
+            "max_len": self.max_len,
+        }, path)
+
+    @classmethod
+    def load(cls, path=SEQUENCE_MODEL_PATH) -> "SequenceModel":
+        """
+        raises FileNotFoundError without a saved model (see 'python -m gobest sequences train')
+        """
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"no sequence model at {path}; train one with 'python -m gobest sequences train'")
+        params = joblib.load(path)
+        if params.pop("format", None) != MODEL_FORMAT:
+            raise ValueError(f"{path} was saved in another sequence model format")
+        # content hash, like model_utils.artifacts_version; stored predictions are keyed by it
+        version = "seq-" + hashlib.blake2b(path.read_bytes(), digest_size=8).hexdigest()
+        return cls(**params, version=version)
+
+
+def train_sequence_model(store, safety_df: pd.DataFrame, path=SEQUENCE_MODEL_PATH, C=0.1, seed=0) -> SequenceModel:
+    """
+    fits a model on every labelled trip of a sequence_store.SequenceStore and saves it to path
+    (the notebooks only hold experiments, no sequence model artifact is shipped)
+    """
+    safety_df = _prepare_safety(safety_df)
+    if "label" not in safety_df.columns:
+        raise ValueError("training the sequence model needs the label column of safety_labels")
+    ids = pd.to_numeric(safety_df["bookingID"], errors="coerce")
+    labels = pd.Series(safety_df["label"].to_numpy(dtype=np.float64), index=ids).loc[lambda s: ~s.index.duplicated()]
+
+    table = store.to_sensor_table()
+    with instrument.span("sequence.fit", rows=table.n_rows, trips=table.n_trips):
+        model = SequenceModel.fit(table, labels.reindex(table.booking_ids).to_numpy(), C=C, seed=seed)
+    model.save(path)
+    return SequenceModel.load(path)
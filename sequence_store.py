@@ -0,0 +1,286 @@
+"""
+raw sensor sequences per trip in a ragged, memory-mapped layout, for the sequence models
+
+one directory holds
+- values.f32: the signals of every reading as float32, len(channels) values per reading, trips stored back to back
+- second.f64: the second of every reading as float64, kept apart so fractional timestamps stay exact
+- offsets.i64: trip i is readings offsets[i]:offsets[i + 1] (n_trips + 1 int64)
+- booking_ids.i64: bookingID of every trip, in storage order
+- meta.json: channel names + layout version
+
+a trip is a zero-copy (readings, channels) view into the mapped values file, found through a sorted
+bookingID index in O(log n). new trips are appended at the end of the files, nothing already stored
+is rewritten; offsets are written last, so an interrupted append leaves the store as it was
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .feature_engineer import (
+    DEFAULT_CHUNKSIZE,
+    SENSOR_COLUMNS,
+    SensorTable,
+    _attach_safety_meta,
+    _iter_external,
+    _iter_presorted,
+    _prepare_safety,
+    _segment_starts,
+)
+
+SEQUENCE_DIR = Path(__file__).parent / ".sequence_store"
+
+# bump when the on-disk layout changes; stores of another format are refused, not misread
+STORE_FORMAT = 2
+
+# signal channels of a reading, in storage order; second has its own float64 file
+SEQUENCE_CHANNELS = [c for c in SENSOR_COLUMNS if c != "second"]
+
+_VALUES = "values.f32"
+_SECONDS = "second.f64"
+_OFFSETS = "offsets.i64"
+_BOOKING_IDS = "booking_ids.i64"
+
+
+def _read_array(path: Path, dtype, count: int) -> np.ndarray:
+    # only the committed prefix; anything past it is the tail of an interrupted append
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def _write_at(path: Path, data: np.ndarray, end: int):
+    """
+    writes data at byte offset end, dropping whatever an interrupted append left past it
+    """
+    with open(path, "r+b") as fh:
+        # only shrink when there is a tail: a mapped file can be extended, not always truncated (windows)
+        if fh.seek(0, 2) > end:
+            fh.truncate(end)
+        fh.seek(end)
+        fh.write(np.ascontiguousarray(data).tobytes())
+
+
+class SequenceStore:
+    """
+    opened with SequenceStore.open(path); booking_ids / offsets / values are read-only memory maps
+    """
+
+    def __init__(self, path: Path, channels: list):
+        self.path = Path(path)
+        self.channels = list(channels)
+        self._map()
+
+    @classmethod
+    def open(cls, path=SEQUENCE_DIR, create=False, channels=None) -> "SequenceStore":
+        """
+        create=True starts an empty store when path holds none (channels default to SEQUENCE_CHANNELS)
+        """
+        path = Path(path)
+        meta_path = path / "meta.json"
+        if not meta_path.exists():
+            if not create:
+                raise FileNotFoundError(f"no sequence store at {path}")
+            if channels is not None and "second" in channels:
+                raise ValueError("second is stored apart from the signal channels, leave it out of channels")
+            path.mkdir(parents=True, exist_ok=True)
+            for name in (_VALUES, _SECONDS, _BOOKING_IDS):
+                (path / name).touch()
+            (path / _OFFSETS).write_bytes(np.zeros(1, dtype="<i8").tobytes())
+            meta = {"format": STORE_FORMAT, "channels": list(channels or SEQUENCE_CHANNELS)}
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("format") != STORE_FORMAT:
+            raise ValueError(f"sequence store at {path} has format {meta.get('format')}, expected {STORE_FORMAT}")
+        return cls(path, meta["channels"])
+
+    def _map(self):
+        n_offsets = (self.path / _OFFSETS).stat().st_size // 8
+        n_ids = (self.path / _BOOKING_IDS).stat().st_size // 8
+        n_trips = max(0, min(n_offsets - 1, n_ids))
+
+        self.offsets = _read_array(self.path / _OFFSETS, "<i8", n_trips + 1)
+        if len(self.offsets) == 0:
+            self.offsets = np.zeros(1, dtype=np.int64)
+        self.booking_ids = _read_array(self.path / _BOOKING_IDS, "<i8", n_trips)
+
+        n_rows = int(self.offsets[-1])
+        width = len(self.channels)
+        if n_rows:
+            self.values = np.memmap(self.path / _VALUES, dtype="<f4", mode="r", shape=(n_rows, width))
+        else:
+            self.values = np.zeros((0, width), dtype=np.float32)
+        self.seconds = _read_array(self.path / _SECONDS, "<f8", n_rows)
+
+        # bookingID -> storage position by binary search over the sorted ids
+        self._order = np.argsort(self.booking_ids, kind="stable")
+        self._sorted_ids = np.asarray(self.booking_ids)[self._order]
+
+    def __len__(self):
+        return len(self.booking_ids)
+
+    def __contains__(self, booking_id):
+        return self.position(booking_id) is not None
+
+    def __getitem__(self, booking_id):
+        return self.trip(booking_id)
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def position(self, booking_id):
+        """
+        storage position of a trip, None when it is not stored
+        """
+        i = int(np.searchsorted(self._sorted_ids, int(booking_id)))
+        if i == len(self._sorted_ids) or self._sorted_ids[i] != int(booking_id):
+            return None
+        return int(self._order[i])
+
+    def positions(self, booking_ids) -> np.ndarray:
+        """
+        storage positions of many trips (-1 where not stored)
+        """
+        ids = np.asarray(booking_ids, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self._sorted_ids, ids), max(len(self._sorted_ids) - 1, 0))
+        if len(self._sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        return np.where(self._sorted_ids[i] == ids, self._order[i], -1).astype(np.int64)
+
+    def trip_at(self, i: int) -> np.ndarray:
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def trip(self, booking_id) -> np.ndarray:
+        """
+        (readings, channels) float32 view of one trip's signals, ordered by second; KeyError when not stored
+        """
+        i = self.position(booking_id)
+        if i is None:
+            raise KeyError(booking_id)
+        return self.trip_at(i)
+
+    def sequences(self, booking_ids=None, channels=None) -> list:
+        """
+        one (readings, channels) array per trip (all trips in storage order by default);
+        views unless a channel subset is asked for
+        """
+        if booking_ids is None:
+            positions = range(len(self))
+        else:
+            positions = self.positions(booking_ids)
+            if (positions < 0).any():
+                missing = np.asarray(booking_ids, dtype=np.int64)[positions < 0]
+                raise KeyError(f"trips not in the sequence store: {missing[:10].tolist()}")
+        cols = None if channels is None else [self.channels.index(c) for c in channels]
+        seqs = [self.trip_at(i) for i in positions]
+        return seqs if cols is None else [s[:, cols] for s in seqs]
+
+    def to_sensor_table(self) -> SensorTable:
+        """
+        the stored trips as a feature_engineer.SensorTable (signals are views of the mapped values,
+        second is compacted like the batch path: int32 when every stored second is whole)
+        """
+        return SensorTable.from_sequences(self.booking_ids, self.offsets, self.values, self.channels,
+                                          seconds=self.seconds)
+
+    def append(self, booking_ids, offsets, seconds, values) -> np.ndarray:
+        """
+        appends whole trips: booking_ids (k), offsets (k + 1, from 0) into seconds (rows) and values
+        (rows, channels); trips already stored (or repeated in the batch) are skipped; returns the booking ids appended
+        """
+        booking_ids = np.asarray(booking_ids, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        seconds = np.asarray(seconds, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float32)
+        if values.ndim != 2 or values.shape[1] != len(self.channels):
+            raise ValueError(f"expected values of shape (rows, {len(self.channels)}), got {values.shape}")
+        if len(offsets) != len(booking_ids) + 1 or offsets[0] != 0 or offsets[-1] != len(values):
+            raise ValueError("offsets must run from 0 to len(values) with one entry per trip + 1")
+        if seconds.shape != (len(values),):
+            raise ValueError(f"expected one second per reading ({len(values)}), got {seconds.shape}")
+
+        _, first = np.unique(booking_ids, return_index=True)
+        keep = np.zeros(len(booking_ids), dtype=bool)
+        keep[first] = True
+        keep &= self.positions(booking_ids) < 0
+        if not keep.any():
+            return np.zeros(0, dtype=np.int64)
+        if not keep.all():
+            lens = np.diff(offsets)[keep]
+            rows = np.repeat(keep, np.diff(offsets))
+            booking_ids, seconds, values = booking_ids[keep], seconds[rows], values[rows]
+            offsets = np.concatenate(([0], np.cumsum(lens)))
+
+        n_trips, n_rows = len(self), self.n_rows
+        with instrument.span("sequences.append", rows=len(values), trips=len(booking_ids)):
+            _write_at(self.path / _VALUES, values.astype("<f4", copy=False), n_rows * len(self.channels) * 4)
+            _write_at(self.path / _SECONDS, seconds.astype("<f8", copy=False), n_rows * 8)
+            _write_at(self.path / _BOOKING_IDS, booking_ids.astype("<i8"), n_trips * 8)
+            # committing write: the new trips become visible once their offsets are in place
+            _write_at(self.path / _OFFSETS, (offsets[1:] + n_rows).astype("<i8"), (n_trips + 1) * 8)
+        self._map()
+        return booking_ids
+
+    def append_frame(self, sensor_df: pd.DataFrame) -> np.ndarray:
+        """
+        appends a clean sensor frame of whole trips sorted by (bookingID, second), e.g. one slice of
+        the streaming csv reader; returns the booking ids appended
+        """
+        if len(sensor_df) == 0:
+            return np.zeros(0, dtype=np.int64)
+        keys = sensor_df["bookingID"].to_numpy()
+        starts = _segment_starts(keys)
+        seconds = sensor_df["second"].to_numpy(dtype=np.float64)
+        values = np.empty((len(sensor_df), len(self.channels)), dtype=np.float32)
+        for j, c in enumerate(self.channels):
+            values[:, j] = sensor_df[c].to_numpy() if c in sensor_df.columns else 0.0
+        return self.append(keys[starts], np.append(starts, len(keys)), seconds, values)
+
+
+def build_sequence_store(sensor_path, safety_df: pd.DataFrame, path=SEQUENCE_DIR,
+                         chunksize: int = DEFAULT_CHUNKSIZE, presorted: bool = False,
+                         booking_col: str = None, progress=None) -> SequenceStore:
+    """
+    one streaming pass over sensor_data.csv into the store at path (created if missing), with the
+    chunking of engineer_features_from_csv: presorted input is appended slice by slice, anything else
+    goes through the bookingID bucket spill first (trips are then stored in bucket order)
+
+    trips already in the store are skipped, so running it on a grown file only appends the new ones;
+    progress(trips_appended, fraction) is called after every slice
+    """
+    store = SequenceStore.open(path, create=True)
+    safety_df = _prepare_safety(safety_df)
+
+    with instrument.span("sequences.build") as sp:
+        if presorted:
+            parts = _iter_presorted(sensor_path, safety_df, chunksize, featurize=store.append_frame,
+                                    progress=progress, booking_col=booking_col)
+        else:
+            parts = _iter_external(sensor_path, safety_df, chunksize, featurize=store.append_frame,
+                                   progress=progress, booking_col=booking_col)
+        sp.add(trips=sum(len(p) for p in parts))
+    return store
+
+
+def engineer_features_from_sequences(store: SequenceStore, driver_df: pd.DataFrame, safety_df: pd.DataFrame,
+                                     block_rows: int = None) -> pd.DataFrame:
+    """
+    trip-level features of every stored trip, ordered by bookingID; matches engineer_features_from_raw_tables
+    on the same readings (the vectorized engine reads the mapped values through SensorTable.from_sequences)
+    """
+    safety_df = _prepare_safety(safety_df)
+    table = store.to_sensor_table()
+    with instrument.span("features.sequences", rows=table.n_rows, trips=table.n_trips):
+        engineered = table.features() if block_rows is None else table.features(block_rows)
+    engineered = engineered.sort_values("bookingID", kind="mergesort").reset_index(drop=True)
+
+    with instrument.span("features.safety_merge", trips=len(engineered)):
+        return _attach_safety_meta(engineered, safety_df)
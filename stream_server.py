@@ -0,0 +1,407 @@
+"""
+local streaming ingestion: live sensor readings in, micro-batched trip scores out
+
+protocol: newline-delimited JSON over TCP on localhost, one object per line
+- sensor reading: {"bookingID": 1, "driver_id": 7, "second": 0, "speed": ..., <other SENSOR_COLUMNS>}
+  missing sensor fields count as 0.0 (same as the batch coercion); optional "end": true closes the trip
+- {"cmd": "metrics"}: the server answers with one metrics line
+
+every batch_ms the trips that received readings are scored together in one vectorized model call,
+and {"bookingID", "pred_proba", "pred_label", "readings"} is sent back on the connection that fed
+the trip. finished trips ("end" or idle for idle_timeout seconds) are written to the history with
+save_batch (trip_predictions + driver_history in one transaction). readings for a trip that
+was already closed are dropped (metrics late_readings), they never reopen it
+
+backpressure: readers put events on a bounded queue; when scoring falls behind the queue fills,
+readers stop reading their sockets and TCP flow control slows the producers down
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from .db import init_db, save_batch
+from .feature_engineer import SENSOR_COLUMNS
+from .model_utils import get_runtime
+from .online_features import UPDATE_FIELDS, TripAccumulator, feature_frame
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# scoring tick, bound on queued events, idle seconds before a trip is closed
+DEFAULT_BATCH_MS = 200
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+# bookingIDs of closed trips remembered, so readings arriving after the close don't reopen them
+FINISHED_MEMORY = 100_000
+
+# latencies kept for the percentiles, window for events/sec
+LATENCY_SAMPLES = 10_000
+RATE_WINDOW_SEC = 10.0
+
+
+class _Trip:
+    __slots__ = ("acc", "writer", "last_seen", "first_unscored", "ended")
+
+    def __init__(self, booking_id, driver_id, writer):
+        self.acc = TripAccumulator(booking_id, driver_id)
+        self.writer = writer
+        self.last_seen = time.monotonic()
+        self.first_unscored = None  # receive time of the oldest reading not yet scored
+        self.ended = False
+
+
+class Metrics:
+    """
+    counters + rolling events/sec + ingest-to-score latency percentiles
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.events = 0
+        self.bad_lines = 0
+        self.batches = 0
+        self.scored = 0
+        self.trips_closed = 0
+        self.trips_evicted = 0
+        self.late_readings = 0
+        self._event_times = deque()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def event(self, now):
+        self.events += 1
+        self._event_times.append(now)
+
+    def latency(self, sec):
+        self._latencies.append(sec)
+
+    def snapshot(self, active_trips, queue_depth) -> dict:
+        now = time.monotonic()
+        while self._event_times and now - self._event_times[0] > RATE_WINDOW_SEC:
+            self._event_times.popleft()
+        window = min(RATE_WINDOW_SEC, max(now - self.started, 1e-9))
+
+        lat = np.asarray(self._latencies, dtype=np.float64)
+        pct = {f"latency_p{p}_ms": (float(np.percentile(lat, p)) * 1e3 if len(lat) else None) for p in (50, 95, 99)}
+        return {
+            "uptime_sec": now - self.started,
+            "events": self.events,
+            "events_per_sec": len(self._event_times) / window,
+            "bad_lines": self.bad_lines,
+            "active_trips": active_trips,
+            "queue_depth": queue_depth,
+            "batches": self.batches,
+            "scored": self.scored,
+            "trips_closed": self.trips_closed,
+            "trips_evicted": self.trips_evicted,
+            "late_readings": self.late_readings,
+            **pct,
+        }
+
+
+class IngestServer:
+    """
+    asyncio server; start() binds, serve_forever() runs until stop()
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, threshold=0.5, batch_ms=DEFAULT_BATCH_MS,
+                 queue_size=DEFAULT_QUEUE_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT, backend="model", persist=True):
+        self.host = host
+        self.port = port
+        self.threshold = float(threshold)
+        self.batch_sec = batch_ms / 1000.0
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self.persist = persist
+        self.run_id = None
+
+        self.runtime = get_runtime(backend)
+        self.metrics = Metrics()
+        self.trips = {}
+        # bookingID -> None of the last FINISHED_MEMORY closed trips, oldest first
+        self._finished = OrderedDict()
+
+        self._queue = None
+        self._server = None
+        self._tasks = []
+
+    # ---------------- lifecycle ----------------
+
+    async def start(self):
+        if self.persist:
+            init_db()
+        # warm the model before the first batch
+        await asyncio.to_thread(self.runtime.load)
+
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._server = await asyncio.start_server(self._handle_conn, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._tasks = [asyncio.create_task(self._consume()), asyncio.create_task(self._score_loop())]
+
+    async def serve_forever(self):
+        async with self._server:
+            await asyncio.gather(self._server.serve_forever(), *self._tasks)
+
+    async def stop(self):
+        """
+        stops accepting, folds in whatever is still queued, then scores + persists every open trip
+        """
+        self._server.close()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        while not self._queue.empty():
+            received, msg, writer = self._queue.get_nowait()
+            try:
+                self._apply(received, msg, writer)
+            except (KeyError, TypeError, ValueError):
+                self.metrics.bad_lines += 1
+
+        for trip in self.trips.values():
+            trip.ended = True
+        await self._score_once()
+
+    # ---------------- ingestion ----------------
+
+    async def _handle_conn(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    self.metrics.bad_lines += 1
+                    continue
+
+                if isinstance(msg, dict) and msg.get("cmd") == "metrics":
+                    self._send(writer, self.metrics.snapshot(len(self.trips), self._queue.qsize()))
+                    continue
+
+                # blocks while the queue is full -> this socket is not read -> producer is throttled
+                await self._queue.put((time.monotonic(), msg, writer))
+        except (ConnectionError, asyncio.CancelledError):
+            # peer went away / server shutting down: the handler just ends
+            pass
+        finally:
+            writer.close()
+
+    async def _consume(self):
+        while True:
+            received, msg, writer = await self._queue.get()
+            try:
+                self._apply(received, msg, writer)
+            except (KeyError, TypeError, ValueError):
+                self.metrics.bad_lines += 1
+            finally:
+                self._queue.task_done()
+
+    def _apply(self, received, msg, writer):
+        bid = int(msg["bookingID"])
+        if bid in self._finished:
+            # the trip is already scored + stored; a fresh _Trip would overwrite it with a partial one.
+            # a bare "end" for it is a no-op, readings are counted as late
+            if any(f in msg for f in SENSOR_COLUMNS):
+                self.metrics.late_readings += 1
+            return
+        trip = self.trips.get(bid)
+        if trip is None:
+            trip = self.trips[bid] = _Trip(bid, int(msg.get("driver_id", -1)), writer)
+        trip.writer = writer
+
+        if any(f in msg for f in SENSOR_COLUMNS):
+            trip.acc.update(*(float(msg.get(f) or 0.0) for f in UPDATE_FIELDS))
+            if trip.first_unscored is None:
+                trip.first_unscored = received
+            self.metrics.event(received)
+        trip.last_seen = received
+        trip.ended = trip.ended or bool(msg.get("end"))
+
+    # ---------------- scoring ----------------
+
+    async def _score_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_sec)
+            await self._score_once()
+
+    async def _score_once(self):
+        now = time.monotonic()
+        for trip in self.trips.values():
+            if not trip.ended and now - trip.last_seen > self.idle_timeout:
+                trip.ended = True
+                self.metrics.trips_evicted += 1
+
+        # trips that ended without any reading are simply dropped
+        for bid in [b for b, t in self.trips.items() if t.ended and not t.acc.n]:
+            del self.trips[bid]
+
+        due = [t for t in self.trips.values() if t.first_unscored is not None or t.ended]
+        if not due:
+            return
+
+        # snapshot before the model call: the consumer keeps folding readings in meanwhile
+        features = feature_frame([t.acc for t in due])
+        counts = [t.acc.n for t in due]
+        received = [t.first_unscored for t in due]
+        ended = [t.ended for t in due]
+        for t in due:
+            t.first_unscored = None
+
+        # one model call for every trip that moved since the last tick
+        proba = await asyncio.to_thread(self.runtime.predict_proba, features)
+
+        done = time.monotonic()
+        self.metrics.batches += 1
+        self.metrics.scored += len(due)
+        # an ended trip is only closed when no reading was folded in during the model call;
+        # otherwise it stays open (and ended), and the next tick scores it with every reading
+        closed = [end and t.acc.n == n and self.trips.get(t.acc.booking_id) is t
+                  for t, n, end in zip(due, counts, ended)]
+        for trip, p, rec, n, final in zip(due, proba, received, counts, closed):
+            if rec is not None:
+                self.metrics.latency(done - rec)
+            self._send(trip.writer, {
+                "bookingID": trip.acc.booking_id,
+                "pred_proba": float(p),
+                "pred_label": int(p >= self.threshold),
+                "readings": n,
+                "final": final,
+            })
+
+        rows = [i for i, final in enumerate(closed) if final]
+        if rows:
+            finished = [due[i] for i in rows]
+            for trip in finished:
+                bid = trip.acc.booking_id
+                del self.trips[bid]
+                self._finished[bid] = None
+            while len(self._finished) > FINISHED_MEMORY:
+                self._finished.popitem(last=False)
+            await self._persist(features.iloc[rows], [(due[i], proba[i]) for i in rows])
+
+    async def _persist(self, features, finished):
+        preds = features.reset_index(drop=True)
+        preds["pred_proba"] = [float(p) for _, p in finished]
+        preds["pred_label"] = (preds["pred_proba"] >= self.threshold).astype(int)
+        if self.persist:
+            # every micro-batch of this server counts towards one run
+            stats = await asyncio.to_thread(save_batch, preds, self.threshold,
+                                            model_version=self.runtime.version, run_id=self.run_id)
+            self.run_id = stats["run_id"]
+        self.metrics.trips_closed += len(finished)
+
+    @staticmethod
+    def _send(writer, obj):
+        if writer is not None and not writer.is_closing():
+            writer.write((json.dumps(obj) + "\n").encode("utf-8"))
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, log_every=10.0, **kwargs):
+    """
+    runs an IngestServer until cancelled (Ctrl+C), printing metrics every log_every seconds
+    """
+    server = IngestServer(host=host, port=port, **kwargs)
+    await server.start()
+    print(f"listening on {server.host}:{server.port}", flush=True)
+
+    async def log_metrics():
+        while True:
+            await asyncio.sleep(log_every)
+            print(json.dumps(server.metrics.snapshot(len(server.trips), server._queue.qsize())), flush=True)
+
+    logger = asyncio.create_task(log_metrics()) if log_every else None
+    try:
+        await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if logger is not None:
+            logger.cancel()
+        await server.stop()
+
+
+# ============================================================
+# stub producer
+# ============================================================
+
+async def send_csv(sensor_path, safety_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, rate=0.0, end_trips=True,
+                   final_timeout=30.0):
+    """
+    replays a sensor csv (sorted by second within each trip) to the server, interleaving trips by
+    second like live phones would; rate = readings/sec (0 = as fast as the server accepts);
+    with end_trips every trip is closed at the end and the final scores are awaited
+
+    returns (readings sent, score lines received)
+    """
+    sensor = pd.read_csv(sensor_path)
+    sensor.columns = [c.strip() for c in sensor.columns]
+    if "bookingID" not in sensor.columns:
+        raise ValueError("sensor csv must have a bookingID column")
+    sensor = sensor.sort_values(["second", "bookingID"], kind="mergesort")
+
+    drivers = {}
+    if safety_path is not None:
+        safety = pd.read_csv(safety_path)
+        safety.columns = [c.strip() for c in safety.columns]
+        drivers = dict(zip(safety["bookingID"].astype(int), safety["driver_id"].astype(int)))
+
+    reader, writer = await asyncio.open_connection(host, port)
+    received = 0
+    open_trips = set(int(b) for b in sensor["bookingID"].unique())
+    all_final = asyncio.Event()
+
+    async def read_replies():
+        nonlocal received
+        while line := await reader.readline():
+            received += 1
+            reply = json.loads(line)
+            if reply.get("final"):
+                open_trips.discard(reply["bookingID"])
+                if not open_trips:
+                    all_final.set()
+
+    replies = asyncio.create_task(read_replies())
+    fields = [c for c in SENSOR_COLUMNS if c in sensor.columns]
+    t0 = time.monotonic()
+    sent = 0
+    for row in sensor[["bookingID"] + fields].itertuples(index=False):
+        bid = int(row[0])
+        msg = {"bookingID": bid, "driver_id": drivers.get(bid, -1), **dict(zip(fields, map(float, row[1:])))}
+        writer.write((json.dumps(msg) + "\n").encode("utf-8"))
+        sent += 1
+        if rate:
+            delay = t0 + sent / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        # honours the server's backpressure
+        await writer.drain()
+
+    if end_trips:
+        for bid in sorted(open_trips):
+            writer.write((json.dumps({"bookingID": bid, "end": True}) + "\n").encode("utf-8"))
+        await writer.drain()
+
+        # hanging up early would drop the final scores (and unread readings) on the server side
+        try:
+            await asyncio.wait_for(all_final.wait(), timeout=final_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    writer.close()
+    replies.cancel()
+    return sent, received
+
+
+async def fetch_metrics(host=DEFAULT_HOST, port=DEFAULT_PORT) -> dict:
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"cmd": "metrics"}\n')
+    await writer.drain()
+    line = await reader.readline()
+    writer.close()
+    return json.loads(line)
@@ -0,0 +1,13 @@
+"""
+makes the repo importable as the gobest package (python -m pytest tests), whatever the checkout directory is called
+"""
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+if "gobest" not in sys.modules:
+    package = types.ModuleType("gobest")
+    package.__path__ = [str(ROOT)]
+    sys.modules["gobest"] = package
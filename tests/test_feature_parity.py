@@ -0,0 +1,123 @@
+"""
+every feature path against the reference per-trip loop (engine="loop") on the same synthetic trips:
+vectorized engine, process shards, streamed csv (presorted + bucket spill), SensorTable, sequence store
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from gobest.bench import synthetic_sensor_tables
+from gobest.feature_engineer import (
+    FEATURE_COLUMNS,
+    SensorTable,
+    _attach_safety_meta,
+    _prepare_safety,
+    engineer_features_from_csv,
+    engineer_features_from_raw_tables,
+)
+from gobest.sequence_store import build_sequence_store, engineer_features_from_sequences
+
+# signals are float32 in the compact engines, float64 in the loop
+RTOL = 1e-4
+ATOL = 1e-4
+
+
+@pytest.fixture(scope="module")
+def raw_tables():
+    """
+    shuffled synthetic trips + single-reading trips + runs of duplicate seconds
+    """
+    rng = np.random.default_rng(7)
+    sensor_df, driver_df, safety_df = synthetic_sensor_tables(60, mean_len=40, seed=7, shuffle=False)
+
+    # duplicate seconds inside trips (ties have to keep file order on every path)
+    dup = np.flatnonzero(rng.random(len(sensor_df)) < 0.05)
+    dup = dup[dup > 0]
+    dup = dup[sensor_df["bookingID"].to_numpy()[dup] == sensor_df["bookingID"].to_numpy()[dup - 1]]
+    sensor_df.loc[dup, "second"] = sensor_df["second"].to_numpy()[dup - 1]
+
+    # trips of a single reading
+    singles = sensor_df.iloc[:3].copy()
+    singles["bookingID"] = [11, 22, 33]
+    sensor_df = pd.concat([sensor_df, singles], ignore_index=True)
+    safety_df = pd.concat([safety_df, pd.DataFrame({"bookingID": [11, 22, 33], "driver_id": 0, "label": 1})],
+                          ignore_index=True)
+
+    sensor_df = sensor_df.iloc[rng.permutation(len(sensor_df))].reset_index(drop=True)
+    return sensor_df, driver_df, safety_df
+
+
+@pytest.fixture(scope="module")
+def reference(raw_tables):
+    return engineer_features_from_raw_tables(*raw_tables, engine="loop")
+
+
+def assert_same_features(result: pd.DataFrame, expected: pd.DataFrame):
+    assert list(result.columns) == list(expected.columns)
+    assert len(result) == len(expected)
+    np.testing.assert_array_equal(result["bookingID"].to_numpy(), expected["bookingID"].to_numpy())
+    for c in expected.columns:
+        assert result[c].dtype.kind == expected[c].dtype.kind, c
+        np.testing.assert_allclose(result[c].to_numpy(dtype=np.float64), expected[c].to_numpy(dtype=np.float64),
+                                   rtol=RTOL, atol=ATOL, err_msg=c)
+
+
+def test_fixture_has_edge_cases(raw_tables, reference):
+    sensor_df = raw_tables[0]
+    assert (sensor_df.groupby("bookingID").size() == 1).sum() >= 3
+    assert sensor_df.duplicated(["bookingID", "second"]).any()
+    assert not sensor_df["bookingID"].is_monotonic_increasing
+    assert list(reference.columns[:len(FEATURE_COLUMNS)]) == FEATURE_COLUMNS
+    assert reference["bookingID"].is_monotonic_increasing
+
+
+def test_vectorized_engine(raw_tables, reference):
+    assert_same_features(engineer_features_from_raw_tables(*raw_tables), reference)
+
+
+def test_sharded_workers(raw_tables, reference):
+    assert_same_features(engineer_features_from_raw_tables(*raw_tables, workers=2), reference)
+
+
+def test_sensor_table(raw_tables, reference):
+    sensor_df, _, safety_df = raw_tables
+    safety_df = _prepare_safety(safety_df)
+    table = SensorTable.from_frame(sensor_df, safety_df)
+    assert_same_features(_attach_safety_meta(table.features(block_rows=200), safety_df), reference)
+
+
+@pytest.mark.parametrize("presorted", [False, True])
+def test_streamed_csv(raw_tables, reference, tmp_path, presorted):
+    sensor_df, driver_df, safety_df = raw_tables
+    if presorted:
+        # stable, so tied seconds keep the order the loop engine saw
+        sensor_df = sensor_df.iloc[np.lexsort((sensor_df["second"], sensor_df["bookingID"]))]
+    path = tmp_path / "sensor_data.csv"
+    sensor_df.to_csv(path, index=False)
+
+    # small chunks, so trips straddle chunk / bucket boundaries
+    result = engineer_features_from_csv(path, driver_df, safety_df, chunksize=300, presorted=presorted)
+    assert_same_features(result, reference)
+
+
+def test_sequence_store(raw_tables, reference, tmp_path):
+    sensor_df, driver_df, safety_df = raw_tables
+    path = tmp_path / "sensor_data.csv"
+    sensor_df.to_csv(path, index=False)
+
+    store = build_sequence_store(path, safety_df, path=tmp_path / "store", chunksize=300)
+    assert_same_features(engineer_features_from_sequences(store, driver_df, safety_df), reference)
+
+
+def test_sequence_store_fractional_seconds(raw_tables, tmp_path):
+    # epoch-like timestamps in quarter seconds: float32 would round them to 128s steps
+    sensor_df, driver_df, safety_df = raw_tables
+    sensor_df = sensor_df.assign(second=1.6e9 + sensor_df["second"] * 0.25)
+    path = tmp_path / "sensor_data.csv"
+    sensor_df.to_csv(path, index=False)
+
+    store = build_sequence_store(path, safety_df, path=tmp_path / "store", chunksize=300)
+    second = store.to_sensor_table().columns["second"]
+    assert second.dtype == np.float64
+    expected = engineer_features_from_raw_tables(sensor_df, driver_df, safety_df, engine="loop")
+    assert_same_features(engineer_features_from_sequences(store, driver_df, safety_df), expected)
@@ -0,0 +1,38 @@
+"""
+the live feature frame (online_features.feature_frame) against the batch feature frame
+"""
+import numpy as np
+
+from gobest.bench import synthetic_sensor_tables
+from gobest.feature_engineer import engineer_features_from_raw_tables
+from gobest.online_features import FRAME_COLUMNS, UPDATE_FIELDS, TripAccumulator, feature_frame
+
+
+def test_live_frame_matches_batch_frame():
+    """
+    same columns + dtypes; integer columns (counts, ids) equal exactly, float features within 1e-4
+    """
+    sensor_df, driver_df, safety_df = synthetic_sensor_tables(20, mean_len=30, seed=3)
+    batch = engineer_features_from_raw_tables(sensor_df, driver_df, safety_df)
+    assert list(batch.columns) == FRAME_COLUMNS
+
+    drivers = dict(zip(safety_df["bookingID"], safety_df["driver_id"]))
+    rows = sensor_df.sort_values(["bookingID", "second"], kind="mergesort")
+    accumulators = []
+    for bid, trip in rows.groupby("bookingID", sort=True):
+        acc = TripAccumulator(int(bid), driver_id=drivers[bid])
+        for values in trip[UPDATE_FIELDS].to_numpy(dtype=np.float64):
+            acc.update(*values)
+        accumulators.append(acc)
+    live = feature_frame(accumulators)
+
+    assert list(live.columns) == FRAME_COLUMNS
+    assert live["label"].isna().all()
+    for c in FRAME_COLUMNS[:-1]:
+        assert live[c].dtype.kind == batch[c].dtype.kind, c
+        if batch[c].dtype.kind in "iu":
+            np.testing.assert_array_equal(live[c].to_numpy(), batch[c].to_numpy(), err_msg=c)
+        else:
+            np.testing.assert_allclose(live[c].to_numpy(dtype=np.float64), batch[c].to_numpy(dtype=np.float64),
+                                       rtol=1e-4, atol=1e-4, err_msg=c)
+    assert accumulators[0].feature_frame().equals(live.iloc[:1])
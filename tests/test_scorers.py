@@ -0,0 +1,53 @@
+"""
+the xgboost scorer against model_utils after the artifacts were replaced
+"""
+import json
+
+import joblib
+import numpy as np
+import pytest
+
+from gobest import model_utils
+from gobest.bench import synthetic_sensor_tables
+from gobest.feature_engineer import FEATURE_COLUMNS, engineer_features_from_raw_tables
+from gobest.scorers import get_scorer, reset_scorers
+
+xgboost = pytest.importorskip("xgboost")
+
+
+def _save_model(engineered, seed):
+    cols = FEATURE_COLUMNS[1:]
+    model = xgboost.XGBClassifier(n_estimators=5, max_depth=3, random_state=seed, subsample=0.7)
+    model.fit(engineered[cols].to_numpy(dtype=np.float32), engineered["label"].astype(int))
+    joblib.dump(model, model_utils.MODEL_PATH)
+    model_utils.FEATURE_COLS_PATH.write_text(json.dumps(cols), encoding="utf-8")
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_utils, "MODEL_PATH", tmp_path / "xgboost_best_model.joblib")
+    monkeypatch.setattr(model_utils, "SCALER_PATH", tmp_path / "xgboost_scaler.joblib")
+    monkeypatch.setattr(model_utils, "FEATURE_COLS_PATH", tmp_path / "xgboost_feature_cols.json")
+    model_utils.reset_runtime()
+    reset_scorers()
+    yield tmp_path
+    model_utils.reset_runtime()
+    reset_scorers()
+
+
+def test_tree_scorer_follows_reset_runtime(models_dir):
+    engineered = engineer_features_from_raw_tables(*synthetic_sensor_tables(80, mean_len=30, seed=2))
+    _save_model(engineered, seed=0)
+    scorer = get_scorer("xgboost")
+    first = scorer.version
+    scorer.score(engineered)
+
+    # retrained artifacts, reloaded the documented way; the cached scorer is kept
+    _save_model(engineered, seed=1)
+    model_utils.reset_runtime()
+    assert get_scorer("xgboost") is scorer
+
+    preds = scorer.score(engineered)
+    runtime = model_utils.get_runtime("model")
+    assert scorer.version == runtime.version == model_utils.artifacts_version() != first
+    np.testing.assert_array_equal(preds["pred_proba"].to_numpy(), runtime.predict_proba(engineered))
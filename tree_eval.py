@@ -0,0 +1,129 @@
+"""
+pure numpy evaluation of a trained xgboost binary classifier
+
+every tree of the booster is flattened into shared node arrays (feature, threshold, children,
+default direction, leaf value); a batch is evaluated by stepping all (row, tree) pairs one level
+at a time, so the per-call cost is a handful of vectorized gathers instead of a DMatrix build
+"""
+import json
+
+import numpy as np
+
+
+def _parse_base_score(raw) -> float:
+    # xgboost >= 3 stores it as "[5.0E-1]"
+    return float(str(raw).strip("[]"))
+
+
+class FlatTreeEnsemble:
+    """
+    gbtree + binary:logistic only (numeric splits, one output group); built with from_xgboost()
+    """
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, depth, base_margin):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base_margin = base_margin
+
+    @classmethod
+    def from_xgboost(cls, model) -> "FlatTreeEnsemble":
+        """
+        model: xgboost.XGBClassifier or xgboost.Booster; raises ValueError for unsupported models
+        """
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        if not hasattr(booster, "save_raw"):
+            raise ValueError("numpy tree backend needs an xgboost model")
+
+        learner = json.loads(bytes(booster.save_raw(raw_format="json")))["learner"]
+        if learner["objective"]["name"] != "binary:logistic":
+            raise ValueError(f"numpy tree backend supports binary:logistic only, got {learner['objective']['name']}")
+
+        gbm = learner["gradient_booster"]
+        if gbm.get("name", "gbtree") != "gbtree" or "model" not in gbm:
+            raise ValueError("numpy tree backend supports gbtree boosters only")
+        trees = gbm["model"]["trees"]
+
+        # sklearn models with early stopping predict with best_iteration + 1 rounds only
+        n_trees = len(trees)
+        best = getattr(model, "best_iteration", None) if model is not booster else None
+        if best is not None and "iteration_indptr" in gbm["model"]:
+            n_trees = int(gbm["model"]["iteration_indptr"][best + 1])
+        trees = trees[:n_trees]
+
+        feature, threshold, left, right, default_left, value, roots, depths = [], [], [], [], [], [], [], []
+        offset = 0
+        for t in trees:
+            if any(t.get("split_type", [])):
+                raise ValueError("numpy tree backend does not support categorical splits")
+
+            lc = np.asarray(t["left_children"], dtype=np.int64)
+            rc = np.asarray(t["right_children"], dtype=np.int64)
+            n = len(lc)
+            idx = np.arange(n, dtype=np.int64)
+            leaf = lc == -1
+
+            # leaves point at themselves, so extra steps past a leaf are no-ops
+            left.append(np.where(leaf, idx, lc) + offset)
+            right.append(np.where(leaf, idx, rc) + offset)
+            feature.append(np.where(leaf, 0, t["split_indices"]))
+            # split_conditions holds the leaf value on leaf nodes
+            cond = np.asarray(t["split_conditions"], dtype=np.float32)
+            threshold.append(np.where(leaf, np.float32(0), cond))
+            value.append(np.where(leaf, cond, np.float32(0)))
+            default_left.append(np.asarray(t["default_left"], dtype=bool))
+            roots.append(offset)
+            depths.append(_tree_depth(lc, rc))
+            offset += n
+
+        p = _parse_base_score(learner["learner_model_param"]["base_score"])
+        return cls(
+            feature=np.concatenate(feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            left=np.concatenate(left).astype(np.int32),
+            right=np.concatenate(right).astype(np.int32),
+            default_left=np.concatenate(default_left),
+            value=np.concatenate(value).astype(np.float32),
+            roots=np.asarray(roots, dtype=np.int32),
+            depth=max(depths, default=0),
+            base_margin=float(np.log(p / (1.0 - p))),
+        )
+
+    def margin(self, X: np.ndarray) -> np.ndarray:
+        """
+        raw scores for a float32 (n_rows, n_features) matrix; NaN follows the default direction
+        """
+        n = len(X)
+        node = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+        rows = np.arange(n)[:, None]
+
+        for _ in range(self.depth):
+            x = X[rows, self.feature[node]]
+            go_left = np.where(np.isnan(x), self.default_left[node], x < self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.value[node].sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        (n_rows, 2) like XGBClassifier.predict_proba
+        """
+        p1 = 1.0 / (1.0 + np.exp(-self.margin(X)))
+        return np.column_stack([1.0 - p1, p1])
+
+
+def _tree_depth(lc: np.ndarray, rc: np.ndarray) -> int:
+    depth, stack = 0, [(0, 0)]
+    while stack:
+        i, d = stack.pop()
+        if lc[i] == -1:
+            depth = max(depth, d)
+        else:
+            stack.append((lc[i], d + 1))
+            stack.append((rc[i], d + 1))
+    return depth
@@ -1,9 +1,27 @@
+import os
+import queue
+import threading
 import tkinter as tk
+from contextlib import ExitStack
 from tkinter import ttk, filedialog, messagebox
 
-import pandas as pd
+from . import instrument
+from .pipeline import BatchCancelled, run_batch
+from .scorers import SCORERS
 
-from .model_utils import predict_from_raw
+# how often (ms) the Tk thread drains progress events from the worker
+POLL_MS = 100
+
+STAGE_LABELS = {
+    "validate": "checking file columns",
+    "parse": "loading CSV files",
+    "features": "engineering features",
+    "predict": "predicting ({model})",
+    "persist": "saving to history",
+    "explain": "explaining trips (feature contributions)",
+}
+# {model} of the stage labels, by scorers.SCORERS name
+SCORER_LABELS = {"xgboost": "XGBoost", "sequence": "sequence model"}
 
 
 class BatchFrame(ttk.Frame):
@@ -15,8 +33,22 @@ class BatchFrame(ttk.Frame):
         self.driver_path = tk.StringVar()
         self.safety_path = tk.StringVar()
 
+        self.presorted = tk.BooleanVar(value=False)
+        self.use_cache = tk.BooleanVar(value=True)
+        self.use_store = tk.BooleanVar(value=True)
+        self.explain = tk.BooleanVar(value=True)
+        self.workers = tk.IntVar(value=1)
+        self.scorer = tk.StringVar(value="xgboost")
+
         self.threshold = tk.DoubleVar(value=0.50)
 
+        # background run: the worker thread only puts events on the queue, Tk widgets are touched in _poll
+        self._events = queue.Queue()
+        self._cancel = None
+        self._worker = None
+        # scorer of the running batch, for the "predict" stage label
+        self._run_scorer = "xgboost"
+
         self._build()
 
     def _build(self):
@@ -44,6 +76,27 @@ class BatchFrame(ttk.Frame):
         self._file_row(files, 1, "driver_data.csv (must include id)", self.driver_path)
         self._file_row(files, 2, "safety_labels.csv (bookingID + driver_id)", self.safety_path)
 
+        ttk.Checkbutton(
+            files,
+            text="sensor_data.csv is already sorted by bookingID, second (skips the on-disk sort)",
+            variable=self.presorted,
+        ).grid(row=3, column=0, columnspan=3, sticky="w", pady=(6, 0))
+        ttk.Checkbutton(
+            files,
+            text="Cache parsed CSVs (binary, memory-mapped on later runs with the same files)",
+            variable=self.use_cache,
+        ).grid(row=4, column=0, columnspan=3, sticky="w", pady=(2, 0))
+        ttk.Checkbutton(
+            files,
+            text="Reuse stored features for trips seen in earlier runs (only new/changed trips are recomputed)",
+            variable=self.use_store,
+        ).grid(row=5, column=0, columnspan=3, sticky="w", pady=(2, 0))
+        ttk.Checkbutton(
+            files,
+            text="Explain trips: store which features drove each score (shown instantly in the Single Trip tab)",
+            variable=self.explain,
+        ).grid(row=6, column=0, columnspan=3, sticky="w", pady=(2, 0))
+
         # threshold card
         thr = ttk.LabelFrame(self, text="Step 2: Choose threshold (decision cutoff)", padding=12)
         thr.grid(row=3, column=0, sticky="ew", pady=(12, 0))
@@ -86,6 +139,13 @@ class BatchFrame(ttk.Frame):
 
         ttk.Button(row, text="Set", command=self._apply_threshold_entry).grid(row=0, column=3, sticky="e", padx=(6, 0))
 
+        # live summary of the last batch at the slider's threshold (no re-run needed)
+        self.sweep_label = ttk.Label(thr, text="", style="Hint.TLabel")
+        self.sweep_label.grid(row=4, column=0, sticky="w", pady=(6, 0))
+        self.export_btn = ttk.Button(thr, text="Export predictions at this threshold…", command=self._export_at_threshold,
+                                     state="disabled")
+        self.export_btn.grid(row=5, column=0, sticky="w", pady=(6, 0))
+
         self.threshold.trace_add("write", self._on_threshold_change)
 
         # run card
@@ -96,11 +156,28 @@ class BatchFrame(ttk.Frame):
         btn_row = ttk.Frame(run)
         btn_row.grid(row=0, column=0, sticky="w")
 
-        ttk.Button(btn_row, text="Run Batch Prediction", command=self._run).grid(row=0, column=0, padx=(0, 10))
-        ttk.Button(btn_row, text="Load bookingIDs into Single Trip tab", command=self._push_to_single).grid(row=0, column=1)
+        self.run_btn = ttk.Button(btn_row, text="Run Batch Prediction", command=self._run)
+        self.run_btn.grid(row=0, column=0, padx=(0, 10))
+        self.cancel_btn = ttk.Button(btn_row, text="Cancel", command=self._cancel_run, state="disabled")
+        self.cancel_btn.grid(row=0, column=1, padx=(0, 10))
+        ttk.Button(btn_row, text="Load bookingIDs into Single Trip tab", command=self._push_to_single).grid(row=0, column=2)
+
+        # trips are sharded across worker processes during feature engineering
+        ttk.Label(btn_row, text="Worker processes:").grid(row=0, column=3, padx=(20, 6))
+        ttk.Spinbox(btn_row, from_=1, to=os.cpu_count() or 1, textvariable=self.workers, width=4).grid(row=0, column=4)
+
+        # "sequence" scores the raw readings (needs the parse cache + a model from 'python -m gobest sequences train')
+        ttk.Label(btn_row, text="Model:").grid(row=0, column=5, padx=(20, 6))
+        ttk.Combobox(btn_row, textvariable=self.scorer, values=SCORERS, state="readonly", width=10).grid(row=0, column=6)
+
+        self.progress = ttk.Progressbar(run, orient="horizontal", mode="determinate", maximum=1.0)
+        self.progress.grid(row=1, column=0, sticky="ew", pady=(10, 0))
 
         self.status = ttk.Label(run, text="Status: waiting for input…", style="Hint.TLabel")
-        self.status.grid(row=1, column=0, sticky="w", pady=(10, 0))
+        self.status.grid(row=2, column=0, sticky="w", pady=(6, 0))
+
+        self.timings_label = ttk.Label(run, text="", style="Hint.TLabel")
+        self.timings_label.grid(row=3, column=0, sticky="w", pady=(2, 0))
 
         self.grid_columnconfigure(0, weight=1)
 
@@ -119,6 +196,26 @@ class BatchFrame(ttk.Frame):
         self.thr_label.config(text=f"Current threshold: {v:.2f}")
         self.thr_entry.delete(0, "end")
         self.thr_entry.insert(0, f"{v:.2f}")
+        self._show_sweep(v)
+
+    def _show_sweep(self, v):
+        text = self.app.threshold_summary(v)
+        if text is not None:
+            self.sweep_label.config(text=text)
+
+    def _export_at_threshold(self):
+        if self.app.score_index is None:
+            return
+        v = float(self.threshold.get())
+        out_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+            initialfile=f"batch_predictions_t{v:.2f}.csv",
+            title="Save predictions at the current threshold",
+        )
+        if out_path:
+            out = self.app.preds.assign(pred_label=self.app.score_index.labels_at(v))
+            out.to_csv(out_path, index=False)
 
     def _apply_threshold_entry(self):
         try:
@@ -130,6 +227,9 @@ class BatchFrame(ttk.Frame):
             messagebox.showerror("Invalid threshold", "Enter a number between 0.10 and 0.90")
 
     def _run(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+
         sp = self.sensor_path.get().strip()
         dp = self.driver_path.get().strip()
         lp = self.safety_path.get().strip()
@@ -138,42 +238,167 @@ class BatchFrame(ttk.Frame):
             messagebox.showerror("Missing files", "Please select all 3 raw CSV files first.")
             return
 
+        # the Spinbox is free text: anything but a whole number makes IntVar.get() raise
         try:
-            self.status.config(text="Status: loading CSV files…")
-            self.update_idletasks()
-
-            sensor_df = pd.read_csv(sp)
-            driver_df = pd.read_csv(dp)
-            safety_df = pd.read_csv(lp)
-
-            self.status.config(text="Status: engineering features + predicting (XGBoost)…")
-            self.update_idletasks()
-
-            preds = predict_from_raw(sensor_df, driver_df, safety_df, threshold=float(self.threshold.get()))
-
-            # store into App for single tab
-            self.app.set_shared_data(sensor_df, driver_df, safety_df, preds)
-
-            # prompt save
-            out_path = filedialog.asksaveasfilename(
-                defaultextension=".csv",
-                filetypes=[("CSV files", "*.csv")],
-                initialfile="batch_predictions.csv",
-                title="Save prediction output CSV",
-            )
-            if out_path:
-                preds.to_csv(out_path, index=False)
+            workers = max(1, int(self.workers.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Invalid workers", "Workers must be a whole number, e.g. 1.")
+            return
 
-            pos = int((preds["pred_label"] == 1).sum())
-            total = int(len(preds))
-            self.status.config(text=f"Status: done. predicted dangerous: {pos}/{total}. history updated.")
+        # Tk variables are read here, never from the worker thread
+        kwargs = dict(
+            threshold=float(self.threshold.get()),
+            workers=workers,
+            use_cache=bool(self.use_cache.get()),
+            use_store=bool(self.use_store.get()),
+            presorted=bool(self.presorted.get()),
+            explain=bool(self.explain.get()),
+            scorer=self.scorer.get(),
+        )
+
+        # Tools > "Profile next batch run" adds a cProfile + tracemalloc capture to this run only
+        profile_dir = None
+        if self.app.profile_next_run.get():
+            self.app.profile_next_run.set(False)
+            profile_dir = filedialog.askdirectory(title="Folder for the profile output") or None
+
+        self._cancel = threading.Event()
+        self._events = queue.Queue()
+        self._run_scorer = kwargs["scorer"]
+        self._worker = threading.Thread(target=self._work, args=(sp, dp, lp, kwargs, profile_dir), daemon=True)
+
+        self.run_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+        self.progress.config(value=0.0)
+        self.timings_label.config(text="")
+        self.status.config(text="Status: starting…")
+
+        self._worker.start()
+        self.after(POLL_MS, self._poll)
+
+    def _work(self, sp, dp, lp, kwargs, profile_dir=None):
+        """
+        worker thread: everything goes back to Tk through self._events
+        """
+        events = self._events
+        # every run is recorded (spans are cheap); the trace is handed over before the outcome
+        with ExitStack() as stack:
+            rec = stack.enter_context(instrument.session())
+            if profile_dir:
+                stack.enter_context(instrument.capture(profile_dir))
+            try:
+                result = run_batch(sp, dp, lp, report=lambda ev: events.put(("progress", ev)),
+                                   cancel_event=self._cancel, **kwargs)
+                outcome = ("done", result)
+            except BatchCancelled:
+                outcome = ("cancelled", None)
+            except Exception as e:
+                outcome = ("error", e)
+        events.put(("trace", rec))
+        events.put(outcome)
+
+    def _cancel_run(self):
+        if self._cancel is not None:
+            self._cancel.set()
+            self.cancel_btn.config(state="disabled")
+            self.status.config(text="Status: cancelling after the current slice…")
+
+    def _poll(self):
+        last = None
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                last = payload
+                continue
+            if kind == "trace":
+                self.app.last_trace = payload
+                continue
+
+            self._finish(kind, payload)
+            return
 
-            # refresh history tab
-            self.app.refresh_history()
+        if last is not None:
+            self._show_progress(last)
+        self.after(POLL_MS, self._poll)
+
+    def _show_progress(self, ev):
+        stage = ev["stage"]
+        fraction = ev["fraction"]
+        elapsed = ev["elapsed"]
+
+        model = SCORER_LABELS.get(self._run_scorer, self._run_scorer)
+        text = f"Status: {STAGE_LABELS.get(stage, stage).format(model=model)}…"
+        if stage == "features":
+            if fraction is not None:
+                self.progress.config(value=fraction)
+            rate = ev["trips"] / elapsed if elapsed > 0 else 0.0
+            text += f" {ev['trips']:,} trips, {rate:,.0f} trips/s"
+            if fraction:
+                eta = elapsed * (1.0 - fraction) / fraction
+                text += f", ETA {eta:,.0f}s"
+
+        self.status.config(text=text)
+        self.timings_label.config(text=self._format_timings(ev["timings"]))
+
+    @staticmethod
+    def _format_timings(timings):
+        return "  ".join(f"{stage}: {sec:.1f}s" for stage, sec in timings.items())
+
+    def _finish(self, kind, payload):
+        self.run_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+        self._worker = None
+
+        if kind == "cancelled":
+            self.progress.config(value=0.0)
+            self.status.config(text="Status: cancelled. nothing was saved to history.")
+            return
 
-        except Exception as e:
-            messagebox.showerror("Batch prediction failed", str(e))
+        if kind == "error":
+            messagebox.showerror("Batch prediction failed", str(payload))
             self.status.config(text="Status: error occurred. check your CSV columns.")
+            return
+
+        if payload["schema"].warnings:
+            messagebox.showwarning("Input file warnings", "\n".join(payload["schema"].warnings))
+
+        preds = payload["preds"]
+        self.progress.config(value=1.0)
+        self.timings_label.config(text=self._format_timings(payload["timings"]))
+
+        # store into App for single tab
+        # sensor_df (memory-mapped, sorted) lets the Single Trip tab replay a trip reading by reading
+        self.app.set_shared_data(payload["sensor_df"], payload["driver_df"], payload["safety_df"], preds,
+                                 scorer=payload["scorer"], backend=payload["backend"])
+        self.export_btn.config(state="normal")
+        self._show_sweep(float(self.threshold.get()))
+
+        # prompt save
+        out_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+            initialfile="batch_predictions.csv",
+            title="Save prediction output CSV",
+        )
+        if out_path:
+            preds.to_csv(out_path, index=False)
+
+        pos = int((preds["pred_label"] == 1).sum())
+        total = int(len(preds))
+        seen = payload["store_hits"] + payload["store_misses"]
+        reused = f" features reused for {payload['store_hits']}/{seen} trips." if seen else ""
+        history = payload.get("history")
+        stored = (f" history: {history['inserted']} new, {history['updated']} updated, {history['unchanged']} unchanged."
+                  if history else "")
+        self.status.config(text=f"Status: done. predicted dangerous: {pos}/{total}.{stored}{reused}")
+
+        # refresh history tab
+        self.app.refresh_history()
+        if self.app.last_trace is not None:
+            self.app.status.config(text=self.app.last_trace.status_line())
 
     def _push_to_single(self):
         if self.app.preds is None:
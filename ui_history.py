@@ -1,13 +1,126 @@
+import queue
+import threading
 import tkinter as tk
-from tkinter import ttk
+from collections import OrderedDict
+from datetime import date, timedelta
+from tkinter import ttk, messagebox
 
-from .db import fetch_db_stats, fetch_recent_predictions, fetch_top_drivers
+from .db import count_predictions, fetch_db_stats, fetch_prediction_page, fetch_top_drivers
+
+# rows per db query / pages kept per filter set (LRU)
+PAGE_ROWS = 200
+CACHE_PAGES = 32
+
+# the table only ever holds this many items; scrolling swaps their values
+VISIBLE_ROWS = 20
+
+# rows per mouse-wheel notch / arrow key
+SCROLL_ROWS = 3
+
+# how often (ms) the Tk thread drains loaded pages from the worker
+POLL_MS = 50
+
+LABEL_CHOICES = {"any": None, "dangerous (1)": 1, "safe (0)": 0}
+
+_COLUMNS = [
+    # (id, heading, width, format of the page row value)
+    ("created_at", "created_at", 190, str),
+    ("bookingID", "bookingID", 110, str),
+    ("driver_id", "driver", 80, str),
+    ("pred_proba", "p", 70, lambda v: f"{v:.3f}"),
+    ("pred_label", "pred", 50, str),
+    ("threshold", "thr", 60, lambda v: "" if v is None else f"{v:.2f}"),
+    ("model_version", "model", 130, lambda v: v or "-"),
+]
+# position of each column in a fetch_prediction_page row (created_at, rowid, bookingID, ...)
+_ROW_INDEX = [0, 2, 3, 4, 5, 6, 7]
+
+
+class PredictionPages:
+    """
+    rows of one filter set, fetched a page at a time (off the Tk thread) and kept in a small LRU cache
+
+    page k starts right after the last row of page k-1 (keyset cursor created_at, rowid), so paging
+    costs the same at any depth; a page whose predecessor was never loaded (scrollbar jump) is
+    fetched once by offset, and paging continues by cursor from there
+    """
+
+    def __init__(self, filters, page_rows=PAGE_ROWS, cache_pages=CACHE_PAGES):
+        self.filters = dict(filters)
+        self.page_rows = page_rows
+        self.cache_pages = cache_pages
+        self.total = None     # matching rows, once count() ran
+        self.pages = None     # number of pages, once the last one was seen
+        self._cache = OrderedDict()
+        self._cursors = {0: None}
+        self._lock = threading.Lock()
+
+    def cached(self, k):
+        with self._lock:
+            rows = self._cache.get(k)
+            if rows is not None:
+                self._cache.move_to_end(k)
+            return rows
+
+    def load(self, k):
+        """
+        rows of page k (blocking)
+        """
+        rows = self.cached(k)
+        if rows is not None:
+            return rows
+        with self._lock:
+            by_cursor = k in self._cursors
+            cursor = self._cursors.get(k)
+        if by_cursor:
+            rows = fetch_prediction_page(after=cursor, limit=self.page_rows, **self.filters)
+        else:
+            rows = fetch_prediction_page(offset=k * self.page_rows, limit=self.page_rows, **self.filters)
+
+        with self._lock:
+            self._cache[k] = rows
+            while len(self._cache) > self.cache_pages:
+                self._cache.popitem(last=False)
+            if len(rows) == self.page_rows:
+                self._cursors[k + 1] = (rows[-1][0], rows[-1][1])
+            else:
+                self.pages = k + (1 if rows else 0)
+        return rows
+
+    def count(self):
+        self.total = count_predictions(**self.filters)
+        self.pages = -(-self.total // self.page_rows)
+        return self.total
+
+    def known_rows(self):
+        """
+        rows the scrollbar spans: the count when known, else up to the end of the furthest page reached
+        """
+        if self.total is not None:
+            return self.total
+        with self._lock:
+            return (max(self._cursors) + 1) * self.page_rows
 
 
 class HistoryFrame(ttk.Frame):
     def __init__(self, master):
         super().__init__(master, padding=12)
+
+        self.driver_filter = tk.StringVar()
+        self.from_filter = tk.StringVar()
+        self.to_filter = tk.StringVar()
+        self.label_filter = tk.StringVar(value="any")
+
+        # page loads run on one worker thread; newest requests first, results drained in _poll
+        self._requests = queue.LifoQueue()
+        self._loaded = queue.Queue()
+        self._pending = set()
+        self._pages = PredictionPages({})
+        self._offset = 0
+        threading.Thread(target=self._work, name="gobest-history-pages", daemon=True).start()
+
         self._build()
+        self.after(POLL_MS, self._poll)
 
     def _build(self):
         ttk.Label(self, text="History (SQLite Database)", style="Title.TLabel").grid(row=0, column=0, sticky="w")
@@ -24,23 +137,62 @@ class HistoryFrame(ttk.Frame):
         self.stats_text = ttk.Label(self.stats_card, text="", style="Hint.TLabel", wraplength=860)
         self.stats_text.grid(row=0, column=0, sticky="w")
 
-        # two columns: recent + top drivers
+        # two columns: predictions table + top drivers
         grid = ttk.Frame(self)
         grid.grid(row=3, column=0, sticky="nsew", pady=(12, 0))
-        grid.columnconfigure(0, weight=1)
+        grid.columnconfigure(0, weight=3)
         grid.columnconfigure(1, weight=1)
         grid.rowconfigure(0, weight=1)
 
-        self.recent_card = ttk.LabelFrame(grid, text="Recent Predictions", padding=10)
+        self.recent_card = ttk.LabelFrame(grid, text="Predictions (newest first)", padding=10)
         self.recent_card.grid(row=0, column=0, sticky="nsew", padx=(0, 8))
+        self.recent_card.columnconfigure(0, weight=1)
+        self.recent_card.rowconfigure(1, weight=1)
+
+        filters = ttk.Frame(self.recent_card)
+        filters.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 8))
+        ttk.Label(filters, text="driver_id").pack(side="left")
+        ttk.Entry(filters, textvariable=self.driver_filter, width=9).pack(side="left", padx=(4, 10))
+        ttk.Label(filters, text="from").pack(side="left")
+        ttk.Entry(filters, textvariable=self.from_filter, width=11).pack(side="left", padx=(4, 10))
+        ttk.Label(filters, text="to").pack(side="left")
+        ttk.Entry(filters, textvariable=self.to_filter, width=11).pack(side="left", padx=(4, 10))
+        ttk.Label(filters, text="label").pack(side="left")
+        ttk.Combobox(filters, textvariable=self.label_filter, state="readonly", width=13,
+                     values=list(LABEL_CHOICES)).pack(side="left", padx=(4, 10))
+        ttk.Button(filters, text="Apply", command=self._apply_filters).pack(side="left")
+        ttk.Button(filters, text="Clear", command=self._clear_filters).pack(side="left", padx=(6, 0))
+        for child in filters.winfo_children():
+            if isinstance(child, ttk.Entry):
+                child.bind("<Return>", lambda _e: self._apply_filters())
+
+        # only VISIBLE_ROWS items exist; scrolling rewrites their values from the page cache
+        self.table = ttk.Treeview(self.recent_card, columns=[c[0] for c in _COLUMNS], show="headings",
+                                  height=VISIBLE_ROWS, selectmode="browse")
+        for cid, heading, width, _fmt in _COLUMNS:
+            self.table.heading(cid, text=heading)
+            self.table.column(cid, width=width, anchor="w", stretch=cid == "created_at")
+        self._items = [self.table.insert("", "end", values=()) for _ in range(VISIBLE_ROWS)]
+        self.table.grid(row=1, column=0, sticky="nsew")
+
+        self.scroll = ttk.Scrollbar(self.recent_card, orient="vertical", command=self._on_scrollbar)
+        self.scroll.grid(row=1, column=1, sticky="ns")
+
+        self.page_label = ttk.Label(self.recent_card, text="", style="Hint.TLabel")
+        self.page_label.grid(row=2, column=0, columnspan=2, sticky="w", pady=(6, 0))
+
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.table.bind(seq, self._on_wheel)
+        self.table.bind("<Up>", lambda _e: self._scroll_to(self._offset - 1))
+        self.table.bind("<Down>", lambda _e: self._scroll_to(self._offset + 1))
+        self.table.bind("<Prior>", lambda _e: self._scroll_to(self._offset - VISIBLE_ROWS))
+        self.table.bind("<Next>", lambda _e: self._scroll_to(self._offset + VISIBLE_ROWS))
+        self.table.bind("<Home>", lambda _e: self._scroll_to(0))
 
         self.top_card = ttk.LabelFrame(grid, text="Top Drivers (by dangerous_rate)", padding=10)
         self.top_card.grid(row=0, column=1, sticky="nsew", padx=(8, 0))
 
-        self.recent_box = tk.Text(self.recent_card, height=16, wrap="none")
-        self.recent_box.pack(fill="both", expand=True)
-
-        self.top_box = tk.Text(self.top_card, height=16, wrap="none")
+        self.top_box = tk.Text(self.top_card, height=16, width=40, wrap="none")
         self.top_box.pack(fill="both", expand=True)
 
         self.grid_columnconfigure(0, weight=1)
@@ -59,17 +211,8 @@ class HistoryFrame(ttk.Frame):
             )
         )
 
-        # recent predictions
-        recent = fetch_recent_predictions(limit=12)
-        self.recent_box.delete("1.0", "end")
-        if not recent:
-            self.recent_box.insert("end", "No history yet.\n\nRun Batch Prediction to generate results.\n")
-        else:
-            for created_at, bid, did, proba, label, thr in recent:
-                self.recent_box.insert(
-                    "end",
-                    f"{created_at} | bookingID={bid} | driver={did} | p={proba:.3f} | pred={label} | thr={thr:.2f}\n"
-                )
+        # predictions: new rows may have arrived, start over from the newest
+        self._reset_pages(self._pages.filters)
 
         # top drivers
         top = fetch_top_drivers(limit=10)
@@ -78,7 +221,169 @@ class HistoryFrame(ttk.Frame):
             self.top_box.insert("end", "No driver history yet.\n\nRun Batch Prediction to populate driver history.\n")
         else:
             for did, total, dang, rate, avg_harsh, last_updated in top:
+                harsh = "n/a" if avg_harsh is None else f"{avg_harsh:.2f}"
                 self.top_box.insert(
                     "end",
-                    f"driver={did} | trips={total} | dangerous={dang} | rate={rate:.2f} | avg_harsh={avg_harsh:.2f}\n"
+                    f"driver={did} | trips={total} | dangerous={dang} | rate={rate:.2f} | avg_harsh={harsh}\n"
                 )
+
+    # ---------------- filters ----------------
+
+    def _read_filters(self):
+        """
+        filter entries -> fetch_prediction_page filters; raises ValueError with a readable message
+        """
+        filters = {}
+        driver = self.driver_filter.get().strip()
+        if driver:
+            try:
+                filters["driver_id"] = int(driver)
+            except ValueError:
+                raise ValueError(f"driver_id must be a whole number, got {driver!r}") from None
+        for var, key, shift in ((self.from_filter, "created_from", 0), (self.to_filter, "created_before", 1)):
+            text = var.get().strip()
+            if text:
+                try:
+                    day = date.fromisoformat(text)
+                except ValueError:
+                    raise ValueError(f"dates are YYYY-MM-DD, got {text!r}") from None
+                # "to" includes the whole day
+                filters[key] = (day + timedelta(days=shift)).isoformat()
+        label = LABEL_CHOICES.get(self.label_filter.get())
+        if label is not None:
+            filters["label"] = label
+        return filters
+
+    def _apply_filters(self):
+        try:
+            filters = self._read_filters()
+        except ValueError as e:
+            messagebox.showerror("History filter", str(e))
+            return
+        self._reset_pages(filters)
+
+    def _clear_filters(self):
+        for var in (self.driver_filter, self.from_filter, self.to_filter):
+            var.set("")
+        self.label_filter.set("any")
+        self._reset_pages({})
+
+    # ---------------- paging ----------------
+
+    def _reset_pages(self, filters):
+        self._pages = PredictionPages(filters)
+        self._pending.clear()
+        self._offset = 0
+        # a filtered count can take a while on a large history, it gets its own thread so pages don't wait
+        threading.Thread(target=self._count, args=(self._pages,), name="gobest-history-count", daemon=True).start()
+        self._render()
+
+    def _work(self):
+        """
+        worker thread: loads requested pages, hands them back through self._loaded
+        """
+        while True:
+            pages, k = self._requests.get()
+            if pages is not self._pages:
+                continue   # filters changed since the request
+            try:
+                pages.load(k)
+                self._loaded.put((pages, k, None))
+            except Exception as e:
+                self._loaded.put((pages, k, e))
+
+    def _count(self, pages):
+        try:
+            pages.count()
+            self._loaded.put((pages, "count", None))
+        except Exception as e:
+            self._loaded.put((pages, "count", e))
+
+    def _request(self, k):
+        if k < 0 or (self._pages.pages is not None and k >= self._pages.pages):
+            return
+        if k in self._pending or self._pages.cached(k) is not None:
+            return
+        self._pending.add(k)
+        self._requests.put((self._pages, k))
+
+    def _poll(self):
+        changed = False
+        while True:
+            try:
+                pages, what, error = self._loaded.get_nowait()
+            except queue.Empty:
+                break
+            if pages is not self._pages:
+                continue   # filters changed meanwhile
+            self._pending.discard(what)
+            if error is not None:
+                self.page_label.config(text=f"Could not read history: {error}")
+                continue
+            changed = True
+        if changed:
+            self._render()
+        self.after(POLL_MS, self._poll)
+
+    def _scroll_to(self, offset):
+        known = self._pages.known_rows()
+        self._offset = max(0, min(int(offset), max(known - VISIBLE_ROWS, 0)))
+        self._render()
+        return "break"
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            return self._scroll_to(self._offset - SCROLL_ROWS)
+        return self._scroll_to(self._offset + SCROLL_ROWS)
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(value) * self._pages.known_rows())
+        elif action == "scroll":
+            step = VISIBLE_ROWS if unit == "pages" else 1
+            self._scroll_to(self._offset + int(value) * step)
+
+    def _render(self):
+        """
+        fills the fixed table items from the cached pages; missing pages are requested and
+        shown as placeholders, and the pages on either side of the view are prefetched
+        """
+        pages = self._pages
+        first_page = self._offset // pages.page_rows
+        last_page = (self._offset + VISIBLE_ROWS - 1) // pages.page_rows
+        loading = False
+        shown = 0
+        for i, item in enumerate(self._items):
+            r = self._offset + i
+            rows = pages.cached(r // pages.page_rows)
+            if rows is None:
+                self._request(r // pages.page_rows)
+                loading = True
+                self.table.item(item, values=("…",))
+            elif r % pages.page_rows < len(rows):
+                row = rows[r % pages.page_rows]
+                self.table.item(item, values=[fmt(row[j]) for (_c, _h, _w, fmt), j in zip(_COLUMNS, _ROW_INDEX)])
+                shown += 1
+            else:
+                self.table.item(item, values=())
+        # the next / previous pages load while the current ones are read
+        self._request(last_page + 1)
+        self._request(first_page - 1)
+
+        total = pages.known_rows()
+        if total:
+            self.scroll.set(self._offset / total, min((self._offset + VISIBLE_ROWS) / total, 1.0))
+        else:
+            self.scroll.set(0.0, 1.0)
+
+        if pages.total is not None:
+            of = f"of {pages.total:,}"
+        else:
+            of = "of …"
+        if shown:
+            text = f"rows {self._offset + 1:,}–{self._offset + shown:,} {of}"
+        elif loading:
+            text = "loading…"
+        else:
+            text = "No predictions match." if pages.filters else "No history yet. Run Batch Prediction to generate results."
+        self.page_label.config(text=text + ("  (loading…)" if loading and shown else ""))
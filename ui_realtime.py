@@ -1,7 +1,21 @@
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
 
+import numpy as np
+
 from .db import fetch_driver_history
+from .explain import explain_trip, top_features
+from .online_features import UPDATE_FIELDS, TripAccumulator
+
+# live replay: readings folded in per tick, and the tick interval (ms)
+REPLAY_STEP = 10
+REPLAY_MS = 100
+# bookingIDs offered by the Combobox for the typed prefix
+TYPEAHEAD_ROWS = 200
+# how often Tk checks for the contributions computed off the Tk thread (ms)
+EXPLAIN_POLL_MS = 50
 
 
 class RealtimeFrame(ttk.Frame):
@@ -12,6 +26,14 @@ class RealtimeFrame(ttk.Frame):
         self.booking_choice = tk.StringVar()
         self.threshold = tk.DoubleVar(value=0.50)
 
+        # (token, accumulator, readings, next index) of the running replay
+        self._replay = None
+        # prediction row currently shown by show_result, re-rendered when the slider moves
+        self._shown = None
+        self._replay_token = 0
+        # bumped per shown trip; a background explanation of an older selection is dropped
+        self._explain_token = 0
+
         self._build()
 
     def _build(self):
@@ -34,8 +56,13 @@ class RealtimeFrame(ttk.Frame):
         sel.columnconfigure(1, weight=1)
 
         ttk.Label(sel, text="bookingID:").grid(row=0, column=0, sticky="w", padx=(0, 10))
-        self.combo = ttk.Combobox(sel, textvariable=self.booking_choice, state="readonly", values=[])
+        self.combo = ttk.Combobox(sel, textvariable=self.booking_choice, values=[])
         self.combo.grid(row=0, column=1, sticky="ew")
+        # type-ahead: the dropdown lists the first matches of what has been typed so far
+        self.combo.bind("<KeyRelease>", self._on_type)
+        self.combo.bind("<Return>", lambda _e: self.show_result())
+        self.match_label = ttk.Label(sel, text="", style="Hint.TLabel")
+        self.match_label.grid(row=1, column=1, sticky="w", pady=(4, 0))
         ttk.Button(sel, text="Refresh list", command=self.refresh_booking_list).grid(row=0, column=2, padx=(10, 0))
 
         # threshold card
@@ -67,6 +94,8 @@ class RealtimeFrame(ttk.Frame):
         act.grid(row=4, column=0, sticky="ew", pady=(12, 0))
 
         ttk.Button(act, text="Show Result", command=self.show_result).grid(row=0, column=0, sticky="w")
+        ttk.Button(act, text="Replay trip live", command=self.start_replay).grid(row=0, column=1, sticky="w", padx=(10, 0))
+        ttk.Button(act, text="Stop", command=self.stop_replay).grid(row=0, column=2, sticky="w", padx=(6, 0))
 
         # result + history area
         grid = ttk.Frame(self)
@@ -99,60 +128,247 @@ class RealtimeFrame(ttk.Frame):
         self.history_text.insert("end", "No history yet.\n\nRun Batch Prediction to populate stored driver history.\n")
 
     def _on_thresh_change(self, *_):
-        self.thr_label.config(text=f"Current threshold: {float(self.threshold.get()):.2f}")
+        thr = float(self.threshold.get())
+        self.thr_label.config(text=f"Current threshold: {thr:.2f}")
+        if self._shown is not None and self._replay is None:
+            self._render_result(*self._shown)
 
     def refresh_booking_list(self):
-        if self.app.preds is None or len(self.app.preds) == 0:
+        store = self.app.pred_store
+        if store is None or len(store) == 0:
             self.combo["values"] = []
             self.booking_choice.set("")
+            self.match_label.config(text="")
             self._placeholder_state()
             return
 
-        bids = sorted(self.app.preds["bookingID"].astype(str).unique().tolist())
-        self.combo["values"] = bids
-        if bids and (self.booking_choice.get() not in bids):
-            self.booking_choice.set(bids[0])
+        if self.booking_choice.get() not in store:
+            self.booking_choice.set(store.search("", 1)[0])
+        self._show_matches("")
+
+    def _show_matches(self, prefix):
+        store = self.app.pred_store
+        self.combo["values"] = store.search(prefix, TYPEAHEAD_ROWS)
+        matches = store.count_matches(prefix)
+        shown = min(matches, TYPEAHEAD_ROWS)
+        self.match_label.config(
+            text=f"{matches:,} bookingIDs" + (f" start with '{prefix}'" if prefix else "")
+            + (f" (first {shown:,} listed, keep typing to narrow)" if shown < matches else "")
+        )
 
-    def show_result(self):
-        if self.app.preds is None or len(self.app.preds) == 0:
-            messagebox.showwarning("No data", "Run Batch Prediction first.")
+    def _on_type(self, event):
+        if self.app.pred_store is None or event.keysym in ("Up", "Down", "Return", "Escape"):
             return
+        self._show_matches(self.booking_choice.get().strip())
 
+    def start_replay(self):
+        """
+        feeds the selected trip's sensor readings one by one through a TripAccumulator,
+        showing the features / risk the model would give at that point of the trip
+
+        the live risk is always the xgboost model's (TripAccumulator.risk): the sequence scorer needs the
+        whole reading history, so after a sequence-scored batch the replay is labelled as xgboost-only
+        """
         bid = self.booking_choice.get().strip()
         if not bid:
             messagebox.showwarning("No selection", "Please choose a bookingID first.")
             return
-
-        df = self.app.preds.copy()
-        row = df[df["bookingID"].astype(str) == bid]
-        if row.empty:
+        if not bid.isdigit():
             messagebox.showerror("Not found", f"bookingID {bid} not found.")
             return
-        row = row.iloc[0]
 
-        proba = float(row["pred_proba"])
+        sensor_df = self.app.sensor_df
+        if sensor_df is None:
+            messagebox.showinfo(
+                "No sensor data",
+                "Live replay needs the sensor table from the last batch.\n"
+                "Run Batch Prediction with 'Cache parsed CSVs' enabled.",
+            )
+            return
+
+        # the cached sensor table is sorted by (bookingID, second)
+        keys = sensor_df["bookingID"].to_numpy()
+        lo, hi = np.searchsorted(keys, int(bid), side="left"), np.searchsorted(keys, int(bid), side="right")
+        if hi <= lo:
+            messagebox.showerror("Not found", f"no sensor readings for bookingID {bid}.")
+            return
+        readings = sensor_df.iloc[lo:hi][UPDATE_FIELDS].to_numpy(dtype=np.float64)
+
+        self._shown = None
+        self._replay_token += 1
+        found = self.app.pred_store.get(bid) if self.app.pred_store is not None else None
+        acc = TripAccumulator(int(bid), driver_id=found[1] if found else -1)
+        self._replay = (self._replay_token, acc, readings, 0)
+        self.after(0, self._replay_tick, self._replay_token)
+
+    def stop_replay(self):
+        self._replay = None
+        self._shown = None
+
+    def _replay_tick(self, token):
+        if self._replay is None or self._replay[0] != token:
+            return
+        _, acc, readings, i = self._replay
+
+        for values in readings[i:i + REPLAY_STEP]:
+            acc.update(*values)
+        i = min(i + REPLAY_STEP, len(readings))
+
+        try:
+            proba = acc.risk()
+        except Exception as e:
+            self._replay = None
+            messagebox.showerror("Live scoring failed", str(e))
+            return
+
+        self._show_live(acc, proba, i, len(readings))
+        if i < len(readings):
+            self._replay = (token, acc, readings, i)
+            self.after(REPLAY_MS, self._replay_tick, token)
+        else:
+            self._replay = None
+
+    def _show_live(self, acc, proba, done, total):
+        f = acc.features()
+        thr = float(self.threshold.get())
+        label = "DANGEROUS" if proba >= thr else "SAFE"
+        # the replay scores with the xgboost runtime whatever model scored the batch
+        model_note = ""
+        if self.app.preds_scorer not in (None, "xgboost"):
+            model_note = (f"xgboost model only: the batch was scored by the {self.app.preds_scorer} model, "
+                          "its stored prediction can differ\n")
+
+        self.result_text.delete("1.0", "end")
+        self.result_text.insert(
+            "end",
+            (
+                f"bookingID: {acc.booking_id} (live replay)\n"
+                f"readings: {done}/{total}   trip time: {f['trip_duration_sec']:.0f}s\n\n"
+                f"current probability (dangerous): {proba:.3f}\n"
+                f"{model_note}"
+                f"threshold: {thr:.2f} → {label}\n\n"
+                f"harsh accelerations: {f['harsh_acceleration_count']}\n"
+                f"harsh braking: {f['harsh_braking_count']}\n"
+                f"sharp turns: {f['sharp_turn_count']}\n"
+                f"speeding events: {f['speeding_event_count']}\n"
+                f"distance so far: {f['total_distance_km']:.2f} km\n"
+                + ("\nTrip complete: features now equal the batch features.\n" if done == total else "")
+            )
+        )
+
+    def _explain(self, booking_id, row):
+        """
+        'top drivers of risk' lines of one trip, without blocking Tk: explain_trip (cache lookup, else a
+        booster call + a write through the db writer thread) runs on a worker thread and the panel is
+        re-rendered by _poll_explanation; returns the placeholder shown until then
+        """
+        self._explain_token += 1
+        if self.app.preds_scorer not in (None, "xgboost"):
+            # contributions are TreeSHAP values of the xgboost model, they don't explain another scorer's score
+            return f"Top drivers of risk: only available for the xgboost model (batch scored by {self.app.preds_scorer})\n\n"
+
+        # Tk-side copies: the worker never touches app state, which the next batch replaces
+        features = self.app.preds.iloc[[row]].copy()
+        backend = self.app.preds_backend
+        result = queue.Queue(maxsize=1)
+
+        def work():
+            try:
+                # the batch's backend: its runtime version is the key explain_batch cached the contributions under
+                result.put((explain_trip(booking_id, features, backend=backend), None))
+            except Exception as e:
+                result.put((None, e))
+
+        threading.Thread(target=work, daemon=True).start()
+        self.after(EXPLAIN_POLL_MS, self._poll_explanation, self._explain_token, features, result)
+        return "Top drivers of risk: not cached yet, computing…\n\n"
+
+    def _poll_explanation(self, token, features, result):
+        if token != self._explain_token:
+            return
+        try:
+            found, error = result.get_nowait()
+        except queue.Empty:
+            self.after(EXPLAIN_POLL_MS, self._poll_explanation, token, features, result)
+            return
+        if self._shown is None:
+            # a replay took over the panel
+            return
+        self._shown = self._shown[:3] + (self._explanation_text(found, error, features.iloc[0]),)
+        self._render_result(*self._shown)
+
+    def _explanation_text(self, found, error, features):
+        """
+        the explain_trip outcome as text; features is the trip's batch row
+        """
+        if error is not None:
+            return f"Top drivers of risk: not available ({error})\n\n"
+        if found is None:
+            return ""
+        feature_cols, contributions = found
+        lines = ["Top drivers of risk (log-odds, + pushes towards DANGEROUS):"]
+        for name, value in top_features(feature_cols, contributions):
+            shown = features.get(name)
+            shown = "" if shown is None else f" = {float(shown):.3g}"
+            lines.append(f"  {value:+.3f}  {name}{shown}")
+        return "\n".join(lines) + "\n\n"
+
+    def _render_result(self, bid, driver_id, proba, explanation=""):
         thr = float(self.threshold.get())
         pred = int(proba >= thr)
         label = "DANGEROUS" if pred == 1 else "SAFE"
 
+        # where this trip / driver stands in the loaded batch at the same threshold (score index, no model call)
+        context = ""
+        index = self.app.score_index
+        if index is not None:
+            dangerous, trips = index.driver_count(driver_id, thr)
+            context = (
+                f"batch at this threshold: {index.count_at(thr):,}/{index.n:,} trips dangerous\n"
+                f"this driver in the batch: {dangerous}/{trips} trips dangerous\n\n"
+            )
+
         # prediction explanation
         self.result_text.delete("1.0", "end")
         self.result_text.insert(
             "end",
             (
                 f"bookingID: {bid}\n"
-                f"driver_id: {int(row['driver_id'])}\n\n"
+                f"driver_id: {driver_id}\n\n"
                 f"predicted probability (dangerous): {proba:.3f}\n"
                 f"threshold: {thr:.2f}\n"
                 f"decision: probability ≥ threshold → {label}\n\n"
+                + context + explanation +
                 "Interpretation:\n"
                 "- Higher probability means the trip’s engineered behaviour features resemble dangerous trips.\n"
                 "- Threshold controls strictness: lower threshold = more sensitive; higher threshold = more conservative.\n"
             )
         )
 
+    def show_result(self):
+        self.stop_replay()
+        store = self.app.pred_store
+        if store is None or len(store) == 0:
+            messagebox.showwarning("No data", "Run Batch Prediction first.")
+            return
+
+        bid = self.booking_choice.get().strip()
+        if not bid:
+            messagebox.showwarning("No selection", "Please choose a bookingID first.")
+            return
+
+        # hash lookup in the batch's prediction store, no scan / copy of app.preds
+        found = store.get(bid)
+        if found is None:
+            messagebox.showerror("Not found", f"bookingID {bid} not found.")
+            return
+        booking_id, driver_id, proba = found
+
+        self._shown = (str(booking_id), driver_id, proba, self._explain(booking_id, store.row_of(booking_id)))
+        self._render_result(*self._shown)
+
         # driver history
-        hist = fetch_driver_history(int(row["driver_id"]))
+        hist = fetch_driver_history(driver_id)
         self.history_text.delete("1.0", "end")
 
         if not hist:
@@ -168,14 +384,16 @@ class RealtimeFrame(ttk.Frame):
             )
         else:
             total_trips, dangerous_trips, dangerous_rate, avg_harsh, last_updated = hist
+            # NULL until a stored trip of this driver carried harsh_acceleration_count
+            harsh = "n/a" if avg_harsh is None else f"{float(avg_harsh):.2f}"
             self.history_text.insert(
                 "end",
                 (
-                    f"driver_id: {int(row['driver_id'])}\n"
+                    f"driver_id: {driver_id}\n"
                     f"total trips stored: {int(total_trips)}\n"
                     f"dangerous trips stored: {int(dangerous_trips)}\n"
                     f"dangerous rate: {float(dangerous_rate):.2f}\n"
-                    f"avg harsh acceleration: {float(avg_harsh):.2f}\n"
+                    f"avg harsh acceleration: {harsh}\n"
                     f"last updated: {last_updated}\n\n"
                     "Note:\n"
                     "This history is derived from predictions made by this GUI over time (persistent across runs).\n"